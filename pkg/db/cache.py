@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+压缩缓存：本地磁盘 / Redis 两种后端，支持 TTL 与按容量的 LRU 淘汰
+
+缓存值统一序列化为 zlib 压缩后的紧凑 JSON（二进制），
+适合缓存船舶轨迹这类体积较大、按天分桶的列表数据。
+"""
+import os
+import json
+import time
+import zlib
+import struct
+import hashlib
+import logging
+import threading
+import redis
+
+
+def encode_value(value, level=6):
+    """python 对象 -> 压缩后的二进制"""
+    payload = json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str)
+    return zlib.compress(payload.encode('utf-8'), level)
+
+
+def decode_value(data):
+    """压缩后的二进制 -> python 对象"""
+    return json.loads(zlib.decompress(data).decode('utf-8'))
+
+
+class DiskCache:
+    """
+    本地磁盘缓存
+    文件格式：8 字节过期时间戳（double）+ 压缩数据；文件 mtime 作为最近访问时间用于 LRU 淘汰
+    """
+    HEADER = struct.Struct('<d')
+
+    def __init__(self, cache_dir, ttl_seconds=7 * 24 * 3600, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, _, size in self._scan())
+
+    def _path(self, key):
+        digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + '.bin')
+
+    def _scan(self):
+        """遍历缓存文件 -> (path, mtime, size)"""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.bin'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_mtime, st.st_size
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            with self._lock:
+                self._total_bytes -= size
+        except OSError:
+            pass
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < self.HEADER.size:
+            self._remove(path)
+            return None
+        expire_at, = self.HEADER.unpack_from(data)
+        if expire_at < time.time():
+            self._remove(path)
+            return None
+        try:
+            os.utime(path, None)  # 刷新访问时间
+        except OSError:
+            pass
+        return data[self.HEADER.size:]
+
+    def set(self, key, value, ttl_seconds=None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self.HEADER.pack(time.time() + ttl))
+            f.write(value)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._total_bytes += self.HEADER.size + len(value) - old_size
+            need_evict = self.max_bytes and self._total_bytes > self.max_bytes
+        if need_evict:
+            self.evict()
+
+    def evict(self):
+        """删除过期文件，并按最近访问时间淘汰到容量的 90% 以下"""
+        now = time.time()
+        entries = []
+        for path, mtime, size in self._scan():
+            try:
+                with open(path, 'rb') as f:
+                    header = f.read(self.HEADER.size)
+                expire_at, = self.HEADER.unpack(header)
+            except (OSError, struct.error):
+                expire_at = 0
+            if expire_at < now:
+                self._remove(path)
+            else:
+                entries.append((mtime, path, size))
+
+        with self._lock:
+            self._total_bytes = sum(size for _, _, size in entries)
+        target = int(self.max_bytes * 0.9)
+        entries.sort()
+        removed = 0
+        for _, path, _ in entries:
+            if self._total_bytes <= target:
+                break
+            self._remove(path)
+            removed += 1
+        if removed:
+            logging.info(f'DiskCache 淘汰 {removed} 个缓存文件，当前占用 {self._total_bytes} 字节')
+
+
+class RedisCache:
+    """
+    Redis 缓存
+    每个 key 自带 TTL；另用 zset 记录最近访问时间、计数器记录总字节数，超出容量时淘汰最久未访问的 key
+    """
+
+    def __init__(self, rds, prefix, ttl_seconds=7 * 24 * 3600, max_bytes=256 * 1024 * 1024):
+        self.rds = rds
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.lru_key = f"{prefix}:__lru__"
+        self.size_key = f"{prefix}:__size__"
+        self.bytes_key = f"{prefix}:__bytes__"
+
+    def _key(self, key):
+        return f"{self.prefix}:{key}"
+
+    def get(self, key):
+        full_key = self._key(key)
+        value = self.rds.get(full_key)
+        if value is not None:
+            self.rds.zadd(self.lru_key, {full_key: time.time()})
+        return value
+
+    def set(self, key, value, ttl_seconds=None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        full_key = self._key(key)
+        old_size = self.rds.hget(self.size_key, full_key)
+        pipe = self.rds.pipeline()
+        pipe.set(full_key, value, ex=int(ttl))
+        pipe.zadd(self.lru_key, {full_key: time.time()})
+        pipe.hset(self.size_key, full_key, len(value))
+        pipe.incrby(self.bytes_key, len(value) - int(old_size or 0))
+        total = pipe.execute()[-1]
+        if self.max_bytes and total > self.max_bytes:
+            self.evict()
+
+    def evict(self, batch=100):
+        """按最近访问时间淘汰到容量的 90% 以下（已因 TTL 过期的 key 同时从索引中清理）"""
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        total = int(self.rds.get(self.bytes_key) or 0)
+        while total > target:
+            oldest = self.rds.zrange(self.lru_key, 0, batch - 1)
+            if not oldest:
+                self.rds.set(self.bytes_key, 0)
+                break
+            sizes = self.rds.hmget(self.size_key, oldest)
+            freed = sum(int(s or 0) for s in sizes)
+            pipe = self.rds.pipeline()
+            pipe.delete(*oldest)
+            pipe.zrem(self.lru_key, *oldest)
+            pipe.hdel(self.size_key, *oldest)
+            pipe.decrby(self.bytes_key, freed)
+            total = pipe.execute()[-1]
+            removed += len(oldest)
+        if removed:
+            logging.info(f'RedisCache[{self.prefix}] 淘汰 {removed} 个 key，当前占用 {total} 字节')
+
+
+def get_cache_backend(name):
+    """
+    根据环境变量创建缓存后端，未启用时返回 None
+    {NAME}_CACHE=disk|redis, {NAME}_CACHE_DIR, {NAME}_CACHE_TTL_HOURS, {NAME}_CACHE_MAX_MB
+    Redis 使用 CACHE_REDIS_* 连接（二进制模式）
+    """
+    env_prefix = name.upper()
+    backend = os.getenv(f'{env_prefix}_CACHE', '').strip().lower()
+    if not backend:
+        return None
+    ttl_seconds = int(float(os.getenv(f'{env_prefix}_CACHE_TTL_HOURS', '168')) * 3600)
+    max_bytes = int(float(os.getenv(f'{env_prefix}_CACHE_MAX_MB', '512')) * 1024 * 1024)
+    try:
+        if backend == 'disk':
+            cache_dir = os.getenv(f'{env_prefix}_CACHE_DIR', f'./cache/{name.lower()}')
+            return DiskCache(cache_dir, ttl_seconds, max_bytes)
+        if backend == 'redis':
+            rds = redis.Redis(host=os.getenv('CACHE_REDIS_HOST', '127.0.0.1'),
+                              port=int(os.getenv('CACHE_REDIS_PORT', '6379')),
+                              password=os.getenv('CACHE_REDIS_PASSWORD', None),
+                              db=0, decode_responses=False, health_check_interval=30)
+            return RedisCache(rds, f"cache:{name.lower()}", ttl_seconds, max_bytes)
+    except Exception as e:
+        logging.error(f'初始化 {name} 缓存失败: {e}')
+        return None
+    logging.warning(f'未知的缓存后端: {backend}')
+    return None
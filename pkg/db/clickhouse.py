@@ -35,17 +35,18 @@ class ClickHouseClient:
             print(f"Error connecting to ClickHouse: {e}")
             raise
 
-    def query(self, sql):
+    def query(self, sql, columnar=False):
         """执行 SQL 查询
 
         Args:
             sql (str): SQL 查询语句
+            columnar (bool): 为 True 时按列返回结果（大批量导出时更省内存）
 
         Returns:
             list: 查询结果
         """
         try:
-            return self.client.execute(sql)
+            return self.client.execute(sql, columnar=columnar)
         except Exception as e:
             print(f"Error executing query: {e}")
             raise
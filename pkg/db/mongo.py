@@ -210,3 +210,73 @@ class MgoStore(object):
 
     def close(self):
         self.mgo_client.close()
+
+
+class MgoBulkWriter(object):
+    """
+    按集合累积写操作，达到批量大小后以无序 bulk_write 提交
+    每个集合单独统计批次数、成功数与失败数，单批失败不影响后续批次
+    """
+
+    def __init__(self, mgo_db, batch_size=500):
+        self.mgo_db = mgo_db
+        self.batch_size = batch_size
+        self.pending = {}
+        self.stats = {}
+
+    def _collection_stats(self, collection):
+        if collection not in self.stats:
+            self.stats[collection] = {
+                'batches': 0,
+                'failed_batches': 0,
+                'ops': 0,
+                'matched': 0,
+                'modified': 0,
+                'upserted': 0,
+                'inserted': 0,
+                'write_errors': 0,
+            }
+        return self.stats[collection]
+
+    def add(self, collection, op):
+        ops = self.pending.setdefault(collection, [])
+        ops.append(op)
+        if len(ops) >= self.batch_size:
+            self.flush(collection)
+
+    def flush(self, collection=None):
+        collections = [collection] if collection else list(self.pending.keys())
+        for name in collections:
+            ops = self.pending.get(name)
+            if not ops:
+                continue
+            self.pending[name] = []
+            self._write(name, ops)
+
+    def _write(self, collection, ops):
+        stats = self._collection_stats(collection)
+        stats['batches'] += 1
+        stats['ops'] += len(ops)
+        try:
+            res = self.mgo_db[collection].bulk_write(ops, ordered=False)
+            details = res.bulk_api_result
+        except pymongo.errors.BulkWriteError as e:
+            details = e.details or {}
+            write_errors = details.get('writeErrors', [])
+            stats['write_errors'] += len(write_errors)
+            for err in write_errors[:3]:
+                logging.error('bulk_write {} 写入失败: {}'.format(collection, err.get('errmsg')))
+        except Exception as e:
+            stats['failed_batches'] += 1
+            stats['write_errors'] += len(ops)
+            logging.error('bulk_write {} 批次失败({}条): {}'.format(collection, len(ops), e))
+            return
+        stats['matched'] += details.get('nMatched', 0)
+        stats['modified'] += details.get('nModified', 0)
+        stats['upserted'] += details.get('nUpserted', 0)
+        stats['inserted'] += details.get('nInserted', 0)
+
+    def close(self):
+        self.flush()
+        return self.stats
+
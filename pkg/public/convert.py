@@ -1,68 +1,121 @@
 import math
+from dataclasses import dataclass
+
+import numpy as np
 
 MFWAMHistoryStep = 1.0 / 12.0  # 等价于 Go 里的 float32(1. / 12.)
 
 
-def convert_mfwam_point(lat: float, lon: float) -> "tuple[int, int]":
-    """latitude: -80~90 longitude: -180~180 1 / 12"""
-    lat_index = round((lat + 80.0) / MFWAMHistoryStep)
-    lon_index = round((lon + 180.0) / MFWAMHistoryStep)
+@dataclass(frozen=True)
+class GridDescriptor:
+    """
+    规则经纬度网格描述
+    lat_descending: 纬度索引从北往南（90~-90）；否则从 lat_origin 往北
+    lon_0_360: 经度按 0~360 计算索引；否则按 -180~180
+    lon_size: 经度方向格点数，索引等于 lon_size 时回绕为 0
+    取整规则与 python round() 一致（四舍六入五成双），标量和数组版本结果完全相同
+    """
+    lat_origin: float
+    step: float
+    lon_size: int
+    lat_descending: bool = False
+    lon_0_360: bool = False
 
-    if lon_index == 4320:
-        lon_index = 0
+    def point(self, lat: float, lon: float) -> "tuple[int, int]":
+        """单点 -> (lat_index, lon_index)"""
+        if self.lat_descending:
+            lat_index = round((self.lat_origin - lat) / self.step)
+        else:
+            lat_index = round((lat - self.lat_origin) / self.step)
+        if not self.lon_0_360:
+            lon_index = round((lon + 180.0) / self.step)
+        elif lon >= 0:
+            lon_index = round(lon / self.step)
+        else:
+            lon_index = round((360.0 + lon) / self.step)
+        if lon_index == self.lon_size:
+            lon_index = 0
+        return int(lat_index), int(lon_index)
 
-    return int(lat_index), int(lon_index)
+    def indices(self, lat, lon) -> "tuple[np.ndarray, np.ndarray]":
+        """lat/lon 数组 -> (lat_index 数组, lon_index 数组)，np.rint 与 round() 同为银行家舍入"""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        if self.lat_descending:
+            lat_index = np.rint((self.lat_origin - lat) / self.step)
+        else:
+            lat_index = np.rint((lat - self.lat_origin) / self.step)
+        if not self.lon_0_360:
+            lon_index = np.rint((lon + 180.0) / self.step)
+        else:
+            lon_index = np.rint(np.where(lon >= 0, lon, 360.0 + lon) / self.step)
+        lon_index[lon_index == self.lon_size] = 0
+        return lat_index.astype(np.int64), lon_index.astype(np.int64)
+
+
+# latitude: -80~90 longitude: -180~180 1 / 12
+MFWAM_GRID = GridDescriptor(lat_origin=-80.0, step=MFWAMHistoryStep, lon_size=4320)
+# latitude: -90~90 longitude: -180~180 0.25
+EC_GRID = GridDescriptor(lat_origin=-90.0, step=0.25, lon_size=1440)
+# latitude: -80~90 longitude: -180~180 1/12
+SMOC_GRID = GridDescriptor(lat_origin=-80.0, step=1.0 / 12.0, lon_size=4320)
+# latitude: 90~-90, longitude: 0~360, 0.25
+ERA5_WIND_GRID = GridDescriptor(lat_origin=90.0, step=0.25, lon_size=1440, lat_descending=True, lon_0_360=True)
+# latitude: 90~-90, longitude: 0~360, 0.5
+ERA5_WAVE_GRID = GridDescriptor(lat_origin=90.0, step=0.5, lon_size=720, lat_descending=True, lon_0_360=True)
+# latitude: -80~90, longitude: -180~180, 1/12
+ERA5_FLOW_GRID = GridDescriptor(lat_origin=-80.0, step=1.0 / 12.0, lon_size=4320)
+
+
+def convert_mfwam_point(lat: float, lon: float) -> "tuple[int, int]":
+    """latitude: -80~90 longitude: -180~180 1 / 12"""
+    return MFWAM_GRID.point(lat, lon)
 
 
 def convert_ec_point(lat: float, lon: float) -> "tuple[int, int]":
     """latitude: -90~90 longitude: -180~180 0.25"""
-    ECHistoryStep = 0.25
-    lat_index = round((lat + 90.0) / ECHistoryStep)
-    lon_index = round((lon + 180.0) / ECHistoryStep)
-    if lon_index == 1440:
-        lon_index = 0
-    return int(lat_index), int(lon_index)
+    return EC_GRID.point(lat, lon)
 
 
 def convert_smoc_point(lat: float, lon: float) -> "tuple[int, int]":
     """latitude: -80~90 longitude: -180~180 1/12"""
-    SMOCHistoryStep = 1.0 / 12.0
-    lat_index = round((lat + 80.0) / SMOCHistoryStep)
-    lon_index = round((lon + 180.0) / SMOCHistoryStep)
-    if lon_index == 4320:
-        lon_index = 0
-    return int(lat_index), int(lon_index)
+    return SMOC_GRID.point(lat, lon)
 
 
 def convert_era5_wind_point(lat: float, lon: float) -> "tuple[int, int]":
     """latitude: 90~-90, longitude: 0~360, 0.25"""
-    lat_index = round((90.0 - lat) / 0.25)
-    if lon >= 0:
-        lon_index = round(lon / 0.25)
-    else:
-        lon_index = round((360.0 + lon) / 0.25)
-    if lon_index == 1440:
-        lon_index = 0
-    return int(lat_index), int(lon_index)
+    return ERA5_WIND_GRID.point(lat, lon)
 
 
 def convert_era5_wave_point(lat: float, lon: float) -> "tuple[int, int]":
     """latitude: 90~-90, longitude: 0~360, 0.5"""
-    lat_index = round((90.0 - lat) / 0.5)
-    if lon >= 0:
-        lon_index = round(lon / 0.5)
-    else:
-        lon_index = round((360.0 + lon) / 0.5)
-    if lon_index == 720:
-        lon_index = 0
-    return int(lat_index), int(lon_index)
+    return ERA5_WAVE_GRID.point(lat, lon)
 
 
 def convert_era5_flow_point(lat: float, lon: float) -> "tuple[int, int]":
     """latitude: -80~90, longitude: -180~180, 1/12"""
-    SMOCHistoryStep = 1.0 / 12.0
-    lat_index = round((lat + 80.0) / SMOCHistoryStep)
-    lon_index = round((lon + 180.0) / SMOCHistoryStep)
-    if lon_index == 4320:
-        lon_index = 0
-    return int(lat_index), int(lon_index)
+    return ERA5_FLOW_GRID.point(lat, lon)
+
+
+def convert_mfwam_points(lat, lon) -> "tuple[np.ndarray, np.ndarray]":
+    return MFWAM_GRID.indices(lat, lon)
+
+
+def convert_ec_points(lat, lon) -> "tuple[np.ndarray, np.ndarray]":
+    return EC_GRID.indices(lat, lon)
+
+
+def convert_smoc_points(lat, lon) -> "tuple[np.ndarray, np.ndarray]":
+    return SMOC_GRID.indices(lat, lon)
+
+
+def convert_era5_wind_points(lat, lon) -> "tuple[np.ndarray, np.ndarray]":
+    return ERA5_WIND_GRID.indices(lat, lon)
+
+
+def convert_era5_wave_points(lat, lon) -> "tuple[np.ndarray, np.ndarray]":
+    return ERA5_WAVE_GRID.indices(lat, lon)
+
+
+def convert_era5_flow_points(lat, lon) -> "tuple[np.ndarray, np.ndarray]":
+    return ERA5_FLOW_GRID.indices(lat, lon)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录文件到达监听：Linux 下通过 ctypes 直接调用 libc 的 inotify（无额外依赖），
+不可用时（非 Linux、网络文件系统、WATCH_INOTIFY=false）退化为定时轮询
+"""
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import logging
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class FileWatcher:
+    """
+    watch() 是一个生成器：先给出目录中已有的文件，之后每有文件写完（inotify 的 CLOSE_WRITE / MOVED_TO）
+    或轮询发现文件变化且已稳定（连续两次扫描 mtime、size 不变），就给出该文件路径
+    inotify 模式下每 rescan_interval 秒无事件时兜底扫描一次，补上漏掉的事件（同样要求文件已稳定）
+    """
+
+    def __init__(self, root, match=None, poll_interval=None, rescan_interval=None, use_inotify=None):
+        self.root = root
+        self.match = match or (lambda name: True)
+        self.poll_interval = poll_interval or float(os.getenv('WATCH_POLL_SECONDS', 10))
+        self.rescan_interval = rescan_interval or float(os.getenv('WATCH_RESCAN_SECONDS', 300))
+        if use_inotify is None:
+            use_inotify = os.getenv('WATCH_INOTIFY', 'true').lower() == 'true'
+        self.use_inotify = use_inotify
+        self._last_scan = {}
+        self._yielded = {}
+
+    def _signature(self, path):
+        st = os.stat(path)
+        return st.st_mtime, st.st_size
+
+    def _scan(self):
+        current = {}
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file() and self.match(entry.name):
+                    st = entry.stat()
+                    current[entry.path] = (st.st_mtime, st.st_size)
+        return current
+
+    def _scan_changes(self, require_stable=True):
+        """与上次给出时相比有变化的文件；require_stable 时要求与上一次扫描结果一致（写入已结束）"""
+        current = self._scan()
+        changed = []
+        for path, sig in current.items():
+            if self._yielded.get(path) == sig:
+                continue
+            if require_stable and self._last_scan.get(path) != sig:
+                continue
+            self._yielded[path] = sig
+            changed.append(path)
+        self._last_scan = current
+        return sorted(changed)
+
+    def _open_inotify(self):
+        if not self.use_inotify:
+            return None
+        libc = _load_libc()
+        if libc is None:
+            return None
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            logging.warning(f'inotify_init1 失败: {os.strerror(ctypes.get_errno())}')
+            return None
+        wd = libc.inotify_add_watch(fd, os.fsencode(self.root), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if wd < 0:
+            logging.warning(f'inotify_add_watch {self.root} 失败: {os.strerror(ctypes.get_errno())}')
+            os.close(fd)
+            return None
+        return fd
+
+    def _read_events(self, fd):
+        """读取一批 inotify 事件，返回 (文件名集合, 是否溢出)"""
+        names = set()
+        overflow = False
+        try:
+            data = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return names, overflow
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+            elif name and self.match(name):
+                names.add(name)
+        return names, overflow
+
+    def watch(self):
+        # 先建立监听再做首次扫描，两者之间到达的文件不会漏掉
+        fd = self._open_inotify()
+        yield from self._scan_changes(require_stable=False)
+
+        if fd is None:
+            logging.info(f'轮询监听 {self.root}，间隔 {self.poll_interval}s')
+            while True:
+                time.sleep(self.poll_interval)
+                yield from self._scan_changes()
+
+        logging.info(f'inotify 监听 {self.root}')
+        try:
+            while True:
+                ready, _, _ = select.select([fd], [], [], self.rescan_interval)
+                if not ready:
+                    yield from self._scan_changes()
+                    continue
+                names, overflow = self._read_events(fd)
+                if overflow:
+                    logging.warning('inotify 事件队列溢出，改为全量扫描')
+                    yield from self._scan_changes(require_stable=False)
+                    continue
+                for name in sorted(names):
+                    path = os.path.join(self.root, name)
+                    try:
+                        sig = self._signature(path)
+                    except OSError:
+                        continue
+                    if self._yielded.get(path) == sig:
+                        continue
+                    self._yielded[path] = sig
+                    self._last_scan[path] = sig
+                    yield path
+        finally:
+            os.close(fd)
@@ -4,6 +4,7 @@ import os
 import time
 import datetime
 from math import sqrt
+import numpy as np
 
 
 def format_time(india_time_str, india_format='%Y-%m-%d %H:%M:%S'):
@@ -51,3 +52,13 @@ def unix_time(dt, india_format='%Y-%m-%d %H:%M:%S'):
 
 def distance(x1, y1, x2, y2):
     return sqrt((x2 - x1)**2 + (y2 - y1)**2)
+
+
+def great_circle_degrees(lat1, lon1, lat2, lon2):
+    """
+    两点间的大圆距离（球心角，单位：度，1 度约 60 海里），参数可为数值或 numpy 数组（按广播规则逐元素计算）
+    低纬度、小范围内与 distance 的欧氏距离（度）相当，高纬度时经度差按 cos(lat) 收缩
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return np.degrees(2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))))
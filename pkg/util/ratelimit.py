@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import time
+import threading
+
+
+class RateLimiter:
+    """
+    线程安全的全局限速器：多个线程共享同一个每秒请求数预算
+    每次 acquire 预约下一个可用时间槽，到点后返回；rate <= 0 表示不限速
+    """
+
+    def __init__(self, rate):
+        self.rate = float(rate or 0)
+        self.interval = 1.0 / self.rate if self.rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from cmath import log
+import os
+import logging
+import hashlib
+import threading
 import requests
 import time
 from random import randint
+from urllib.parse import urlparse
+from pkg.util.ratelimit import RateLimiter
 
 USER_AGENTS = [
     "Mozilla/4.0 (compatible; MSIE 6.0; Windows NT 5.1; SV1; AcooBrowser; .NET CLR 1.1.4322; .NET CLR 2.0.50727)",
@@ -43,4 +49,68 @@ def parse_url(url):
     random_agent = USER_AGENTS[randint(0, len(USER_AGENTS)-1)]
     HEADERS["User-Agent"] = random_agent
     res = requests.get(url,timeout=30)
-    return res
\ No newline at end of file
+    return res
+
+
+class HostLimiter:
+    """
+    按域名限流的下载：每个域名最多 per_host 个并发请求，相邻请求至少间隔 interval 秒
+    多线程并发抓取时替代 parse_url 中的全局 sleep(1)，不同域名之间互不等待
+    """
+
+    def __init__(self, per_host=None, interval=None):
+        self.per_host = max(1, per_host or int(os.getenv('FETCH_PER_HOST', 2)))
+        if interval is None:
+            interval = float(os.getenv('FETCH_HOST_INTERVAL', 0.5))
+        self.interval = interval
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = (threading.BoundedSemaphore(self.per_host),
+                                     RateLimiter(1.0 / self.interval if self.interval > 0 else 0))
+            return self._hosts[host]
+
+    def get(self, url, timeout=30):
+        semaphore, rate_limiter = self._host(url)
+        with semaphore:
+            rate_limiter.acquire()
+            return requests.get(url, timeout=timeout)
+
+
+class ContentHashCache:
+    """
+    按 URL 记录上次处理成功的文本内容 sha1（Redis hash），轮询时内容未变的文件跳过解析与写库
+    check 返回新内容的 sha1（内容未变返回 None），处理成功后再 commit，失败的文件下次轮询会重新处理
+    cache_rds 为 None 时不做判断，每次都处理
+    """
+
+    def __init__(self, cache_rds, key="typhoon_text_sha1", expire_seconds=7 * 24 * 3600):
+        self.cache_rds = cache_rds
+        self.key = key
+        self.expire_seconds = expire_seconds
+
+    def check(self, url, text, force=False):
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        if force or self.cache_rds is None:
+            return digest
+        try:
+            if self.cache_rds.hget(self.key, url) == digest:
+                return None
+        except Exception as e:
+            logging.warning(f'读取内容哈希失败 {url}: {e}')
+        return digest
+
+    def commit(self, url, digest):
+        if self.cache_rds is None or not digest:
+            return
+        try:
+            pipe = self.cache_rds.pipeline()
+            pipe.hset(self.key, url, digest)
+            pipe.expire(self.key, self.expire_seconds)
+            pipe.execute()
+        except Exception as e:
+            logging.warning(f'写入内容哈希失败 {url}: {e}')
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+网格索引转换性能对比：逐点标量 convert_*_point vs 数组版 GridDescriptor.indices
+同时校验两者结果完全一致（含 .5 边界和经度回绕）
+
+用法：python scripts/bench_convert.py [点数]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pkg.public.convert import (MFWAM_GRID, EC_GRID, SMOC_GRID, ERA5_WIND_GRID,  # noqa: E402
+                                ERA5_WAVE_GRID, ERA5_FLOW_GRID)
+
+GRIDS = {
+    "mfwam": MFWAM_GRID,
+    "ec": EC_GRID,
+    "smoc": SMOC_GRID,
+    "era5_wind": ERA5_WIND_GRID,
+    "era5_wave": ERA5_WAVE_GRID,
+    "era5_flow": ERA5_FLOW_GRID,
+}
+
+
+def make_points(n):
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(-80, 90, n)
+    lon = rng.uniform(-180, 180, n)
+    # 边界点：半格、经度回绕
+    edge_lat = np.array([0.125, -0.125, 0.25, 89.875, -79.875, 0.0])
+    edge_lon = np.array([179.99, -0.125, 359.9 - 360, 179.875, -180.0, 180.0])
+    return np.concatenate([lat, edge_lat]), np.concatenate([lon, edge_lon])
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    lat, lon = make_points(n)
+    lat_list, lon_list = lat.tolist(), lon.tolist()
+    print(f"{'grid':<10} {'scalar(s)':>10} {'vector(s)':>10} {'speedup':>8}  identical")
+    for name, grid in GRIDS.items():
+        t0 = time.perf_counter()
+        scalar = [grid.point(a, b) for a, b in zip(lat_list, lon_list)]
+        t1 = time.perf_counter()
+        lat_index, lon_index = grid.indices(lat, lon)
+        t2 = time.perf_counter()
+        identical = scalar == list(zip(lat_index.tolist(), lon_index.tolist()))
+        print(f"{name:<10} {t1 - t0:>10.4f} {t2 - t1:>10.4f} {(t1 - t0) / max(t2 - t1, 1e-9):>7.0f}x  {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,19 +10,107 @@ import time
 import os
 from typing import List, Optional, Dict, Any
 try:
-    from .page_config import PageConfig, get_page_config, get_page_info
+    from .page_config import PageConfig, REPORT_READINESS, get_page_config, get_page_info
     from .browser_config import (
         BrowserConfig, BrowserType, get_browser_config,
         list_available_browsers
     )
 except ImportError:
-    from page_config import PageConfig, get_page_config, get_page_info
+    from page_config import PageConfig, REPORT_READINESS, get_page_config, get_page_info
     from browser_config import (
         BrowserConfig, BrowserType, get_browser_config,
         list_available_browsers
     )
 
 
+# 在页面内一次取出所有 table 的行文本、单元格文本（截断）与合并单元格信息，避免逐个单元格的 IPC 往返
+TABLE_SNAPSHOT_JS = """
+(tables, opts) => tables.map(table => {
+    const rows = Array.from(table.querySelectorAll('tr'));
+    let truncated = rows.length > opts.maxRows;
+    const out = rows.slice(0, opts.maxRows).map(row => {
+        const cells = Array.from(row.querySelectorAll('td, th'));
+        if (cells.length > opts.maxCells) truncated = true;
+        const kept = cells.slice(0, opts.maxCells);
+        return {
+            text: row.innerText || '',
+            cell_count: cells.length,
+            cells: kept.map(cell => {
+                const text = (cell.innerText || '').trim();
+                if (text.length > opts.maxText) truncated = true;
+                return text.slice(0, opts.maxText);
+            }),
+            spans: kept.map(cell => [cell.rowSpan || 1, cell.colSpan || 1]),
+        };
+    });
+    return {total_rows: rows.length, truncated: truncated, rows: out};
+})
+"""
+
+# 数据就绪判断（在页面内由 wait_for_function 轮询），条件见 ReadinessConfig
+READINESS_JS = """
+(ready) => {
+    const body = document.body;
+    if (!body) return false;
+    if (ready.keywords.length || ready.minTextLength) {
+        const text = body.innerText || '';
+        if (ready.keywords.length && !ready.keywords.some(keyword => text.includes(keyword))) return false;
+        if (text.trim().length < ready.minTextLength) return false;
+    }
+    if (ready.minTableRows && document.querySelectorAll('table tr').length < ready.minTableRows) return false;
+    return true;
+}
+"""
+
+
+class RequestTracker:
+    """记录页面上进行中的 XHR/fetch 请求，用于等待报表数据请求结束（网络空闲）
+    
+    同步 API 的事件回调只在调用 Playwright 方法期间分发，wait_idle 通过 page.wait_for_timeout 短暂让出以处理事件
+    """
+    
+    def __init__(self, page, url_patterns: List[str] = None):
+        self.page = page
+        self.url_patterns = url_patterns or []
+        self.inflight = set()
+        self.last_activity = time.monotonic()
+        page.on("request", self._on_request)
+        page.on("requestfinished", self._on_done)
+        page.on("requestfailed", self._on_done)
+    
+    def _match(self, request) -> bool:
+        if request.resource_type not in ("xhr", "fetch"):
+            return False
+        return not self.url_patterns or any(pattern in request.url for pattern in self.url_patterns)
+    
+    def _on_request(self, request):
+        if self._match(request):
+            self.inflight.add(request)
+            self.last_activity = time.monotonic()
+    
+    def _on_done(self, request):
+        if request in self.inflight:
+            self.inflight.discard(request)
+            self.last_activity = time.monotonic()
+    
+    def wait_idle(self, idle_ms: int, timeout: float) -> bool:
+        """等待没有进行中的请求且已空闲 idle_ms 毫秒，超时返回 False"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.inflight and (time.monotonic() - self.last_activity) * 1000 >= idle_ms:
+                return True
+            self.page.wait_for_timeout(50)
+        return False
+    
+    def detach(self):
+        try:
+            self.page.remove_listener("request", self._on_request)
+            self.page.remove_listener("requestfinished", self._on_done)
+            self.page.remove_listener("requestfailed", self._on_done)
+        except Exception:
+            pass
+
+
 class DataScraper:
     """数据抓取器类
     
@@ -52,6 +140,7 @@ class DataScraper:
         self.context = None
         self.page = None
         self.report_frame = None
+        self.request_tracker = None
         
     def create_browser(self, playwright: Playwright):
         """创建浏览器实例
@@ -117,56 +206,53 @@ class DataScraper:
                 continue
         return False
     
+    def snapshot_tables(self, frame: FrameLocator, max_rows: int = 100, max_cells: int = 20,
+                        max_text: int = 200) -> List[Dict]:
+        """一次 evaluate_all 取出 frame 内所有 table 的内容
+        
+        Args:
+            frame: iframe 定位器
+            max_rows: 每个表格最多取的行数
+            max_cells: 每行最多取的单元格数
+            max_text: 单元格文本截断长度
+            
+        Returns:
+            每个表格一项: {"total_rows": 总行数, "truncated": 是否有行/单元格/文本被截断,
+            "rows": [{"text": 行文本, "cell_count": 单元格总数, "cells": [单元格文本], "spans": [[rowspan, colspan]]}]}
+        """
+        return frame.locator("table").evaluate_all(
+            TABLE_SNAPSHOT_JS, {"maxRows": max_rows, "maxCells": max_cells, "maxText": max_text})
+    
     def extract_table_data(self, frame: FrameLocator, max_rows: int = 100, max_cells: int = 20) -> List[Dict]:
         """提取表格数据 - 支持多种数据格式"""
         all_data = []
         
-        # 方法1: 尝试提取传统table标签
+        # 方法1: 尝试提取传统table标签（页面内一次取出全部表格）
         try:
-            tables = frame.locator("table")
-            table_count = tables.count()
-            
-            if table_count > 0:
+            for i, table in enumerate(self.snapshot_tables(frame, max_rows, max_cells)):
+                table_data = []
+                table_spans = []
+                for row in table["rows"]:
+                    if any(row["cells"]):  # 只保存有内容的行
+                        table_data.append(row["cells"])
+                        table_spans.append(row["spans"])
                 
-                for i in range(table_count):
-                    try:
-                        rows = tables.nth(i).locator("tr")
-                        row_count = rows.count()
-                        limit = min(row_count, max_rows)
-                        
-                        table_data = []
-                        for j in range(limit):
-                            try:
-                                cells = rows.nth(j).locator("td, th")
-                                cell_count = min(cells.count(), max_cells)
-                                
-                                row_data = []
-                                for k in range(cell_count):
-                                    try:
-                                        text = cells.nth(k).inner_text(timeout=1000).strip()[:200]
-                                        row_data.append(text)
-                                    except:
-                                        row_data.append("")
-                                
-                                if any(row_data):  # 只保存有内容的行
-                                    table_data.append(row_data)
-                            except Exception:
-                                continue
-                        
-                        if table_data:
-                            all_data.append({
-                                "table_index": i,
-                                "total_rows": row_count,
-                                "extracted_rows": len(table_data),
-                                "rows": table_data,
-                                "data_type": "table"
-                            })
-                    except Exception as e:
-                        print(f"  表格 {i+1} 失败: {e}")
-                        continue
-                
-                if all_data:
-                    return all_data
+                if table_data:
+                    table_info = {
+                        "table_index": i,
+                        "total_rows": table["total_rows"],
+                        "extracted_rows": len(table_data),
+                        "rows": table_data,
+                        "data_type": "table",
+                        "truncated": table["truncated"]
+                    }
+                    # 有合并单元格时才附带每个单元格的 [rowspan, colspan]
+                    if any(span != [1, 1] for row_spans in table_spans for span in row_spans):
+                        table_info["spans"] = table_spans
+                    all_data.append(table_info)
+            
+            if all_data:
+                return all_data
         except Exception as e:
             print(f"提取table标签失败: {e}")
         
@@ -282,66 +368,59 @@ class DataScraper:
             
             # 方法1: 通过table标签提取，使用行的完整文本解析数据
             try:
-                tables = frame.locator("table")
-                table_count = tables.count()
-                print(f"  找到 {table_count} 个table标签")
+                tables = self.snapshot_tables(frame, max_rows=100, max_cells=0)
+                print(f"  找到 {len(tables)} 个table标签")
                 
-                if table_count > 0:
+                if tables:
                     import re
                     # 项目标识列表，按长度排序（长的在前，避免短标识误匹配）
                     project_ids = ['P3A', 'S1C', 'C14', 'C10', 'C5', 'P6', 'C3', 'P5', 'S5', 'S2', 'S10']
                     
-                    for i in range(table_count):
-                        rows = tables.nth(i).locator("tr")
-                        row_count = rows.count()
-                        print(f"  表格 {i+1}: {row_count} 行")
+                    for i, table in enumerate(tables):
+                        print(f"  表格 {i+1}: {table['total_rows']} 行")
                         
                         # 提取每一行的数据
-                        for j in range(min(row_count, 100)):
-                            try:
-                                row = rows.nth(j)
-                                row_text = row.inner_text(timeout=2000).strip()
+                        for row in table["rows"]:
+                            row_text = row["text"].strip()
+                            
+                            # 跳过空行和标题行
+                            if not row_text or row_text in ['现货', '期货'] or len(row_text) < 2:
+                                continue
+                            
+                            # 检查这一行是否包含项目标识（按长度排序，先匹配长的）
+                            matched_project_id = None
+                            for project_id in project_ids:
+                                # 使用单词边界确保精确匹配
+                                escaped_id = re.escape(project_id)
+                                project_pattern = rf'\b{escaped_id}\b'
+                                if re.search(project_pattern, row_text):
+                                    matched_project_id = project_id
+                                    break
+                            
+                            if matched_project_id:
+                                # 从行的完整文本中提取数据
+                                row_data = []
                                 
-                                # 跳过空行和标题行
-                                if not row_text or row_text in ['现货', '期货'] or len(row_text) < 2:
-                                    continue
+                                # 提取项目标识（使用匹配到的完整标识）
+                                row_data.append(matched_project_id)
                                 
-                                # 检查这一行是否包含项目标识（按长度排序，先匹配长的）
-                                matched_project_id = None
-                                for project_id in project_ids:
-                                    # 使用单词边界确保精确匹配
-                                    escaped_id = re.escape(project_id)
-                                    project_pattern = rf'\b{escaped_id}\b'
-                                    if re.search(project_pattern, row_text):
-                                        matched_project_id = project_id
-                                        break
+                                # 提取交易方向
+                                if '做多' in row_text:
+                                    row_data.append('做多')
+                                elif '做空' in row_text:
+                                    row_data.append('做空')
+                                else:
+                                    row_data.append('')
                                 
-                                if matched_project_id:
-                                    # 从行的完整文本中提取数据
-                                    row_data = []
-                                    
-                                    # 提取项目标识（使用匹配到的完整标识）
-                                    row_data.append(matched_project_id)
-                                    
-                                    # 提取交易方向
-                                    if '做多' in row_text:
-                                        row_data.append('做多')
-                                    elif '做空' in row_text:
-                                        row_data.append('做空')
-                                    else:
-                                        row_data.append('')
-                                    
-                                    # 提取盈亏比（支持整数和小数）
-                                    ratio_match = re.search(r'(\d+\.?\d+)\s*[:：]\s*1', row_text)
-                                    if ratio_match:
-                                        row_data.append(ratio_match.group(1))
-                                    else:
-                                        row_data.append('')
-                                    
-                                    if len(row_data) >= 2:
-                                        table_data.append(row_data)
-                            except Exception as e:
-                                continue
+                                # 提取盈亏比（支持整数和小数）
+                                ratio_match = re.search(r'(\d+\.?\d+)\s*[:：]\s*1', row_text)
+                                if ratio_match:
+                                    row_data.append(ratio_match.group(1))
+                                else:
+                                    row_data.append('')
+                                
+                                if len(row_data) >= 2:
+                                    table_data.append(row_data)
             except Exception as e:
                 print(f"  ⚠ 方法1提取失败: {e}")
             
@@ -448,25 +527,20 @@ class DataScraper:
         try:
             # 通过table标签提取，使用行的完整文本解析数据
             try:
-                tables = frame.locator("table")
-                table_count = tables.count()
+                tables = self.snapshot_tables(frame, max_rows=100, max_cells=0)
                 
-                if table_count > 0:
+                if tables:
                     import re
                     # 项目标识列表，按长度排序（长的在前，避免短标识误匹配）
                     project_ids = ['P4TC+1', 'C5TC+1', 'C5+1', 'C5TC', 'P4TC', 'S4B', 'P3A', 'S1C', 
                                   'S15', 'S4A', 'S1B', 'P1A', 'C16', 'C10', 'S10', 'C14', 'C9', 'C8', 
                                   'C5', 'P6', 'P4', 'C3', 'P5', 'P2', 'S5', 'P0', 'S8', 'S9', 'S2', 'S3']
                     
-                    for i in range(table_count):
-                        rows = tables.nth(i).locator("tr")
-                        row_count = rows.count()
-                        
+                    for table in tables:
                         # 提取每一行的数据
-                        for j in range(min(row_count, 100)):
+                        for row in table["rows"]:
                             try:
-                                row = rows.nth(j)
-                                row_text = row.inner_text(timeout=1000).strip()
+                                row_text = row["text"].strip()
                                 
                                 # 跳过空行和标题行
                                 if not row_text or row_text in ['现货', '期货'] or len(row_text) < 2:
@@ -548,21 +622,16 @@ class DataScraper:
         try:
             # 通过table标签提取，使用行的完整文本解析数据
             try:
-                tables = frame.locator("table")
-                table_count = tables.count()
+                tables = self.snapshot_tables(frame, max_rows=100, max_cells=5)
                 
-                if table_count > 0:
+                if tables:
                     import re
                     
-                    for i in range(table_count):
-                        rows = tables.nth(i).locator("tr")
-                        row_count = rows.count()
-                        
+                    for table in tables:
                         # 提取每一行的数据
-                        for j in range(min(row_count, 100)):
+                        for row in table["rows"]:
                             try:
-                                row = rows.nth(j)
-                                row_text = row.inner_text(timeout=1000).strip()
+                                row_text = row["text"].strip()
                                 
                                 # 跳过空行和标题行
                                 if not row_text or ('现货VS期货' in row_text or '现货VS现货' in row_text or 
@@ -586,18 +655,9 @@ class DataScraper:
                                     row_data.append(asset_pair)
                                 else:
                                     # 如果没找到，尝试从单元格中提取
-                                    cells = row.locator("td, th")
-                                    cell_count = cells.count()
-                                    if cell_count >= 3:
-                                        # 尝试从单元格中组合资产对比
-                                        cell_texts = []
-                                        for k in range(min(cell_count, 5)):
-                                            try:
-                                                text = cells.nth(k).inner_text(timeout=1000).strip()
-                                                if text and text not in ['VS', 'vs']:
-                                                    cell_texts.append(text)
-                                            except:
-                                                pass
+                                    if row["cell_count"] >= 3:
+                                        # 尝试从单元格中组合资产对比（前5个单元格）
+                                        cell_texts = [text for text in row["cells"] if text and text not in ['VS', 'vs']]
                                         
                                         # 查找包含VS的行
                                         if 'VS' in ' '.join(cell_texts) or 'vs' in ' '.join(cell_texts).lower():
@@ -662,6 +722,7 @@ class DataScraper:
     def navigate_to_page(self, page_config: PageConfig) -> bool:
         """根据配置导航到指定页面"""
         print(f"4. 导航到目标页面: {page_config.name}")
+        self.track_requests(page_config)
         
         # 对于P4TC页面，使用精确的文本匹配导航，确保点击"单边策略研究"而不是"基差研究"
         if page_config.name == "P4TC现货应用决策":
@@ -778,19 +839,23 @@ class DataScraper:
             return True
         else:
             # 对于其他页面，使用配置化的导航
+            # 不再每步固定等待：下一步的元素出现即点击，上一步的 wait_time 只放宽等待上限；
+            # 最后一步之后由 wait_for_data_load 按就绪条件等待
+            extra_wait = 0
             for step in page_config.navigation_path:
                 print(f"  {step.description}")
                 # 直接使用选择器（选择器中已包含 text='...' 格式）
                 success = self.try_click(
                     self.report_frame, 
-                    step.selectors
+                    step.selectors,
+                    timeout=3000 + int(extra_wait * 1000)
                 )
                 
                 if not success:
                     print(f"  ✗ 导航步骤失败: {step.description}")
                     return False
                 
-                time.sleep(step.wait_time)
+                extra_wait = step.wait_time
             
             print("✓ 导航完成")
             return True
@@ -1525,70 +1590,54 @@ class DataScraper:
         
         return metadata
     
+    def track_requests(self, page_config: PageConfig):
+        """开始导航前挂上请求记录，之后点击触发的报表数据请求都能被等待到"""
+        if self.request_tracker:
+            self.request_tracker.detach()
+            self.request_tracker = None
+        readiness = page_config.readiness or REPORT_READINESS
+        # 只跟踪明确配置的报表数据请求，页面后台轮询会让"全部 XHR 空闲"一直等到超时
+        if self.page and readiness.network_idle and readiness.xhr_url_patterns:
+            self.request_tracker = RequestTracker(self.page, readiness.xhr_url_patterns)
+    
+    def resolve_frame(self, target_frame: FrameLocator):
+        """FrameLocator 没有 wait_for_function，通过其中的根元素取得对应的 Frame"""
+        if hasattr(target_frame, "wait_for_function"):
+            return target_frame
+        handle = target_frame.locator(":root").element_handle(timeout=5000)
+        try:
+            return handle.owner_frame()
+        finally:
+            handle.dispose()
+    
     def wait_for_data_load(self, target_frame: FrameLocator, page_config: PageConfig) -> bool:
-        """等待页面数据加载（优化版本：不需要点击查询按钮）"""
+        """等待页面数据加载：按 PageConfig.readiness 的条件事件驱动地等待，条件满足立即继续，超时也继续尝试提取"""
         print("6. 等待页面数据加载...")
+        readiness = page_config.readiness or REPORT_READINESS
+        start = time.monotonic()
+        deadline = start + readiness.timeout
         
-        # 获取配置的等待时间
-        config = page_config.data_extraction_config
-        wait_time = config.get("wait_after_query", 5)  # 使用配置的等待时间
+        # 报表数据请求结束：与页面条件共用同一截止时间，最多占用一半，避免挤占页面条件的等待
+        if readiness.network_idle and readiness.xhr_url_patterns and self.request_tracker:
+            if not self.request_tracker.wait_idle(readiness.idle_ms, readiness.timeout / 2):
+                print("  ⚠ 数据请求未在超时内结束")
         
-        # 对于P4TC页面，使用更智能的等待逻辑
-        if page_config.name == "P4TC现货应用决策":
-            print("  检测到P4TC页面，智能等待数据加载...")
-            # 动态等待数据加载（检查页面是否有数据出现）
-            for i in range(10):  # 最多等待10秒
-                try:
-                    # 检查是否有数据出现（检查是否有数字、日期等）
-                    page_text = target_frame.locator("body").inner_text(timeout=2000)
-                    # 检查是否包含P4TC相关的关键词或数据
-                    if any(keyword in page_text for keyword in ["做多", "做空", "盈亏比", "价差比", "预测值", "正收益", "负收益"]):
-                        print(f"  ✓ 数据已加载（等待了 {i+1} 秒）")
-                        return True
-                    time.sleep(1)
-                except:
-                    time.sleep(1)
-            else:
-                print("  ⚠ 数据加载超时，继续尝试提取")
-                # 即使超时也等待一下，确保页面稳定
-                time.sleep(2)
-        # 对于14天后单边交易机会汇总页面，使用智能等待
-        elif "14天后" in page_config.name or "14天后交易机会汇总" in page_config.name:
-            print("  检测到14天后交易机会汇总页面，智能等待数据加载...")
-            # 动态等待数据加载（检查页面是否有数据出现）
-            for i in range(15):  # 最多等待15秒
-                try:
-                    page_text = target_frame.locator("body").inner_text(timeout=2000)
-                    # 检查是否包含项目标识或交易机会相关的关键词
-                    if any(keyword in page_text for keyword in ["C5", "C10", "P6", "P3A", "做多", "做空", "盈亏比", "交易机会"]):
-                        # 进一步检查是否有表格数据
-                        try:
-                            tables = target_frame.locator("table")
-                            if tables.count() > 0:
-                                print(f"  ✓ 数据已加载（等待了 {i+1} 秒）")
-                                time.sleep(2)  # 额外等待2秒确保数据完全渲染
-                                return True
-                        except:
-                            pass
-                    time.sleep(1)
-                except:
-                    time.sleep(1)
-            else:
-                print("  ⚠ 数据加载超时，继续尝试提取")
-                time.sleep(3)  # 即使超时也等待一下，确保页面稳定
-        else:
-            # 其他页面：等待固定时间，然后检查数据是否出现
-            print(f"  等待 {wait_time} 秒让页面数据加载...")
-            time.sleep(wait_time)
-            
-            # 尝试检查数据是否已加载
-            try:
-                page_text = target_frame.locator("body").inner_text(timeout=2000)
-                if page_text and len(page_text.strip()) > 50:
-                    print("  ✓ 页面内容已加载")
-                    return True
-            except:
-                print("  ⚠ 无法验证数据加载状态，继续尝试提取")
+        # 页面内容满足就绪条件（关键词、表格行数、文本长度）
+        try:
+            frame = self.resolve_frame(target_frame)
+            frame.wait_for_function(
+                READINESS_JS,
+                arg={
+                    "keywords": readiness.keywords,
+                    "minTableRows": readiness.min_table_rows,
+                    "minTextLength": readiness.min_text_length
+                },
+                polling=100,
+                timeout=max(deadline - time.monotonic(), 0.5) * 1000
+            )
+            print(f"  ✓ 数据已加载（等待了 {time.monotonic() - start:.1f} 秒）")
+        except Exception as e:
+            print(f"  ⚠ 数据加载超时，继续尝试提取: {e}")
         
         return True
     
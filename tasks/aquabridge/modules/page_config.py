@@ -3,7 +3,7 @@
 定义不同页面的导航路径和选择器
 """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List, Optional
 
 
@@ -12,10 +12,22 @@ class NavigationStep:
     """导航步骤配置"""
     selectors: List[str]  # 多个选择器，按优先级排序
     text: Optional[str] = None  # 文本匹配（用于文本链接）
-    wait_time: float = 0.3  # 等待时间
+    wait_time: float = 0.3  # 点击后下一步元素出现的额外等待上限（秒），元素出现即继续
     description: str = ""  # 描述信息
 
 
+@dataclass
+class ReadinessConfig:
+    """数据就绪条件：所有已配置的条件都满足即认为数据已加载，最多等待 timeout 秒"""
+    keywords: List[str] = field(default_factory=list)  # 页面文本包含任一关键词
+    min_table_rows: int = 0  # 页面所有 table 的行数合计达到阈值
+    min_text_length: int = 0  # 页面文本（去空白）长度达到阈值
+    network_idle: bool = True  # 报表数据请求（XHR/fetch）全部结束且空闲 idle_ms 毫秒，仅在配置了 xhr_url_patterns 时生效
+    xhr_url_patterns: List[str] = field(default_factory=list)  # 报表数据请求的 URL 片段；为空时不等待网络空闲（页面有后台轮询，等不到空闲）
+    idle_ms: int = 500
+    timeout: float = 10.0
+
+
 @dataclass
 class PageConfig:
     """页面配置"""
@@ -25,6 +37,29 @@ class PageConfig:
     query_button_selectors: List[str]  # 查询按钮选择器
     data_extraction_config: dict  # 数据提取配置
     screenshot_config: Optional[dict] = None  # 截图配置，如果为None则表示不需要截图
+    readiness: Optional[ReadinessConfig] = None  # 数据就绪条件，为None时使用 REPORT_READINESS
+
+
+# P4TC现货应用决策页面：出现交易方向或收益相关的关键词
+SPOT_DECISION_READINESS = ReadinessConfig(
+    keywords=["做多", "做空", "盈亏比", "价差比", "预测值", "正收益", "负收益"],
+    timeout=10.0
+)
+
+# 交易机会汇总及各“14天后”现货应用决策页面：出现项目标识或交易方向，且表格已渲染出数据行
+TRADING_OPPORTUNITY_READINESS = ReadinessConfig(
+    keywords=["C5", "C10", "P6", "P3A", "做多", "做空", "盈亏比", "交易机会"],
+    min_table_rows=2,
+    timeout=15.0
+)
+
+# 其他报表页面（含各“42天后”现货应用决策页面）：表格已渲染出数据行且页面已有内容
+# 菜单和标题文字在报表数据返回前就已超过文本长度阈值，需以表格数据行判断
+REPORT_READINESS = ReadinessConfig(
+    min_table_rows=2,
+    min_text_length=50,
+    timeout=10.0
+)
 
 
 # 页面配置定义
@@ -53,9 +88,9 @@ PAGE_CONFIGS = {
         ],
         data_extraction_config={
             "max_rows": 100,
-            "max_cells": 20,
-            "wait_after_query": 3
-        }
+            "max_cells": 20
+        },
+        readiness=SPOT_DECISION_READINESS
     ),
     
     "ffa_price_signals": PageConfig(
@@ -118,9 +153,9 @@ PAGE_CONFIGS = {
         ],
         data_extraction_config={
             "max_rows": 100,
-            "max_cells": 20,
-            "wait_after_query": 5
-        }
+            "max_cells": 20
+        },
+        readiness=REPORT_READINESS
     ),
     
     "european_line_signals": PageConfig(
@@ -181,9 +216,9 @@ PAGE_CONFIGS = {
         ],
         data_extraction_config={
             "max_rows": 100,
-            "max_cells": 20,
-            "wait_after_query": 5
-        }
+            "max_cells": 20
+        },
+        readiness=REPORT_READINESS
     ),
     
     "unilateral_trading_opportunity_14d": PageConfig(
@@ -244,9 +279,9 @@ PAGE_CONFIGS = {
         ],
         data_extraction_config={
             "max_rows": 100,
-            "max_cells": 20,
-            "wait_after_query": 5
-        }
+            "max_cells": 20
+        },
+        readiness=TRADING_OPPORTUNITY_READINESS
     ),
     
     "unilateral_trading_opportunity_42d": PageConfig(
@@ -307,9 +342,9 @@ PAGE_CONFIGS = {
         ],
         data_extraction_config={
             "max_rows": 200,
-            "max_cells": 20,
-            "wait_after_query": 5
-        }
+            "max_cells": 20
+        },
+        readiness=REPORT_READINESS
     ),
     
     "bilateral_trading_opportunity": PageConfig(
@@ -370,9 +405,9 @@ PAGE_CONFIGS = {
         ],
         data_extraction_config={
             "max_rows": 200,
-            "max_cells": 20,
-            "wait_after_query": 5
-        }
+            "max_cells": 20
+        },
+        readiness=REPORT_READINESS
     ),
     
     "trading_opportunity_42d": PageConfig(
@@ -428,8 +463,7 @@ PAGE_CONFIGS = {
         query_button_selectors=[],  # 截图模式不需要查询按钮
         data_extraction_config={
             "max_rows": 100,
-            "max_cells": 20,
-            "wait_after_query": 0  # 截图模式不需要等待查询
+            "max_cells": 20
         },
         screenshot_config={
             "enabled": True,
@@ -442,7 +476,8 @@ PAGE_CONFIGS = {
             ],
             "wait_before_screenshot": 8,  # 增加等待时间确保页面完全加载
             "output_dir": "output/screenshots"
-        }
+        },
+        readiness=REPORT_READINESS
     ),
     
     # P5现货应用决策页面配置
@@ -500,9 +535,9 @@ PAGE_CONFIGS = {
         ],
         data_extraction_config={
             "max_rows": 200,  # 增加行数限制以捕获更多表格数据
-            "max_cells": 30,  # 增加单元格限制以捕获更宽的表格
-            "wait_after_query": 5  # 增加等待时间确保数据完全加载
-        }
+            "max_cells": 30  # 增加单元格限制以捕获更宽的表格
+        },
+        readiness=REPORT_READINESS
     ),
     
     "p5_spot_decision_14d": PageConfig(
@@ -559,9 +594,9 @@ PAGE_CONFIGS = {
         ],
         data_extraction_config={
             "max_rows": 100,
-            "max_cells": 20,
-            "wait_after_query": 3
-        }
+            "max_cells": 20
+        },
+        readiness=TRADING_OPPORTUNITY_READINESS
     ),
     
     # P3A现货应用决策页面配置
@@ -619,9 +654,9 @@ PAGE_CONFIGS = {
         ],
         data_extraction_config={
             "max_rows": 200,  # 增加行数限制以捕获更多表格数据
-            "max_cells": 30,  # 增加单元格限制以捕获更宽的表格
-            "wait_after_query": 5  # 增加等待时间确保数据完全加载
-        }
+            "max_cells": 30  # 增加单元格限制以捕获更宽的表格
+        },
+        readiness=REPORT_READINESS
     ),
     
     "p3a_spot_decision_14d": PageConfig(
@@ -678,9 +713,9 @@ PAGE_CONFIGS = {
         ],
         data_extraction_config={
             "max_rows": 200,  # 增加行数限制以捕获更多表格数据
-            "max_cells": 30,  # 增加单元格限制以捕获更宽的表格
-            "wait_after_query": 5  # 增加等待时间确保数据完全加载
-        }
+            "max_cells": 30  # 增加单元格限制以捕获更宽的表格
+        },
+        readiness=TRADING_OPPORTUNITY_READINESS
     ),
     
     # P6现货应用决策页面配置
@@ -738,9 +773,9 @@ PAGE_CONFIGS = {
         ],
         data_extraction_config={
             "max_rows": 200,  # 增加行数限制以捕获更多表格数据
-            "max_cells": 30,  # 增加单元格限制以捕获更宽的表格
-            "wait_after_query": 5  # 增加等待时间确保数据完全加载
-        }
+            "max_cells": 30  # 增加单元格限制以捕获更宽的表格
+        },
+        readiness=REPORT_READINESS
     ),
     
     "p6_spot_decision_14d": PageConfig(
@@ -797,9 +832,9 @@ PAGE_CONFIGS = {
         ],
         data_extraction_config={
             "max_rows": 200,  # 增加行数限制以捕获更多表格数据
-            "max_cells": 30,  # 增加单元格限制以捕获更宽的表格
-            "wait_after_query": 5  # 增加等待时间确保数据完全加载
-        }
+            "max_cells": 30  # 增加单元格限制以捕获更宽的表格
+        },
+        readiness=TRADING_OPPORTUNITY_READINESS
     ),
     
     # C3现货应用决策页面配置
@@ -857,9 +892,9 @@ PAGE_CONFIGS = {
         ],
         data_extraction_config={
             "max_rows": 200,  # 增加行数限制以捕获更多表格数据
-            "max_cells": 30,  # 增加单元格限制以捕获更宽的表格
-            "wait_after_query": 5  # 增加等待时间确保数据完全加载
-        }
+            "max_cells": 30  # 增加单元格限制以捕获更宽的表格
+        },
+        readiness=REPORT_READINESS
     ),
     
     "c3_spot_decision_14d": PageConfig(
@@ -916,9 +951,9 @@ PAGE_CONFIGS = {
         ],
         data_extraction_config={
             "max_rows": 200,  # 增加行数限制以捕获更多表格数据
-            "max_cells": 30,  # 增加单元格限制以捕获更宽的表格
-            "wait_after_query": 5  # 增加等待时间确保数据完全加载
-        }
+            "max_cells": 30  # 增加单元格限制以捕获更宽的表格
+        },
+        readiness=TRADING_OPPORTUNITY_READINESS
     ),
     
     # C5现货应用决策页面配置
@@ -976,9 +1011,9 @@ PAGE_CONFIGS = {
         ],
         data_extraction_config={
             "max_rows": 200,  # 增加行数限制以捕获更多表格数据
-            "max_cells": 30,  # 增加单元格限制以捕获更宽的表格
-            "wait_after_query": 5  # 增加等待时间确保数据完全加载
-        }
+            "max_cells": 30  # 增加单元格限制以捕获更宽的表格
+        },
+        readiness=REPORT_READINESS
     ),
     
     "c5_spot_decision_14d": PageConfig(
@@ -1035,9 +1070,9 @@ PAGE_CONFIGS = {
         ],
         data_extraction_config={
             "max_rows": 200,  # 增加行数限制以捕获更多表格数据
-            "max_cells": 30,  # 增加单元格限制以捕获更宽的表格
-            "wait_after_query": 5  # 增加等待时间确保数据完全加载
-        }
+            "max_cells": 30  # 增加单元格限制以捕获更宽的表格
+        },
+        readiness=TRADING_OPPORTUNITY_READINESS
     )
 }
 
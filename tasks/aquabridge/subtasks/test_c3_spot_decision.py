@@ -43,7 +43,7 @@ def test_c3_spot_decision():
             print(f"  数据提取配置:")
             print(f"    max_rows: {page_config.data_extraction_config.get('max_rows')}")
             print(f"    max_cells: {page_config.data_extraction_config.get('max_cells')}")
-            print(f"    wait_after_query: {page_config.data_extraction_config.get('wait_after_query')}")
+            print(f"    readiness: {page_config.readiness}")
         else:
             print(f"\n✗ 页面配置未找到")
             return False
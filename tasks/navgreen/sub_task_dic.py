@@ -6,6 +6,7 @@ from tasks.navgreen.subtasks.gen_vessel_performance import GenVesselPerformance,
 from tasks.navgreen.subtasks.calc_vessel_performance_details import CalcVesselPerformanceDetails
 from tasks.navgreen.subtasks.spider_windy_zoom_storms import SpiderWindyZoomStorms
 from tasks.navgreen.subtasks.calc_vessel_performance_details_from_wmy import CalcVesselPerformanceDetailsFromWmy
+from tasks.navgreen.subtasks.export_era5_grid_store import ExportEra5GridStore
 from tasks.navgreen.subtasks.spider_vessel_Lloyd_info import SpiderVesselsLloydInfo
 from tasks.navgreen.subtasks.rich_hifleet_vessels_info import RichHifleetVesselsInfo,ModifyVesselsInfoInMgo
 from tasks.navgreen.subtasks.update_year_of_build import UpdateYearOfBuild
@@ -25,6 +26,7 @@ def get_task_dic():
         
         "spider_vessel_Lloyd_info": (lambda: SpiderVesselsLloydInfo(), 'Navgreen => ***查询船舶劳氏船级社的档案'),
         "calc_vessel_performance_details_from_wmy": (lambda: CalcVesselPerformanceDetailsFromWmy(), '****Navgreen：从茂源那边获取 mmsi 去计算船舶性能详情'),
+        "export_era5_grid_store": (lambda: ExportEra5GridStore(), '****Navgreen：导出 ERA5 网格到本地内存映射存储（离线补全）'),
         "spider_windy_zoom_storms": (lambda: SpiderWindyZoomStorms(), '****Navgreen：爬取 windy 的气旋和台风数据'),
         # "spider_wni_ai_weather_analyze": (lambda: SpiderWniAiWeatherAnalyze(), '****Navgreen：爬取 wni 的 ai 天气分析数据'),
     }
@@ -8,8 +8,10 @@ from requests.adapters import HTTPAdapter, Retry
 from requests.exceptions import ChunkedEncodingError
 from datetime import datetime, timedelta
 from datetime import timezone
-from pkg.public.convert import convert_era5_wave_point, convert_era5_wind_point, convert_era5_flow_point
+from pkg.public.convert import convert_era5_wave_point
+from tasks.navgreen.subtasks.era5_enrichment import Era5Enricher, TrackColumns, MISSING
 import math
+import numpy as np
 import traceback
 import os
 import time
@@ -399,219 +401,13 @@ def handle_track_point_weather(i, ck_client):
     print(result)
 
 
-def batch_query_ck(client, sql_template, index_time_list, batch_size=500):
-    results = []
-    for i in range(0, len(index_time_list), batch_size):
-        batch = index_time_list[i:i+batch_size]
-        values_clause = ",\n".join(
-            f"({lat},{lon},toDateTime('{postime}'))"
-            for lat, lon, postime in batch
-        )
-        sql = sql_template.format(values=values_clause)
-        results.extend(client.query(sql))
-    return results
-
-
-def fetch_era5_wave_for_track(track_data, ck_client, batch_size=500):
-    # 1. 生成索引和时间元组，去重
-    seen = set()
-    index_time_list = []
-    for point in track_data:
-        lat = point["lat"]
-        lon = point["lon"]
-        postime = point["postime"]
-        lat_index, lon_index = convert_era5_wave_point(lat, lon)
-        key = (lat_index, lon_index, postime)
-        if key not in seen:
-            seen.add(key)
-            index_time_list.append(key)
-        point["lat_index"] = lat_index
-        point["lon_index"] = lon_index
-
-    # 2. SQL模板
-    sql_template = """
-    SELECT *
-    FROM shipping_history.era5_wave_0p5
-    WHERE (lat_index, lon_index, history_date) IN (
-        {values}
-    )
-    """
-
-    # 3. 分批查询
-    results = batch_query_ck(ck_client, sql_template,
-                             index_time_list, batch_size)
-
-    # 4. 构建映射
-    weather_map = {}
-    for row in results:
-        lat_index, lon_index, history_date = row[0], row[1], row[2]
-        weather_map[(lat_index, lon_index, str(history_date))] = row
-
-    # 5. 合并到track_data
-    weather_keys = [
-        "lat_index", "lon_index", "history_date",
-        "wave_height", "wave_direction", "wave_period",
-        "swell_wave_height", "swell_wave_direction", "swell_wave_period",
-        "wind_wave_height", "wind_wave_direction", "wind_wave_period"
-    ]
-    for point in track_data:
-        key = (point["lat_index"], point["lon_index"], point["postime"])
-        weather = weather_map.get(key)
-        if weather:
-            for k, v in zip(weather_keys, weather):
-                point[k] = v
-
-    return track_data
-
-
-def fetch_era5_wind_for_track(track_data, ck_client, batch_size=500):
-    seen = set()
-    index_time_list = []
-    for point in track_data:
-        lat = point["lat"]
-        lon = point["lon"]
-        postime = point["postime"]
-        lat_index, lon_index = convert_era5_wind_point(lat, lon)
-        key = (lat_index, lon_index, postime)
-        if key not in seen:
-            seen.add(key)
-            index_time_list.append(key)
-        point["wind_lat_index"] = lat_index
-        point["wind_lon_index"] = lon_index
-
-    sql_template = """
-    SELECT *
-    FROM shipping_history.era5_0p25
-    WHERE (lat_index, lon_index, history_date) IN (
-        {values}
-    )
-    """
-
-    results = batch_query_ck(ck_client, sql_template,
-                             index_time_list, batch_size)
-
-    weather_map = {}
-    for row in results:
-        lat_index, lon_index, history_date = row[0], row[1], row[2]
-        weather_map[(lat_index, lon_index, str(history_date))] = row
-
-    weather_keys = [
-        "wind_lat_index", "wind_lon_index", "wind_history_date",
-        "pressure", "temperature", "u_wind", "v_wind"
-    ]
-    for point in track_data:
-        key = (point["wind_lat_index"],
-               point["wind_lon_index"], point["postime"])
-        weather = weather_map.get(key)
-        if weather:
-            for k, v in zip(weather_keys, weather):
-                point[k] = v
-    return track_data
-
-
-def fetch_era5_flow_for_track(track_data, ck_client, batch_size=500):
-    seen = set()
-    index_time_list = []
-    for point in track_data:
-        lat = point["lat"]
-        lon = point["lon"]
-        postime = point["postime"]
-        lat_index, lon_index = convert_era5_flow_point(lat, lon)
-        key = (lat_index, lon_index, postime)
-        if key not in seen:
-            seen.add(key)
-            index_time_list.append(key)
-        point["flow_lat_index"] = lat_index
-        point["flow_lon_index"] = lon_index
-
-    sql_template = """
-    SELECT *
-    FROM shipping_history.era5_flow_0p83
-    WHERE (lat_index, lon_index, history_date) IN (
-        {values}
-    )
-    """
-
-    results = batch_query_ck(ck_client, sql_template,
-                             index_time_list, batch_size)
-
-    weather_map = {}
-    for row in results:
-        lat_index, lon_index, history_date = row[0], row[1], row[2]
-        weather_map[(lat_index, lon_index, str(history_date))] = row
-
-    weather_keys = [
-        "flow_lat_index", "flow_lon_index", "flow_history_date",
-        "u_flow", "v_flow"
-    ]
-    for point in track_data:
-        key = (point["flow_lat_index"],
-               point["flow_lon_index"], point["postime"])
-        weather = weather_map.get(key)
-        if weather:
-            for k, v in zip(weather_keys, weather):
-                point[k] = v
-    return track_data
-
-
-def merge_track_data(track_data, track_wave_data, track_wind_data, track_flow_data):
-    # 1. 构建映射
-    def build_map(data, lat_key, lon_key, time_key):
-        return {
-            (str(d[lat_key]), str(d[lon_key]), str(d[time_key])): d
-            for d in data
-        }
-
-    wave_map = build_map(track_wave_data, "lat", "lon", "postime")
-    wind_map = build_map(track_wind_data, "lat", "lon", "postime")
-    flow_map = build_map(track_flow_data, "lat", "lon", "postime")
-
-    merged = []
-    for point in track_data:
-        key = (str(point["lat"]), str(point["lon"]), str(point["postime"]))
-        merged_point = point.copy()
-        # 合并wave
-        wave = wave_map.get(key)
-        if wave:
-            for k, v in wave.items():
-                if k not in merged_point:
-                    merged_point[k] = v
-        # 合并wind
-        wind = wind_map.get(key)
-        if wind:
-            for k, v in wind.items():
-                if k not in merged_point:
-                    merged_point[k] = v
-        # 合并flow
-        flow = flow_map.get(key)
-        if flow:
-            for k, v in flow.items():
-                if k not in merged_point:
-                    merged_point[k] = v
-        merged.append(merged_point)
-    return merged
-
-
-def format_history_dates(data):
-    for point in data:
-        for key in ["history_date", "wind_history_date", "flow_history_date"]:
-            if key in point and isinstance(point[key], datetime):
-                point[key] = point[key].strftime("%Y-%m-%d %H:%M:%S")
-    return data
-
-
-def filter_fields(data):
-    keep_keys = [
-        "lon", "lat", "sog", "cog", "hdg", "draught", "postime",
-        "wave_height", "wave_direction", "wave_period",
-        "swell_wave_height", "swell_wave_direction", "swell_wave_period",
-        "wind_wave_height", "wind_wave_direction", "wind_wave_period",
-        "pressure", "temperature", "u_wind", "v_wind", "u_flow", "v_flow"
-    ]
-    return [
-        {k: d[k] for k in keep_keys if k in d}
-        for d in data
-    ]
+TRACK_BASE_KEYS = ("lon", "lat", "sog", "cog", "hdg", "draught", "postime")
+TRACK_KEEP_KEYS = TRACK_BASE_KEYS + (
+    "wave_height", "wave_direction", "wave_period",
+    "swell_wave_height", "swell_wave_direction", "swell_wave_period",
+    "wind_wave_height", "wind_wave_direction", "wind_wave_period",
+    "pressure", "temperature", "u_wind", "v_wind", "u_flow", "v_flow"
+)
 
 
 def calculate_wind_level(speed):
@@ -676,22 +472,6 @@ def ms_to_kts(speed):
     return speed * 1.94384449
 
 
-def enrich_wind_info(data):
-    for point in data:
-        u = point.get("u_wind")
-        v = point.get("v_wind")
-        if u is not None and v is not None:
-            speed, angle = convert_uv_wind_to_speed_and_angle(u, v)
-            level = calculate_wind_level(speed)
-            direction = convert_angle_to_direction(angle)
-            point["wind_speed"] = speed
-            point["wind_angle"] = angle
-            point["wind_level"] = level
-            point["wind_direction"] = direction
-            point["wind_speed_kts"] = ms_to_kts(speed)
-    return data
-
-
 def calculate_flow_degree(angle):
     if angle < 0:
         angle += 360.
@@ -706,22 +486,89 @@ def convert_uv_flow_to_speed_and_angle(u, v):
     return speed, angle
 
 
-def enrich_flow_info(data):
-    for point in data:
-        u = point.get("u_flow")
-        v = point.get("v_flow")
-        if u is not None and v is not None:
-            speed, angle = convert_uv_flow_to_speed_and_angle(u, v)
-            if speed > 0:
-                angle = calculate_flow_degree(angle)
-            else:
-                angle = 0.0
-            direction = convert_angle_to_direction(angle)
-            point["flow_speed"] = speed
-            point["flow_angle"] = angle
-            point["flow_direction"] = direction
-            point["flow_speed_kts"] = ms_to_kts(speed)
-    return data
+WIND_LEVEL_THRESHOLDS = np.array([0.2, 1.5, 3.3, 5.4, 7.9, 10.7, 13.8, 17.1, 20.7, 24.4, 28.4, 32.6])
+COMPASS_DIRECTIONS = np.array(directions_list[:16])
+WIND_INFO_KEYS = ("wind_speed", "wind_angle", "wind_level", "wind_direction", "wind_speed_kts")
+FLOW_INFO_KEYS = ("flow_speed", "flow_angle", "flow_direction", "flow_speed_kts")
+
+
+def calculate_wind_levels(speed):
+    """calculate_wind_level 的数组版本：蒲福风级按阈值 searchsorted（speed <= 阈值 归入该级）"""
+    level = np.searchsorted(WIND_LEVEL_THRESHOLDS, speed, side="left")
+    level[np.isnan(speed)] = 0
+    return level
+
+
+def convert_uv_to_speed_and_angle_batch(u, v):
+    """u/v 数组 -> (speed, angle)，NaN 分量的点返回 (0.0, 0.0)；与标量版本逐位一致"""
+    invalid = np.isnan(u) | np.isnan(v)
+    speed = np.sqrt(u * u + v * v)
+    angle = np.degrees(np.arctan2(u, v))
+    speed[invalid] = 0.0
+    angle[invalid] = 0.0
+    return speed, angle, invalid
+
+
+def convert_angles_to_directions(angle):
+    """convert_angle_to_direction 的数组版本"""
+    angle = np.where(angle < 0, angle + 360, angle)
+    nan = np.isnan(angle)
+    index = ((np.where(nan, 0.0, angle) + 11.25) / 22.5).astype(np.int64) % 16
+    return COMPASS_DIRECTIONS[index].tolist()
+
+
+def get_uv_columns(track, u_key, v_key):
+    """取出 u/v 均已补全的点：(点下标数组, u 数组, v 数组)"""
+    u_col = track.columns.get(u_key)
+    v_col = track.columns.get(v_key)
+    if u_col is None or v_col is None:
+        return np.array([], dtype=np.int64), None, None
+    u_obj = np.fromiter(u_col, dtype=object, count=track.size)
+    v_obj = np.fromiter(v_col, dtype=object, count=track.size)
+    valid = (u_obj != None) & (u_obj != MISSING) & (v_obj != None) & (v_obj != MISSING)  # noqa: E711
+    index = np.nonzero(valid)[0]
+    return index, u_obj[index].astype(float), v_obj[index].astype(float)
+
+
+def set_columns(track, index, values):
+    """按点下标把计算结果写入列式轨迹"""
+    for key, column_values in values.items():
+        column = np.fromiter(track.column(key), dtype=object, count=track.size)
+        column[index] = np.fromiter(column_values, dtype=object, count=len(index))
+        track.columns[key] = column.tolist()
+
+
+def enrich_wind_columns(track):
+    """风速/风向/风级/节，一次性写入列式轨迹"""
+    index, u, v = get_uv_columns(track, "u_wind", "v_wind")
+    if not len(index):
+        return track
+    speed, angle, invalid = convert_uv_to_speed_and_angle_batch(u, v)
+    angle = np.where(invalid, 0.0, np.where(angle > 0, angle - 180, angle + 180))
+    set_columns(track, index, {
+        "wind_speed": speed.tolist(),
+        "wind_angle": angle.tolist(),
+        "wind_level": calculate_wind_levels(speed).tolist(),
+        "wind_direction": convert_angles_to_directions(angle),
+        "wind_speed_kts": (speed * 1.94384449).tolist(),
+    })
+    return track
+
+
+def enrich_flow_columns(track):
+    """流速/流向/节，一次性写入列式轨迹"""
+    index, u, v = get_uv_columns(track, "u_flow", "v_flow")
+    if not len(index):
+        return track
+    speed, angle, _ = convert_uv_to_speed_and_angle_batch(u, v)
+    angle = np.where(speed > 0, np.where(angle < 0, angle + 360., angle), 0.0)
+    set_columns(track, index, {
+        "flow_speed": speed.tolist(),
+        "flow_angle": angle.tolist(),
+        "flow_direction": convert_angles_to_directions(angle),
+        "flow_speed_kts": (speed * 1.94384449).tolist(),
+    })
+    return track
 
 
 def is_sailing_downstream(u, v, ship_angle):
@@ -754,8 +601,9 @@ class CalcVesselPerformanceDetails(BaseModel):
             self.vessel_types = self.vessel_types.split(",")
         else:
             self.vessel_types = []
+        # ERA5 补全引擎自行维护 wave/wind/flow 三个 ClickHouse 连接，用于并发查询
+        self.era5_enricher = Era5Enricher()
         config = {
-            'ck_client': True,
             'handle_db': 'mgo',
             "cache_rds": True,
             'collection': 'vessels_performance_details',
@@ -776,18 +624,12 @@ class CalcVesselPerformanceDetails(BaseModel):
             return None
 
         track_data = get_vessel_track(mmsi, start_time, end_time)
-        track_wave_data = fetch_era5_wave_for_track(
-            track_data, self.ck_client)  # era5 wave
-        track_wind_data = fetch_era5_wind_for_track(
-            track_data, self.ck_client)  # era5 wind
-        track_flow_data = fetch_era5_flow_for_track(
-            track_data, self.ck_client)  # era5 flow
-        merged_track_data = merge_track_data(
-            track_data, track_wave_data, track_wind_data, track_flow_data)
-        merged_track_data = format_history_dates(merged_track_data)
-        filtered_track_data = filter_fields(merged_track_data)
-        filtered_track_data = enrich_wind_info(filtered_track_data)
-        filtered_track_data = enrich_flow_info(filtered_track_data)
+        # era5 wave / wind / flow：一次计算网格索引，三张表并发查询，结果直接写入列式轨迹
+        track = TrackColumns.from_points(track_data, TRACK_BASE_KEYS)
+        self.era5_enricher.enrich(track)
+        enrich_wind_columns(track)
+        enrich_flow_columns(track)
+        filtered_track_data = track.to_records(TRACK_KEEP_KEYS + WIND_INFO_KEYS + FLOW_INFO_KEYS)
         # 处理数据
         if draught is None or desgin_speed is None:
             return None
@@ -797,6 +639,10 @@ class CalcVesselPerformanceDetails(BaseModel):
         #     filtered_track_data, draught, desgin_speed)
         return good_performance
 
+    def close(self):
+        self.era5_enricher.close()
+        super(CalcVesselPerformanceDetails, self).close()
+
     @decorate.exception_capture_close_datebase
     def run(self):
         # 健壮性检查：确保MongoDB连接和集合可用
@@ -4,7 +4,9 @@ from bson.py3compat import b
 import pymongo
 from pkg.public.decorator import decorate
 from pkg.public.models import BaseModel
+from pkg.db.mongo import MgoBulkWriter
 from pkg.public.logger import logger
+from pkg.db.cache import get_cache_backend, encode_value, decode_value
 import requests
 from datetime import datetime, timedelta
 from datetime import timezone
@@ -13,6 +15,7 @@ import traceback
 import os
 import time
 import json
+import hashlib
 import urllib3
 from typing import Dict, List, Any, Optional, Union
 from dataclasses import dataclass
@@ -94,11 +97,105 @@ class SpeedStats:
         self.total += speed
         self.count += 1
 
+    def merge(self, other: "SpeedStats"):
+        """合并另一个累加器（用于按天聚合后的窗口汇总）"""
+        self.total += other.total
+        self.count += other.count
+
     def average(self) -> float:
         """计算平均速度"""
         return round(self.total / self.count, 2) if self.count > 0 else 0.0
 
 
+# 好天气 / 坏天气累加器的统计维度（天气 × 载重 × 流向）
+GOOD_STATS_KEYS = (
+    'empty', 'full',
+    'empty_downstream', 'empty_upstream',
+    'full_downstream', 'full_upstream',
+    'downstream', 'upstream',
+)
+BAD_STATS_KEYS = GOOD_STATS_KEYS + (
+    'bad_weather', 'severe_weather', 'moderate_bad_weather', 'bad_weather_general',
+)
+
+# 轨迹点可能携带的时间字段（按优先级）
+TRACE_TIME_FIELDS = ("timestamp", "time", "utc", "postime")
+
+
+def new_speed_stats(keys: tuple) -> Dict[str, SpeedStats]:
+    """按统计维度初始化累加器"""
+    return {key: SpeedStats() for key in keys}
+
+
+def speed_stats_to_doc(stats: Dict[str, SpeedStats]) -> Dict[str, Dict[str, float]]:
+    """累加器 -> mongo 文档（只保存有数据的维度）"""
+    return {key: {"total": round(s.total, 4), "count": s.count}
+            for key, s in stats.items() if s.count > 0}
+
+
+def speed_stats_from_doc(doc: Dict[str, Dict[str, float]], keys: tuple) -> Dict[str, SpeedStats]:
+    """mongo 文档 -> 累加器"""
+    stats = new_speed_stats(keys)
+    for key, value in (doc or {}).items():
+        if key in stats and isinstance(value, dict):
+            stats[key] = SpeedStats(total=float(value.get("total", 0.0)),
+                                    count=int(value.get("count", 0)))
+    return stats
+
+
+def get_trace_point_ts(point: Dict[str, Any]) -> Optional[float]:
+    """
+    获取轨迹点的时间戳（秒，UTC）
+    支持秒/毫秒时间戳以及 "YYYY-MM-DD HH:MM:SS" 字符串，无法识别时返回 None
+    """
+    for field in TRACE_TIME_FIELDS:
+        value = point.get(field)
+        if value is None or value == "":
+            continue
+        try:
+            if isinstance(value, datetime):
+                if value.tzinfo is None:
+                    value = value.replace(tzinfo=timezone.utc)
+                return value.timestamp()
+            if isinstance(value, str) and not value.isdigit():
+                fmt = "%Y-%m-%d %H:%M:%S" if len(value) >= 19 else "%Y-%m-%d"
+                dt = datetime.strptime(value[:19] if len(value) >= 19 else value[:10], fmt)
+                return dt.replace(tzinfo=timezone.utc).timestamp()
+            ts = float(value)
+            return ts / 1000.0 if ts > 1e12 else ts  # 毫秒时间戳
+        except (ValueError, TypeError, OverflowError, OSError):
+            continue
+    return None
+
+
+def get_trace_point_day(point: Dict[str, Any]) -> Optional[str]:
+    """获取轨迹点所属的自然日（UTC，格式 YYYY-MM-DD），无法识别时返回 None"""
+    ts = get_trace_point_ts(point)
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+# 输入指纹版本：计算逻辑变化时递增版本号使历史指纹失效
+FINGERPRINT_VERSION = "2"
+
+
+def compute_input_fingerprint(good_stats: Dict[str, SpeedStats], bad_stats: Dict[str, SpeedStats],
+                              design_speed: float, draught: float) -> str:
+    """
+    计算性能计算输入的内容指纹
+    只取质量控制后汇总的好/坏天气速度和与次数，不含时间字段、日期键和点数，
+    轨迹整体平移（如锚泊船舶每天同样的点）时指纹不变
+    :return: sha1 十六进制字符串
+    """
+    payload = [
+        FINGERPRINT_VERSION, design_speed, draught,
+        {key: [round(s.total, 2), s.count] for key, s in good_stats.items() if s.count > 0},
+        {key: [round(s.total, 2), s.count] for key, s in bad_stats.items() if s.count > 0},
+    ]
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
 def is_valid_current_data(current_u: Any, current_v: Any) -> bool:
     """验证洋流数据的有效性"""
     try:
@@ -823,6 +920,12 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
         self.calc_days = int(os.getenv('CALC_DAYS', "180"))  # 计算天数
         self.interval_hour = os.getenv('TRACE_INTERVAL_HOUR', "6")  # 轨迹间隔小时数
         self.api_key = os.getenv('API_KEY', "266102ea-ca32-4ad8-8292-17c952a81a56")
+        # 按天增量聚合：只拉取缺失的天数，与已保存的每日统计合并成滚动窗口
+        self.incremental_agg = int(os.getenv('INCREMENTAL_AGG', "1"))
+        self.daily_stats_collection = os.getenv(
+            'DAILY_STATS_COLLECTION', "global_vessels_performance_daily_stats")
+        # 轨迹缓存（TRACE_CACHE=disk|redis），按 (mmsi, interval_hour, 自然日) 分桶
+        self.trace_cache = get_cache_backend("trace")
 
         if self.vessel_types:
             self.vessel_types = self.vessel_types.split(",")
@@ -839,6 +942,12 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
 
         super(CalcVesselPerformanceDetailsFromWmy, self).__init__(config)
 
+        # 结果与状态标记批量回写（无序 bulk_write）
+        self.write_batch_size = int(os.getenv('WRITE_BATCH_SIZE', "200"))
+        self.bulk_writer = MgoBulkWriter(self.mgo_db, batch_size=self.write_batch_size)
+        # 输入轨迹指纹未变化时跳过计算
+        self.skip_unchanged = int(os.getenv('SKIP_UNCHANGED', "1"))
+
         # 配置连接池以提高连接稳定性
         self.session = requests.Session()
         adapter = requests.adapters.HTTPAdapter(
@@ -905,98 +1014,86 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
                 logger.error(f"好天气数据一致性验证失败: {e}")
                 # 继续处理，不中断
 
-        # 设计吃水深度阈值
-        EMPTY_LOAD = DESIGN_DRAFT * 0.7  # 70%
-        FULL_LOAD = DESIGN_DRAFT * 0.8   # 80%
+        # 初始化累加器并逐点统计
+        stats = new_speed_stats(GOOD_STATS_KEYS)
+        valid_count = 0
+        for item in filtered_data:
+            if self.accumulate_good_point(stats, item, DESIGN_DRAFT, DESIGN_SPEED):
+                valid_count += 1
 
-        # 初始化累加器
-        stats = {
-            'empty': SpeedStats(),           # 空载统计
-            'full': SpeedStats(),            # 满载统计
-            'empty_downstream': SpeedStats(),  # 空载顺流
-            'empty_upstream': SpeedStats(),   # 空载逆流
-            'full_downstream': SpeedStats(),  # 满载顺流
-            'full_upstream': SpeedStats(),    # 满载逆流
-            'downstream': SpeedStats(),       # 总体顺流
-            'upstream': SpeedStats(),         # 总体逆流
-        }
+        # 检查有效数据量
+        if valid_count < 5:  # 至少需要5个有效数据点
+            log_warning(f"MMSI 好天气计算 - 有效数据点不足({valid_count})，可能影响统计准确性")
 
-        # 数据预处理和验证
-        valid_data = []
-        for item in filtered_data:
-            try:
-                # 基础数据验证（已在过滤阶段完成，这里做二次验证）
-                # 支持 wind_level 和 wave_level（优先）或 wave_height
-                required_fields = ["wind_level", "hdg", "sog", "draught"]
-                if not all(is_valid_type(item.get(field)) for field in required_fields):
-                    continue
-                
-                # 检查是否有 wave_level 或 wave_height
-                if not is_valid_type(item.get("wave_level")) and not is_valid_type(item.get("wave_height")):
-                    continue
+        return self.build_good_performance(stats, DESIGN_SPEED)
 
-                # 数值转换和范围验证
-                sog = float(item.get("sog", 0.0))
-                draught = float(item.get("draught"))
-                hdg = float(item.get("hdg"))
+    def accumulate_good_point(self, stats: Dict[str, SpeedStats], item: Dict[str, Any],
+                              DESIGN_DRAFT: float, DESIGN_SPEED: float) -> bool:
+        """
+        将单个轨迹点累加到好天气统计中
+        :return: 该点是否为有效的好天气数据点
+        """
+        try:
+            # 基础数据验证（已在过滤阶段完成，这里做二次验证）
+            # 支持 wind_level 和 wave_level（优先）或 wave_height
+            required_fields = ["wind_level", "hdg", "sog", "draught"]
+            if not all(is_valid_type(item.get(field)) for field in required_fields):
+                return False
 
-                # 使用新的 is_good_weather 函数，严格按照租约规定的4级风3级浪标准
-                # 好天气条件：风力等级 <= 4 且 波浪等级 <= 3
-                if not is_good_weather(item):
-                    continue
+            # 检查是否有 wave_level 或 wave_height
+            if not is_valid_type(item.get("wave_level")) and not is_valid_type(item.get("wave_height")):
+                return False
 
-                # 条件筛选：必须是好天气且船速合理
-                if sog >= DESIGN_SPEED * 0.5:
-                    valid_data.append({
-                        'draught': draught,
-                        'sog': sog,
-                        'hdg': hdg,
-                        'current_u': item.get("current_u"),
-                        'current_v': item.get("current_v")
-                    })
-            except (ValueError, TypeError):
-                continue
+            # 数值转换和范围验证
+            sog = float(item.get("sog", 0.0))
+            draught = float(item.get("draught"))
+            hdg = float(item.get("hdg"))
 
-        # 检查有效数据量
-        if len(valid_data) < 5:  # 至少需要5个有效数据点
-            log_warning(f"MMSI 好天气计算 - 有效数据点不足({len(valid_data)})，可能影响统计准确性")
-
-        # 处理有效数据
-        for item in valid_data:
-            draught = item['draught']
-            sog = item['sog']
-            hdg = item['hdg']
-            current_u = item['current_u']
-            current_v = item['current_v']
-
-            # 判断载重状态
-            is_empty = draught < EMPTY_LOAD
-            is_full = draught > FULL_LOAD
-
-            # 判断流向（如果有洋流数据）
-            is_downstream = False
-            if is_valid_current_data(current_u, current_v):
-                is_downstream = is_sailing_downstream(
-                    float(current_u), float(current_v), hdg)
-
-            # 更新统计
-            if is_empty:
-                stats['empty'].add(sog)
-                if is_downstream:
-                    stats['empty_downstream'].add(sog)
-                    stats['downstream'].add(sog)
-                else:
-                    stats['empty_upstream'].add(sog)
-                    stats['upstream'].add(sog)
-            elif is_full:
-                stats['full'].add(sog)
-                if is_downstream:
-                    stats['full_downstream'].add(sog)
-                    stats['downstream'].add(sog)
-                else:
-                    stats['full_upstream'].add(sog)
-                    stats['upstream'].add(sog)
+            # 使用新的 is_good_weather 函数，严格按照租约规定的4级风3级浪标准
+            # 好天气条件：风力等级 <= 4 且 波浪等级 <= 3
+            if not is_good_weather(item):
+                return False
 
+            # 条件筛选：必须是好天气且船速合理
+            if sog < DESIGN_SPEED * 0.5:
+                return False
+        except (ValueError, TypeError):
+            return False
+
+        current_u = item.get("current_u")
+        current_v = item.get("current_v")
+
+        # 判断载重状态（设计吃水深度阈值 70% / 80%）
+        is_empty = draught < DESIGN_DRAFT * 0.7
+        is_full = draught > DESIGN_DRAFT * 0.8
+
+        # 判断流向（如果有洋流数据）
+        is_downstream = False
+        if is_valid_current_data(current_u, current_v):
+            is_downstream = is_sailing_downstream(
+                float(current_u), float(current_v), hdg)
+
+        # 更新统计
+        if is_empty:
+            stats['empty'].add(sog)
+            if is_downstream:
+                stats['empty_downstream'].add(sog)
+                stats['downstream'].add(sog)
+            else:
+                stats['empty_upstream'].add(sog)
+                stats['upstream'].add(sog)
+        elif is_full:
+            stats['full'].add(sog)
+            if is_downstream:
+                stats['full_downstream'].add(sog)
+                stats['downstream'].add(sog)
+            else:
+                stats['full_upstream'].add(sog)
+                stats['upstream'].add(sog)
+        return True
+
+    def build_good_performance(self, stats: Dict[str, SpeedStats], DESIGN_SPEED: float) -> Dict[str, float]:
+        """根据好天气累加器构建性能结果"""
         # 构建结果
         performance = {
             "avg_good_weather_speed": round(
@@ -1102,115 +1199,95 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
                 logger.error(f"坏天气数据一致性验证失败: {e}")
                 # 继续处理，不中断
 
-        # 设计吃水深度阈值
-        EMPTY_LOAD = DESIGN_DRAFT * 0.7  # 70%
-        FULL_LOAD = DESIGN_DRAFT * 0.8   # 80%
+        # 初始化累加器并逐点统计
+        stats = new_speed_stats(BAD_STATS_KEYS)
+        valid_count = 0
+        for item in filtered_data:
+            if self.accumulate_bad_point(stats, item, DESIGN_DRAFT, DESIGN_SPEED):
+                valid_count += 1
 
-        # 初始化累加器
-        stats = {
-            'bad_weather': SpeedStats(),           # 坏天气总体统计
-            'empty': SpeedStats(),                  # 空载统计
-            'full': SpeedStats(),                   # 满载统计
-            'empty_downstream': SpeedStats(),       # 空载顺流
-            'empty_upstream': SpeedStats(),        # 空载逆流
-            'full_downstream': SpeedStats(),       # 满载顺流
-            'full_upstream': SpeedStats(),         # 满载逆流
-            'downstream': SpeedStats(),            # 总体顺流
-            'upstream': SpeedStats(),              # 总体逆流
-            'severe_weather': SpeedStats(),        # 严重坏天气统计
-            'moderate_bad_weather': SpeedStats(),  # 中等坏天气统计
-            'bad_weather_general': SpeedStats(),   # 一般坏天气统计
-        }
+        # 检查有效数据量
+        if valid_count < 3:  # 坏天气数据至少需要3个有效数据点
+            log_warning(f"MMSI 坏天气计算 - 有效数据点不足({valid_count})，可能影响统计准确性")
 
-        # 数据预处理和验证
-        valid_data = []
-        for item in filtered_data:
-            try:
-                # 基础数据验证（已在过滤阶段完成，这里做二次验证）
-                if not all(is_valid_type(item.get(field)) for field in ["wind_level", "wave_height", "hdg", "sog", "draught"]):
-                    continue
+        return self.build_bad_performance(stats, DESIGN_SPEED)
 
-                # 数值转换和范围验证
-                wind_level = int(item.get("wind_level", 5))
-                wave_height = float(item.get("wave_height", 1.26))
-                sog = float(item.get("sog", 0.0))
-                draught = float(item.get("draught"))
-                hdg = float(item.get("hdg"))
-
-                # 使用天气分类函数判断坏天气条件
-                weather_info = classify_weather_conditions(
-                    wind_level, wave_height)
-                is_bad_weather = weather_info['weather_type'] in [
-                    'bad', 'moderate_bad', 'severe_bad']
-                weather_severity = weather_info['weather_type']
-
-                # 确保船舶在航行状态且是坏天气
-                if is_bad_weather and sog >= DESIGN_SPEED * 0.3:
-                    valid_data.append({
-                        'draught': draught,
-                        'sog': sog,
-                        'hdg': hdg,
-                        'current_u': item.get("current_u"),
-                        'current_v': item.get("current_v"),
-                        'wind_level': wind_level,
-                        'wave_height': wave_height,
-                        'weather_severity': weather_severity
-                    })
-            except (ValueError, TypeError):
-                continue
+    def accumulate_bad_point(self, stats: Dict[str, SpeedStats], item: Dict[str, Any],
+                             DESIGN_DRAFT: float, DESIGN_SPEED: float) -> bool:
+        """
+        将单个轨迹点累加到坏天气统计中
+        :return: 该点是否为有效的坏天气数据点
+        """
+        try:
+            # 基础数据验证（已在过滤阶段完成，这里做二次验证）
+            if not all(is_valid_type(item.get(field)) for field in ["wind_level", "wave_height", "hdg", "sog", "draught"]):
+                return False
 
-        # 检查有效数据量
-        if len(valid_data) < 3:  # 坏天气数据至少需要3个有效数据点
-            log_warning(f"MMSI 坏天气计算 - 有效数据点不足({len(valid_data)})，可能影响统计准确性")
-
-        # 处理有效数据
-        for item in valid_data:
-            draught = item['draught']
-            sog = item['sog']
-            hdg = item['hdg']
-            current_u = item['current_u']
-            current_v = item['current_v']
-            weather_severity = item['weather_severity']
-
-            # 判断载重状态
-            is_empty = draught < EMPTY_LOAD
-            is_full = draught > FULL_LOAD
-
-            # 判断流向（如果有洋流数据）
-            is_downstream = False
-            if is_valid_current_data(current_u, current_v):
-                is_downstream = is_sailing_downstream(
-                    float(current_u), float(current_v), hdg)
-
-            # 更新总体坏天气统计
-            stats['bad_weather'].add(sog)
-
-            # 更新天气严重程度统计
-            if weather_severity == "severe_bad":
-                stats['severe_weather'].add(sog)
-            elif weather_severity == "moderate_bad":
-                stats['moderate_bad_weather'].add(sog)
-            elif weather_severity == "bad":
-                stats['bad_weather_general'].add(sog)
-
-            # 更新载重相关统计
-            if is_empty:
-                stats['empty'].add(sog)
-                if is_downstream:
-                    stats['empty_downstream'].add(sog)
-                    stats['downstream'].add(sog)
-                else:
-                    stats['empty_upstream'].add(sog)
-                    stats['upstream'].add(sog)
-            elif is_full:
-                stats['full'].add(sog)
-                if is_downstream:
-                    stats['full_downstream'].add(sog)
-                    stats['downstream'].add(sog)
-                else:
-                    stats['full_upstream'].add(sog)
-                    stats['upstream'].add(sog)
+            # 数值转换和范围验证
+            wind_level = int(item.get("wind_level", 5))
+            wave_height = float(item.get("wave_height", 1.26))
+            sog = float(item.get("sog", 0.0))
+            draught = float(item.get("draught"))
+            hdg = float(item.get("hdg"))
+
+            # 使用天气分类函数判断坏天气条件
+            weather_info = classify_weather_conditions(
+                wind_level, wave_height)
+            weather_severity = weather_info['weather_type']
+            is_bad_weather = weather_severity in [
+                'bad', 'moderate_bad', 'severe_bad']
+
+            # 确保船舶在航行状态且是坏天气
+            if not is_bad_weather or sog < DESIGN_SPEED * 0.3:
+                return False
+        except (ValueError, TypeError):
+            return False
+
+        current_u = item.get("current_u")
+        current_v = item.get("current_v")
+
+        # 判断载重状态（设计吃水深度阈值 70% / 80%）
+        is_empty = draught < DESIGN_DRAFT * 0.7
+        is_full = draught > DESIGN_DRAFT * 0.8
 
+        # 判断流向（如果有洋流数据）
+        is_downstream = False
+        if is_valid_current_data(current_u, current_v):
+            is_downstream = is_sailing_downstream(
+                float(current_u), float(current_v), hdg)
+
+        # 更新总体坏天气统计
+        stats['bad_weather'].add(sog)
+
+        # 更新天气严重程度统计
+        if weather_severity == "severe_bad":
+            stats['severe_weather'].add(sog)
+        elif weather_severity == "moderate_bad":
+            stats['moderate_bad_weather'].add(sog)
+        elif weather_severity == "bad":
+            stats['bad_weather_general'].add(sog)
+
+        # 更新载重相关统计
+        if is_empty:
+            stats['empty'].add(sog)
+            if is_downstream:
+                stats['empty_downstream'].add(sog)
+                stats['downstream'].add(sog)
+            else:
+                stats['empty_upstream'].add(sog)
+                stats['upstream'].add(sog)
+        elif is_full:
+            stats['full'].add(sog)
+            if is_downstream:
+                stats['full_downstream'].add(sog)
+                stats['downstream'].add(sog)
+            else:
+                stats['full_upstream'].add(sog)
+                stats['upstream'].add(sog)
+        return True
+
+    def build_bad_performance(self, stats: Dict[str, SpeedStats], DESIGN_SPEED: float) -> Dict[str, float]:
+        """根据坏天气累加器构建性能结果，并参考好天气速度做合理性修正"""
         # 构建结果
         performance = {
             # === 坏天气总体性能 ===
@@ -1466,14 +1543,14 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
 
         return performance
 
-    def get_vessel_trace(self, mmsi: int, start_time: int, end_time: int, max_retries: int = 3) -> List[Dict[str, Any]]:
+    def request_vessel_trace(self, mmsi: int, start_time: int, end_time: int, max_retries: int = 3) -> Optional[List[Dict[str, Any]]]:
         """
-        获取船舶轨迹数据（简化版，单次调用，带重试机制）
+        请求 WMY 轨迹接口（单次调用，带重试机制）
         :param mmsi: 船舶MMSI号
         :param start_time: 开始时间戳（秒）
         :param end_time: 结束时间戳（秒）
         :param max_retries: 最大重试次数
-        :return: 轨迹数据列表
+        :return: 轨迹数据列表，请求失败时返回 None（与"该时段无轨迹"区分，避免缓存失败结果）
         """
         url = f"{self.wmy_url}:{self.wmy_url_port}/api/vessel/trace?api_key={self.api_key}"
         
@@ -1487,7 +1564,7 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
             })
         except (TypeError, ValueError) as e:
             logger.warning(f"MMSI {mmsi} 构造请求体失败: {e}")
-            return []
+            return None
         
         headers = {
             'Content-Type': 'application/json'
@@ -1511,7 +1588,7 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
                         time.sleep(1 * (attempt + 1))  # 递增延迟
                         continue
                     logger.warning(f"MMSI {mmsi} API请求失败，状态码: {response.status_code}")
-                    return []
+                    return None
                 
                 # 解析响应
                 try:
@@ -1521,14 +1598,14 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
                         time.sleep(1 * (attempt + 1))
                         continue
                     logger.warning(f"MMSI {mmsi} 响应JSON解析失败: {e}")
-                    return []
+                    return None
                 
                 # 检查响应状态
                 if response_data.get("state", {}).get("code") == 0:
                     data = response_data.get("data", [])
                     if not isinstance(data, list):
                         logger.warning(f"MMSI {mmsi} API返回数据格式错误，期望列表")
-                        return []
+                        return None
                     
                     # 验证返回的数据质量
                     if len(data) == 0:
@@ -1549,28 +1626,274 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
                         time.sleep(1 * (attempt + 1))
                         continue
                     logger.warning(f"MMSI {mmsi} API返回错误: {error_msg}")
-                    return []
+                    return None
                     
             except requests.exceptions.Timeout:
                 if attempt < max_retries - 1:
                     time.sleep(2 * (attempt + 1))  # 超时重试延迟更长
                     continue
                 logger.warning(f"MMSI {mmsi} API请求超时（已重试{max_retries}次）")
-                return []
+                return None
             except requests.exceptions.RequestException as e:
                 if attempt < max_retries - 1:
                     time.sleep(1 * (attempt + 1))
                     continue
                 logger.warning(f"MMSI {mmsi} API请求异常: {str(e)[:100]}")
-                return []
+                return None
             except Exception as e:
                 if attempt < max_retries - 1:
                     time.sleep(1 * (attempt + 1))
                     continue
                 logger.warning(f"MMSI {mmsi} 获取轨迹数据时发生未知错误: {e}")
-                return []
+                return None
         
-        return []
+        return None
+
+    def get_vessel_trace(self, mmsi: int, start_time: int, end_time: int, max_retries: int = 3) -> Optional[List[Dict[str, Any]]]:
+        """
+        获取船舶轨迹数据
+        启用轨迹缓存时按自然日分桶读取缓存，只请求缓存缺失的时间段；只有完整的自然日才写入缓存
+        :return: 轨迹数据列表（没有轨迹点时为空列表），请求失败时返回 None
+        """
+        if self.trace_cache is None:
+            return self.request_vessel_trace(mmsi, start_time, end_time, max_retries)
+
+        day_seconds = 24 * 3600
+        complete_before = min(end_time, int(time.time()))
+        first_day = start_time - start_time % day_seconds
+        day_points = {}
+        missing_ranges = []
+        for day_start in range(first_day, end_time + 1, day_seconds):
+            points = None
+            if day_start + day_seconds <= complete_before:
+                points = self.get_cached_trace_day(mmsi, day_start)
+            if points is not None:
+                day_points[day_start] = points
+            elif missing_ranges and missing_ranges[-1][1] == day_start:
+                missing_ranges[-1][1] = day_start + day_seconds
+            else:
+                missing_ranges.append([day_start, day_start + day_seconds])
+        hit_days = len(day_points)
+
+        for range_start, range_end in missing_ranges:
+            points = self.request_vessel_trace(mmsi, range_start, min(range_end, end_time), max_retries)
+            if points is None:
+                return None
+            fetched = {}
+            for point in points:
+                ts = get_trace_point_ts(point)
+                if ts is None:
+                    log_debug(f"MMSI {mmsi} 轨迹点缺少时间字段，跳过轨迹缓存")
+                    return self.request_vessel_trace(mmsi, start_time, end_time, max_retries)
+                fetched.setdefault(int(ts) - int(ts) % day_seconds, []).append(point)
+            for day_start in range(range_start, range_end, day_seconds):
+                day_points[day_start] = fetched.get(day_start, [])
+                if day_start + day_seconds <= complete_before:
+                    self.set_cached_trace_day(mmsi, day_start, day_points[day_start])
+
+        log_debug(f"MMSI {mmsi} 轨迹缓存: 命中 {hit_days} 天, 请求 {len(missing_ranges)} 段")
+        trace = []
+        for day_start in sorted(day_points):
+            for point in day_points[day_start]:
+                ts = get_trace_point_ts(point)
+                if ts is not None and start_time <= ts <= end_time:
+                    trace.append(point)
+        return trace
+
+    def get_trace_cache_key(self, mmsi: int, day_start: int) -> str:
+        day = datetime.fromtimestamp(day_start, tz=timezone.utc).strftime("%Y%m%d")
+        return f"{mmsi}:{self.interval_hour}:{day}"
+
+    def get_cached_trace_day(self, mmsi: int, day_start: int) -> Optional[List[Dict[str, Any]]]:
+        """读取某一自然日的缓存轨迹，未命中返回 None"""
+        try:
+            data = self.trace_cache.get(self.get_trace_cache_key(mmsi, day_start))
+            return decode_value(data) if data is not None else None
+        except Exception as e:
+            logger.warning(f"MMSI {mmsi} 读取轨迹缓存失败: {e}")
+            return None
+
+    def set_cached_trace_day(self, mmsi: int, day_start: int, points: List[Dict[str, Any]]):
+        """写入某一自然日的轨迹缓存（压缩）"""
+        try:
+            self.trace_cache.set(self.get_trace_cache_key(mmsi, day_start), encode_value(points))
+        except Exception as e:
+            logger.warning(f"MMSI {mmsi} 写入轨迹缓存失败: {e}")
+
+    def build_daily_perf_stats(self, data: List[Dict[str, Any]], DESIGN_DRAFT: float,
+                               DESIGN_SPEED: float) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        将轨迹数据按自然日（UTC）汇总为好/坏天气的充分统计量（次数与速度和）
+        :return: {day: {"points": n, "good": {...}, "bad": {...}}}，轨迹点缺少时间字段时返回 None
+        """
+        if not data:
+            return {}
+
+        try:
+            filtered_data = enhanced_data_quality_control(data, DESIGN_SPEED)
+        except Exception as e:
+            logger.error(f"按天聚合数据质量控制失败: {e}")
+            filtered_data = data
+
+        daily = {}
+        for item in filtered_data:
+            day = get_trace_point_day(item)
+            if day is None:
+                log_debug("按天聚合 - 轨迹点缺少时间字段，回退为全量计算")
+                return None
+            bucket = daily.get(day)
+            if bucket is None:
+                bucket = daily[day] = {
+                    "points": 0,
+                    "good": new_speed_stats(GOOD_STATS_KEYS),
+                    "bad": new_speed_stats(BAD_STATS_KEYS),
+                }
+            bucket["points"] += 1
+            self.accumulate_good_point(bucket["good"], item, DESIGN_DRAFT, DESIGN_SPEED)
+            self.accumulate_bad_point(bucket["bad"], item, DESIGN_DRAFT, DESIGN_SPEED)
+
+        return {
+            day: {
+                "points": bucket["points"],
+                "good": speed_stats_to_doc(bucket["good"]),
+                "bad": speed_stats_to_doc(bucket["bad"]),
+            }
+            for day, bucket in daily.items()
+        }
+
+    def load_daily_perf_stats(self, imo: int, draught: float, design_speed: float) -> Optional[Dict[str, Any]]:
+        """
+        读取船舶已保存的每日统计；设计吃水或设计航速变化时统计口径失效，返回 None
+        """
+        try:
+            doc = self.mgo_db[self.daily_stats_collection].find_one({"imo": imo}, {"_id": 0})
+        except Exception as e:
+            logger.warning(f"IMO {imo} 读取每日统计失败: {e}")
+            return None
+        if not doc or not doc.get("days"):
+            return None
+        try:
+            if float(doc.get("draught", 0)) != float(draught) or float(doc.get("design_speed", 0)) != float(design_speed):
+                log_debug(f"IMO {imo} 设计吃水/航速已变化，每日统计失效")
+                return None
+        except (ValueError, TypeError):
+            return None
+        return doc
+
+    def get_window_start_day(self, end_time: int) -> str:
+        """滚动窗口的起始日（含）"""
+        start = datetime.fromtimestamp(end_time, tz=timezone.utc) - timedelta(days=self.calc_days)
+        return start.strftime("%Y-%m-%d")
+
+    def get_incremental_start_time(self, daily_doc: Optional[Dict[str, Any]], end_time: int) -> int:
+        """
+        计算本次需要拉取轨迹的起始时间戳
+        已有每日统计时从最后一天的 0 点开始重新拉取（最后一天可能不完整），否则拉取完整窗口
+        """
+        full_start_time = end_time - self.calc_days * 24 * 3600
+        if not daily_doc:
+            return full_start_time
+        last_day = max(daily_doc["days"].keys())
+        if last_day < self.get_window_start_day(end_time):
+            return full_start_time
+        last_day_start = int(datetime.strptime(last_day, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+        return max(full_start_time, last_day_start)
+
+    def merge_daily_perf_stats(self, daily_doc: Optional[Dict[str, Any]], new_days: Dict[str, Dict[str, Any]],
+                               start_time: int, end_time: int) -> Dict[str, Dict[str, Any]]:
+        """
+        合并已保存的每日统计与新拉取的每日统计，并裁剪到滚动窗口
+        新拉取范围内的天数以新数据为准
+        """
+        window_start_day = self.get_window_start_day(end_time)
+        fetch_start_day = datetime.fromtimestamp(start_time, tz=timezone.utc).strftime("%Y-%m-%d")
+        merged = {}
+        if daily_doc:
+            for day, bucket in daily_doc.get("days", {}).items():
+                if window_start_day <= day < fetch_start_day:
+                    merged[day] = bucket
+        for day, bucket in new_days.items():
+            if day >= window_start_day:
+                merged[day] = bucket
+        return merged
+
+    def save_daily_perf_stats(self, imo: int, mmsi: int, draught: float, design_speed: float,
+                              days: Dict[str, Dict[str, Any]]):
+        """保存船舶的每日统计（整体替换，批量写入）"""
+        self.bulk_writer.add(self.daily_stats_collection, pymongo.UpdateOne(
+            {"imo": imo},
+            {"$set": {
+                "imo": imo,
+                "mmsi": mmsi,
+                "draught": draught,
+                "design_speed": design_speed,
+                "days": days,
+                "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }},
+            upsert=True))
+
+    def mark_vessel_perf_calculated(self, imo: int, mmsi: int, success: bool):
+        """标记 global_vessels 的计算状态与时间（批量写入）"""
+        filter_condition = {"imo": imo} if imo else {"mmsi": mmsi}
+        self.bulk_writer.add("global_vessels", pymongo.UpdateOne(filter_condition, {"$set": {
+            "perf_calculated": 1 if success else 0,
+            "perf_calculated_updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }}))
+
+    def is_input_unchanged(self, imo: int, input_fingerprint: str) -> bool:
+        """与上次成功计算的输入指纹比较"""
+        try:
+            doc = self.mgo_db["global_vessels_performance_details"].find_one(
+                {"imo": imo}, {"input_fingerprint": 1, "perf_calculated": 1, "_id": 0})
+        except Exception as e:
+            logger.warning(f"IMO {imo} 读取输入指纹失败: {e}")
+            return False
+        return bool(doc) and doc.get("perf_calculated") == 1 and doc.get("input_fingerprint") == input_fingerprint
+
+    def refresh_unchanged_vessel(self, imo: int, mmsi: int):
+        """输入未变化：只刷新结果和船舶状态的时间戳"""
+        self.bulk_writer.add("global_vessels_performance_details", pymongo.UpdateOne(
+            {"imo": imo},
+            {"$set": {"updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}}))
+        self.mark_vessel_perf_calculated(imo, mmsi, True)
+
+    def merge_daily_speed_stats(self, days: Dict[str, Dict[str, Any]]) -> "tuple[Dict[str, SpeedStats], Dict[str, SpeedStats]]":
+        """将滚动窗口内的每日统计合并为好/坏天气累加器"""
+        good_stats = new_speed_stats(GOOD_STATS_KEYS)
+        bad_stats = new_speed_stats(BAD_STATS_KEYS)
+        for bucket in days.values():
+            for key, s in speed_stats_from_doc(bucket.get("good"), GOOD_STATS_KEYS).items():
+                good_stats[key].merge(s)
+            for key, s in speed_stats_from_doc(bucket.get("bad"), BAD_STATS_KEYS).items():
+                bad_stats[key].merge(s)
+        return good_stats, bad_stats
+
+    def accumulate_trace_speed_stats(self, data: List[Dict[str, Any]], DESIGN_DRAFT: float,
+                                     DESIGN_SPEED: float) -> "tuple[Dict[str, SpeedStats], Dict[str, SpeedStats]]":
+        """全量模式：对轨迹做质量控制后累加为好/坏天气累加器（口径与 deal_good/bad_perf_list 一致）"""
+        try:
+            filtered_data = enhanced_data_quality_control(data, DESIGN_SPEED)
+        except Exception as e:
+            logger.error(f"输入指纹数据质量控制失败: {e}")
+            filtered_data = data
+
+        good_stats = new_speed_stats(GOOD_STATS_KEYS)
+        bad_stats = new_speed_stats(BAD_STATS_KEYS)
+        for item in filtered_data:
+            self.accumulate_good_point(good_stats, item, DESIGN_DRAFT, DESIGN_SPEED)
+            self.accumulate_bad_point(bad_stats, item, DESIGN_DRAFT, DESIGN_SPEED)
+        return good_stats, bad_stats
+
+    def calc_performance_from_daily_stats(self, days: Dict[str, Dict[str, Any]], design_speed: float) -> "tuple[Dict[str, float], Dict[str, float]]":
+        """
+        将滚动窗口内的每日统计汇总，构建与 deal_good_perf_list / deal_bad_perf_list 相同结构的结果
+        """
+        good_stats, bad_stats = self.merge_daily_speed_stats(days)
+
+        # 先构建好天气结果，坏天气修正依赖 last_good_weather_speed
+        good_performance = self.build_good_performance(good_stats, design_speed)
+        bad_performance = self.build_bad_performance(bad_stats, design_speed)
+        return good_performance, bad_performance
 
     @decorate.exception_capture_close_datebase
     def run(self):
@@ -1586,7 +1909,8 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
             'calculation_errors': 0,  # 计算错误
             'validation_failed': 0,  # 验证失败
             'save_errors': 0,  # 保存错误
-            'data_quality_warnings': 0  # 数据质量警告
+            'data_quality_warnings': 0,  # 数据质量警告
+            'unchanged_skipped': 0  # 输入未变化跳过计算
         }
         
         try:
@@ -1753,6 +2077,14 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
                 }
             ]
             
+            if self.incremental_agg:
+                try:
+                    self.mgo_db[self.daily_stats_collection].create_index(
+                        [("imo", pymongo.ASCENDING)], unique=True,
+                        name=f"{self.daily_stats_collection}_uniq_idx")
+                except Exception as e:
+                    logger.warning(f"创建每日统计索引失败: {e}")
+
             try:
                 # 直接获取游标，逐个处理，设置超时和其他选项
                 vessels_cursor = self.mgo_db["global_vessels"].aggregate(
@@ -1794,33 +2126,90 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
                             logger.warning(f"[{num}/{total_num}] MMSI {mmsi} 计算失败：数据不完整（缺少IMO、吃水或设计速度）")
                             # 直接更新数据库，标记为失败
                             try:
-                                filter_condition = {"imo": imo} if imo else {"mmsi": mmsi}
-                                update_data = {"$set": {
-                                    "perf_calculated": 0,
-                                    "perf_calculated_updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                                }}
-                                self.mgo_db["global_vessels"].update_one(filter_condition, update_data)
+                                self.mark_vessel_perf_calculated(imo, mmsi, False)
                             except Exception as e:
                                 logger.error(f"[{num}/{total_num}] MMSI {mmsi} 更新失败状态时出错: {e}")
                             total_failed_count += 1
                             continue
 
                         try:
-                            start_time = int(time.time()) - self.calc_days * 24 * 3600
                             end_time = int(time.time())
+                            full_start_time = end_time - self.calc_days * 24 * 3600
+                            start_time = full_start_time
                         except Exception as e:
                             logger.error(f"[{num}/{total_num}] MMSI {mmsi} 计算时间戳失败: {e}")
                             total_failed_count += 1
                             continue
-                        
+
+                        # 按天增量聚合：已有每日统计时只拉取缺失的天数
+                        daily_doc = None
+                        if self.incremental_agg:
+                            daily_doc = self.load_daily_perf_stats(imo, draught, design_speed)
+                            start_time = self.get_incremental_start_time(daily_doc, end_time)
+
                         try:
                             trace = self.get_vessel_trace(mmsi, start_time, end_time)
                         except Exception as e:
                             logger.error(f"[{num}/{total_num}] MMSI {mmsi} 获取轨迹数据异常: {e}")
-                            trace = []
+                            trace = None
+
+                        window_days = None  # 滚动窗口内的每日统计（仅增量模式）
+                        window_point_count = 0
+                        # 拉取失败时不能合并/保存每日统计（会截断已保存的窗口），直接标记失败
+                        if self.incremental_agg and trace is not None:
+                            try:
+                                new_days = self.build_daily_perf_stats(trace, draught, design_speed)
+                                if new_days is None and start_time != full_start_time:
+                                    # 轨迹点无法按天归档，回退为全量拉取
+                                    start_time = full_start_time
+                                    trace = self.get_vessel_trace(mmsi, start_time, end_time)
+                                elif new_days is not None:
+                                    window_days = self.merge_daily_perf_stats(
+                                        daily_doc, new_days, start_time, end_time)
+                                    self.save_daily_perf_stats(imo, mmsi, draught, design_speed, window_days)
+                                    window_point_count = sum(
+                                        day.get("points", 0) for day in window_days.values())
+                                    log_debug(f"[{num}/{total_num}] MMSI {mmsi} 增量聚合: 新拉取={len(trace)}点/{len(new_days)}天, 窗口={len(window_days)}天/{window_point_count}点")
+                            except Exception as e:
+                                logger.error(f"[{num}/{total_num}] MMSI {mmsi} 按天增量聚合失败，回退为全量计算: {e}")
+                                window_days = None
+                                if start_time != full_start_time:
+                                    start_time = full_start_time
+                                    trace = self.get_vessel_trace(mmsi, start_time, end_time)
+
+                        if trace is None:
+                            logger.warning(f"[{num}/{total_num}] MMSI {mmsi} 计算失败：未获取到轨迹数据")
+                            stats['no_trace_data'] += 1
+                            try:
+                                self.mark_vessel_perf_calculated(imo, mmsi, False)
+                            except Exception as e:
+                                logger.error(f"[{num}/{total_num}] MMSI {mmsi} 更新失败状态时出错: {e}")
+                            total_failed_count += 1
+                            continue
+
+                        # 输入未变化（如锚泊/闲置船舶）时跳过计算，只刷新时间戳
+                        input_fingerprint = None
+                        good_stats = bad_stats = None  # 全量模式下计算指纹时已累加的统计，未命中时直接复用
+                        if self.skip_unchanged and (trace or window_days):
+                            if window_days is not None:
+                                good_stats, bad_stats = self.merge_daily_speed_stats(window_days)
+                            else:
+                                good_stats, bad_stats = self.accumulate_trace_speed_stats(trace, draught, design_speed)
+                            input_fingerprint = compute_input_fingerprint(good_stats, bad_stats, design_speed, draught)
+                            if self.is_input_unchanged(imo, input_fingerprint):
+                                self.refresh_unchanged_vessel(imo, mmsi)
+                                stats['unchanged_skipped'] += 1
+                                success_count += 1
+                                log_info(f"[{num}/{total_num}] MMSI {mmsi} 输入轨迹未变化，跳过计算")
+                                continue
 
                         # 验证轨迹数据
-                        if trace:
+                        if window_days is not None:
+                            if window_point_count < 5:
+                                logger.warning(f"[{num}/{total_num}] MMSI {mmsi} 窗口内有效轨迹数据点过少（{window_point_count}），跳过计算")
+                                window_days = None
+                                trace = []
+                        elif trace:
                             # 验证轨迹数据的基本质量
                             trace_count = len(trace)
                             if trace_count < 10:
@@ -1844,30 +2233,66 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
                         current_good_weather_performance = None
                         current_bad_weather_performance = None
 
-                        if trace:
-                            try:
-                                current_good_weather_performance = self.deal_good_perf_list(
-                                    trace, draught, design_speed)
-                            except Exception as e:
-                                logger.error(f"[{num}/{total_num}] MMSI {mmsi} 处理好天气性能数据失败: {e}")
-                                stats['calculation_errors'] += 1
-                                current_good_weather_performance = {
-                                    "avg_good_weather_speed": 0.0,
-                                    "avg_downstream_speed": 0.0,
-                                    "avg_non_downstream_speed": 0.0
-                                }
-                            
-                            try:
-                                current_bad_weather_performance = self.deal_bad_perf_list(
-                                    trace, draught, design_speed)
-                            except Exception as e:
-                                logger.error(f"[{num}/{total_num}] MMSI {mmsi} 处理坏天气性能数据失败: {e}")
-                                stats['calculation_errors'] += 1
-                                current_bad_weather_performance = {
-                                    "avg_bad_weather_speed": 0.0,
-                                    "avg_downstream_bad_weather_speed": 0.0,
-                                    "avg_non_downstream_bad_weather_speed": 0.0
-                                }
+                        if trace or window_days:
+                            if window_days is not None:
+                                try:
+                                    current_good_weather_performance, current_bad_weather_performance = \
+                                        self.calc_performance_from_daily_stats(window_days, design_speed)
+                                except Exception as e:
+                                    logger.error(f"[{num}/{total_num}] MMSI {mmsi} 汇总每日统计失败: {e}")
+                                    stats['calculation_errors'] += 1
+                                    current_good_weather_performance = {
+                                        "avg_good_weather_speed": 0.0,
+                                        "avg_downstream_speed": 0.0,
+                                        "avg_non_downstream_speed": 0.0
+                                    }
+                                    current_bad_weather_performance = {
+                                        "avg_bad_weather_speed": 0.0,
+                                        "avg_downstream_bad_weather_speed": 0.0,
+                                        "avg_non_downstream_bad_weather_speed": 0.0
+                                    }
+                            elif good_stats is not None:
+                                # 指纹已做过质量控制和天气分类，直接由累加器构建结果
+                                try:
+                                    current_good_weather_performance = self.build_good_performance(good_stats, design_speed)
+                                    current_bad_weather_performance = self.build_bad_performance(bad_stats, design_speed)
+                                except Exception as e:
+                                    logger.error(f"[{num}/{total_num}] MMSI {mmsi} 构建性能结果失败: {e}")
+                                    stats['calculation_errors'] += 1
+                                    current_good_weather_performance = {
+                                        "avg_good_weather_speed": 0.0,
+                                        "avg_downstream_speed": 0.0,
+                                        "avg_non_downstream_speed": 0.0
+                                    }
+                                    current_bad_weather_performance = {
+                                        "avg_bad_weather_speed": 0.0,
+                                        "avg_downstream_bad_weather_speed": 0.0,
+                                        "avg_non_downstream_bad_weather_speed": 0.0
+                                    }
+                            else:
+                                try:
+                                    current_good_weather_performance = self.deal_good_perf_list(
+                                        trace, draught, design_speed)
+                                except Exception as e:
+                                    logger.error(f"[{num}/{total_num}] MMSI {mmsi} 处理好天气性能数据失败: {e}")
+                                    stats['calculation_errors'] += 1
+                                    current_good_weather_performance = {
+                                        "avg_good_weather_speed": 0.0,
+                                        "avg_downstream_speed": 0.0,
+                                        "avg_non_downstream_speed": 0.0
+                                    }
+
+                                try:
+                                    current_bad_weather_performance = self.deal_bad_perf_list(
+                                        trace, draught, design_speed)
+                                except Exception as e:
+                                    logger.error(f"[{num}/{total_num}] MMSI {mmsi} 处理坏天气性能数据失败: {e}")
+                                    stats['calculation_errors'] += 1
+                                    current_bad_weather_performance = {
+                                        "avg_bad_weather_speed": 0.0,
+                                        "avg_downstream_bad_weather_speed": 0.0,
+                                        "avg_non_downstream_bad_weather_speed": 0.0
+                                    }
                             
                             # 获取性能计算结果
                             try:
@@ -2010,15 +2435,16 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
                                     "perf_calculated": 1,
                                     "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                                     # 添加元数据
-                                    "trace_data_count": len(trace) if trace else 0,
+                                    "trace_data_count": window_point_count if window_days is not None else (len(trace) if trace else 0),
                                     "design_speed": design_speed,
-                                    "draught": draught
+                                    "draught": draught,
+                                    "input_fingerprint": input_fingerprint
                                 }
                                 
-                                self.mgo_db["global_vessels_performance_details"].update_one(
+                                self.bulk_writer.add("global_vessels_performance_details", pymongo.UpdateOne(
                                     {"imo": imo},
                                     {"$set": save_data},
-                                    upsert=True)
+                                    upsert=True))
                             except Exception as e:
                                 logger.error(f"[{num}/{total_num}] MMSI {mmsi} 更新性能详情失败: {e}")
                                 logger.error(f"异常详情: {traceback.format_exc()}")
@@ -2028,12 +2454,7 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
 
                             # 更新 perf_calculated_updated_at
                             try:
-                                self.mgo_db["global_vessels"].update_one(
-                                    {"imo": imo},
-                                    {"$set": {
-                                        "perf_calculated_updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                                        "perf_calculated": 1
-                                    }})
+                                self.mark_vessel_perf_calculated(imo, mmsi, True)
                             except Exception as e:
                                 logger.error(f"[{num}/{total_num}] MMSI {mmsi} 更新船舶状态失败: {e}")
                             
@@ -2065,12 +2486,7 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
                                 stats['invalid_trace_data'] += 1
                             
                             try:
-                                filter_condition = {"imo": imo} if imo else {"mmsi": mmsi}
-                                update_data = {"$set": {
-                                    "perf_calculated": 0,
-                                    "perf_calculated_updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                                }}
-                                self.mgo_db["global_vessels"].update_one(filter_condition, update_data)
+                                self.mark_vessel_perf_calculated(imo, mmsi, False)
                             except Exception as e:
                                 logger.error(f"[{num}/{total_num}] MMSI {mmsi} 更新失败状态时出错: {e}")
                             total_failed_count += 1
@@ -2124,6 +2540,16 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
             # 记录错误但不继续处理，因为可能是严重的系统错误
             logger.error("发生严重错误，程序将退出")
         finally:
+            # 提交剩余的批量写操作
+            try:
+                write_stats = self.bulk_writer.close()
+                for collection, s in write_stats.items():
+                    logger.info(f"批量写入 {collection}: 批次={s['batches']}, 操作={s['ops']}, 更新={s['modified']}, 新增={s['upserted']}, 失败={s['write_errors']}")
+                stats['save_errors'] += write_stats.get(
+                    "global_vessels_performance_details", {}).get('write_errors', 0)
+            except Exception as e:
+                logger.error(f"提交批量写入时出错: {e}")
+
             # 确保最终统计信息被记录
             try:
                 if total_num > 0:
@@ -2143,6 +2569,7 @@ class CalcVesselPerformanceDetailsFromWmy(BaseModel):
                         logger.info(f"  - 验证失败: {stats.get('validation_failed', 0)} 艘")
                         logger.info(f"  - 保存错误: {stats.get('save_errors', 0)} 艘")
                         logger.info(f"  - 数据质量警告: {stats.get('data_quality_warnings', 0)} 艘")
+                        logger.info(f"输入未变化跳过计算: {stats.get('unchanged_skipped', 0)} 艘")
                     logger.info("=" * 80)
             except Exception as e:
                 logger.error(f"输出最终统计信息时出错: {e}")
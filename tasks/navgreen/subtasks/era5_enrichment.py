@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ERA5 轨迹气象补全引擎
+
+一次向量化计算轨迹点在 wave / wind / flow 三套网格上的索引，
+三张表并发查询，结果直接写入列式轨迹（不再逐点 copy、不再按字符串 key 合并）。
+网格单元查询结果进程内 LRU 缓存（可选 Redis 共享层），同航线船舶之间复用。
+"""
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import redis
+
+from pkg.db.clickhouse import ClickHouseClient
+from pkg.public.convert import GridDescriptor, ERA5_WAVE_GRID, ERA5_WIND_GRID, ERA5_FLOW_GRID
+
+# 列式轨迹中"未补全"的占位值，转回记录时该字段不输出（与原逐点合并时字段缺失的行为一致）
+MISSING = object()
+
+
+@dataclass(frozen=True)
+class Era5Source:
+    """一张 ERA5 网格表：表名、网格描述、网格大小 (lat, lon) 以及 key 列之后的数据列"""
+    name: str
+    table: str
+    grid: GridDescriptor
+    grid_shape: Tuple[int, int]
+    value_columns: Tuple[str, ...]
+
+
+ERA5_SOURCES = (
+    Era5Source(
+        name="wave",
+        table="shipping_history.era5_wave_0p5",
+        grid=ERA5_WAVE_GRID,
+        grid_shape=(361, 720),
+        value_columns=(
+            "wave_height", "wave_direction", "wave_period",
+            "swell_wave_height", "swell_wave_direction", "swell_wave_period",
+            "wind_wave_height", "wind_wave_direction", "wind_wave_period",
+        ),
+    ),
+    Era5Source(
+        name="wind",
+        table="shipping_history.era5_0p25",
+        grid=ERA5_WIND_GRID,
+        grid_shape=(721, 1440),
+        value_columns=("pressure", "temperature", "u_wind", "v_wind"),
+    ),
+    Era5Source(
+        name="flow",
+        table="shipping_history.era5_flow_0p83",
+        grid=ERA5_FLOW_GRID,
+        grid_shape=(2041, 4320),
+        value_columns=("u_flow", "v_flow"),
+    ),
+)
+
+
+class TrackColumns:
+    """列式轨迹：每个字段一个等长列表"""
+
+    def __init__(self, columns: Dict[str, list], size: int):
+        self.columns = columns
+        self.size = size
+
+    @classmethod
+    def from_points(cls, points: List[Dict[str, Any]], keys: Tuple[str, ...]) -> "TrackColumns":
+        return cls({key: [point.get(key) for point in points] for key in keys}, len(points))
+
+    def column(self, name: str) -> list:
+        """获取列，不存在时创建一个全部为 MISSING 的列"""
+        if name not in self.columns:
+            self.columns[name] = [MISSING] * self.size
+        return self.columns[name]
+
+    def to_records(self, keys: Tuple[str, ...]) -> List[Dict[str, Any]]:
+        """转回逐点字典，只保留 keys 中存在且已补全的字段"""
+        cols = [(key, self.columns[key]) for key in keys if key in self.columns]
+        return [
+            {key: col[i] for key, col in cols if col[i] is not MISSING}
+            for i in range(self.size)
+        ]
+
+
+class ClickHouseEra5Backend:
+    """从 ClickHouse 查询 ERA5 网格数据；每张表使用独立连接，便于并发查询"""
+
+    def __init__(self, client_factory: Callable[[], Any] = ClickHouseClient, batch_size: int = 500):
+        self.client_factory = client_factory
+        self.batch_size = batch_size
+        self.clients = {}
+
+    def prepare(self, sources):
+        """在主线程中预先建立连接（clickhouse_driver 的 Client 不是线程安全的）"""
+        for source in sources:
+            if source.name not in self.clients:
+                self.clients[source.name] = self.client_factory()
+
+    def lookup(self, source: Era5Source, keys: List[Tuple[int, int, datetime]]) -> Dict[Tuple[int, int, datetime], tuple]:
+        """
+        查询一批 (lat_index, lon_index, history_date) 对应的数据列
+        :return: {key: value_columns 对应的取值}
+        """
+        client = self.clients[source.name]
+        result = {}
+        for i in range(0, len(keys), self.batch_size):
+            batch = keys[i:i + self.batch_size]
+            values_clause = ",\n".join(
+                f"({lat_index},{lon_index},toDateTime('{history_date:%Y-%m-%d %H:%M:%S}'))"
+                for lat_index, lon_index, history_date in batch
+            )
+            sql = f"""
+            SELECT *
+            FROM {source.table}
+            WHERE (lat_index, lon_index, history_date) IN (
+                {values_clause}
+            )
+            """
+            for row in client.query(sql):
+                result[(row[0], row[1], row[2])] = tuple(row[3:3 + len(source.value_columns)])
+        return result
+
+    def close(self):
+        for client in self.clients.values():
+            try:
+                client.close()
+            except Exception as e:
+                logging.debug(f'关闭ClickHouse连接失败: {e}')
+        self.clients = {}
+
+
+class Era5CellCache:
+    """
+    进程级 ERA5 网格单元 LRU 缓存，key 为 (表, lat_index, lon_index, history_date)
+    ClickHouse 中不存在的单元也会缓存（值为空元组），避免重复查询
+    """
+
+    def __init__(self, max_entries: int = 200000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, source_name: str, keys: list) -> Tuple[Dict[tuple, tuple], list]:
+        """:return: (命中的 {key: row}, 未命中的 keys)"""
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                row = self._data.get((source_name,) + key)
+                if row is None:
+                    missing.append(key)
+                else:
+                    self._data.move_to_end((source_name,) + key)
+                    found[key] = row
+        return found, missing
+
+    def put_many(self, source_name: str, rows: Dict[tuple, tuple]):
+        with self._lock:
+            for key, row in rows.items():
+                self._data[(source_name,) + key] = row
+                self._data.move_to_end((source_name,) + key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisEra5CellCache:
+    """ERA5 网格单元的 Redis 共享缓存层（多进程/多任务共享），只缓存存在的单元"""
+
+    def __init__(self, rds, prefix: str = "era5_cell", ttl_seconds: int = 7 * 24 * 3600):
+        self.rds = rds
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+
+    def _key(self, source_name, key):
+        lat_index, lon_index, history_date = key
+        return f"{self.prefix}:{source_name}:{lat_index}:{lon_index}:{history_date:%Y%m%d%H%M}"
+
+    def get_many(self, source_name: str, keys: list) -> Tuple[Dict[tuple, tuple], list]:
+        if not keys:
+            return {}, []
+        values = self.rds.mget([self._key(source_name, key) for key in keys])
+        found, missing = {}, []
+        for key, value in zip(keys, values):
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = tuple(json.loads(value))
+        return found, missing
+
+    def put_many(self, source_name: str, rows: Dict[tuple, tuple]):
+        pipe = self.rds.pipeline(transaction=False)
+        for key, row in rows.items():
+            if row:
+                pipe.set(self._key(source_name, key), json.dumps(row), ex=self.ttl_seconds)
+        pipe.execute()
+
+
+# 进程内共享的网格单元缓存，同一进程中的所有任务实例共用
+_shared_cell_cache = None
+_shared_cell_cache_lock = threading.Lock()
+
+
+def get_shared_cell_cache() -> Era5CellCache:
+    global _shared_cell_cache
+    with _shared_cell_cache_lock:
+        if _shared_cell_cache is None:
+            _shared_cell_cache = Era5CellCache(int(os.getenv('ERA5_CELL_CACHE_SIZE', '200000')))
+        return _shared_cell_cache
+
+
+class CachingEra5Backend:
+    """
+    带缓存的 ERA5 查询：进程内 LRU -> Redis（可选）-> 下层 backend（ClickHouse）
+    只有两级缓存都未命中的单元才会查询下层 backend
+    """
+
+    def __init__(self, backend, cell_cache: Era5CellCache, redis_cache: Optional[RedisEra5CellCache] = None):
+        self.backend = backend
+        self.cell_cache = cell_cache
+        self.redis_cache = redis_cache
+        self.stats = {"hits": 0, "redis_hits": 0, "misses": 0}
+        self._stats_lock = threading.Lock()
+
+    def prepare(self, sources):
+        self.backend.prepare(sources)
+
+    def lookup(self, source: Era5Source, keys: list) -> Dict[tuple, tuple]:
+        result, missing = self.cell_cache.get_many(source.name, keys)
+        hits, redis_hits = len(result), 0
+
+        if missing and self.redis_cache:
+            try:
+                found, missing = self.redis_cache.get_many(source.name, missing)
+            except Exception as e:
+                logging.warning(f'读取 ERA5 Redis 缓存失败: {e}')
+                found = {}
+            if found:
+                redis_hits = len(found)
+                self.cell_cache.put_many(source.name, found)
+                result.update(found)
+
+        if missing:
+            fetched = self.backend.lookup(source, missing)
+            # 未查到的单元同样放入进程内缓存（空元组）
+            rows = {key: fetched.get(key, ()) for key in missing}
+            self.cell_cache.put_many(source.name, rows)
+            if self.redis_cache and fetched:
+                try:
+                    self.redis_cache.put_many(source.name, fetched)
+                except Exception as e:
+                    logging.warning(f'写入 ERA5 Redis 缓存失败: {e}')
+            result.update(rows)
+
+        with self._stats_lock:
+            self.stats["hits"] += hits
+            self.stats["redis_hits"] += redis_hits
+            self.stats["misses"] += len(missing)
+        return {key: row for key, row in result.items() if row}
+
+    def close(self):
+        total = sum(self.stats.values())
+        if total:
+            hit_rate = (self.stats["hits"] + self.stats["redis_hits"]) / total
+            logging.info(f'ERA5 网格缓存统计: {self.stats}, 命中率 {hit_rate:.1%}, 进程缓存单元数 {len(self.cell_cache)}')
+        self.backend.close()
+
+
+def build_era5_backend():
+    """
+    根据环境变量创建 ERA5 查询 backend
+    ERA5_CELL_CACHE=1 启用进程内 LRU（默认启用），ERA5_CELL_CACHE_SIZE 为最大单元数
+    ERA5_CELL_CACHE_REDIS=1 启用 Redis 共享层（CACHE_REDIS_* 连接），ERA5_CELL_CACHE_TTL_HOURS 为过期时间
+    ERA5_BACKEND=mmap 时直接读取本地内存映射网格（ERA5_GRID_STORE_DIR），不访问 ClickHouse、不启用缓存
+    """
+    if os.getenv('ERA5_BACKEND', 'clickhouse').strip().lower() == 'mmap':
+        from tasks.navgreen.subtasks.era5_grid_store import Era5GridStore, MmapEra5Backend
+        return MmapEra5Backend(Era5GridStore(os.getenv('ERA5_GRID_STORE_DIR', './cache/era5_grid')))
+
+    backend = ClickHouseEra5Backend()
+    if not int(os.getenv('ERA5_CELL_CACHE', '1')):
+        return backend
+
+    redis_cache = None
+    if int(os.getenv('ERA5_CELL_CACHE_REDIS', '0')):
+        try:
+            rds = redis.Redis(host=os.getenv('CACHE_REDIS_HOST', '127.0.0.1'),
+                              port=int(os.getenv('CACHE_REDIS_PORT', '6379')),
+                              password=os.getenv('CACHE_REDIS_PASSWORD', None),
+                              db=0, decode_responses=True, health_check_interval=30)
+            ttl_seconds = int(float(os.getenv('ERA5_CELL_CACHE_TTL_HOURS', '168')) * 3600)
+            redis_cache = RedisEra5CellCache(rds, ttl_seconds=ttl_seconds)
+        except Exception as e:
+            logging.error(f'初始化 ERA5 Redis 缓存失败: {e}')
+    return CachingEra5Backend(backend, get_shared_cell_cache(), redis_cache)
+
+
+class Era5Enricher:
+    """ERA5 轨迹补全：单次计算网格索引，三张表并发查询，结果写入列式轨迹"""
+
+    def __init__(self, backend=None, sources=ERA5_SOURCES):
+        self.backend = backend or build_era5_backend()
+        self.sources = sources
+        self.executor = ThreadPoolExecutor(max_workers=len(sources))
+
+    @staticmethod
+    def parse_times(postimes: list) -> List[Optional[datetime]]:
+        """解析轨迹时间（同一时间字符串只解析一次）"""
+        parsed = {}
+        result = []
+        for postime in postimes:
+            if postime not in parsed:
+                try:
+                    parsed[postime] = datetime.strptime(str(postime), "%Y-%m-%d %H:%M:%S")
+                except (ValueError, TypeError):
+                    parsed[postime] = None
+            result.append(parsed[postime])
+        return result
+
+    def enrich(self, track: TrackColumns) -> TrackColumns:
+        if track.size == 0:
+            return track
+        lat = np.asarray(track.columns["lat"], dtype=float)
+        lon = np.asarray(track.columns["lon"], dtype=float)
+        times = self.parse_times(track.columns["postime"])
+
+        # 1. 一次性计算三套网格索引，并按表去重
+        plans = []
+        for source in self.sources:
+            lat_index, lon_index = source.grid.indices(lat, lon)
+            point_keys = [
+                (int(a), int(b), t) if t is not None else None
+                for a, b, t in zip(lat_index.tolist(), lon_index.tolist(), times)
+            ]
+            unique_keys = list(dict.fromkeys(k for k in point_keys if k is not None))
+            plans.append((source, point_keys, unique_keys))
+
+        # 2. 三张表并发查询
+        self.backend.prepare(self.sources)
+        futures = [
+            self.executor.submit(self.backend.lookup, source, unique_keys)
+            for source, _, unique_keys in plans
+        ]
+
+        # 3. 结果直接写入对应的列
+        for (source, point_keys, _), future in zip(plans, futures):
+            rows = future.result()
+            columns = [track.column(name) for name in source.value_columns]
+            for i, key in enumerate(point_keys):
+                row = rows.get(key) if key is not None else None
+                if row is None:
+                    continue
+                for col, value in zip(columns, row):
+                    col[i] = value
+        return track
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.backend.close()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ERA5 本地内存映射网格存储
+
+目录结构：{root}/{source}/{YYYYMM}/{variable}.npy，数组布局 (time, lat_index, lon_index)，
+另有 __present__.npy（uint8）标记该单元在 ClickHouse 中是否存在，_complete 表示该月导出完成。
+查询时直接按索引读取，无需任何网络请求。
+"""
+import os
+import json
+import logging
+import threading
+import calendar
+from datetime import datetime
+from typing import Dict, Tuple
+
+import numpy as np
+
+from tasks.navgreen.subtasks.era5_enrichment import ERA5_SOURCES, Era5Source
+
+PRESENT_NAME = "__present__"
+COMPLETE_NAME = "_complete"
+
+
+def month_key(dt: datetime) -> str:
+    return dt.strftime("%Y%m")
+
+
+def month_start(key: str) -> datetime:
+    return datetime.strptime(key, "%Y%m")
+
+
+def month_steps(key: str, time_step_hours: int) -> int:
+    start = month_start(key)
+    days = calendar.monthrange(start.year, start.month)[1]
+    return days * 24 // time_step_hours
+
+
+class Era5GridStore:
+    """本地网格存储：负责路径、元数据以及内存映射数组的创建/打开"""
+
+    def __init__(self, root: str, time_step_hours: int = None, dtype: str = None):
+        self.root = root
+        meta = self.load_meta()
+        self.time_step_hours = int(time_step_hours or meta.get("time_step_hours") or 1)
+        self.dtype = np.dtype(dtype or meta.get("dtype") or "float32")
+        self._arrays = {}
+        self._lock = threading.Lock()
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.root, "meta.json")
+
+    def load_meta(self) -> dict:
+        try:
+            with open(self.meta_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_meta(self):
+        os.makedirs(self.root, exist_ok=True)
+        meta = {
+            "time_step_hours": self.time_step_hours,
+            "dtype": self.dtype.name,
+            "sources": {
+                source.name: {
+                    "table": source.table,
+                    "grid_shape": list(source.grid_shape),
+                    "value_columns": list(source.value_columns),
+                }
+                for source in ERA5_SOURCES
+            },
+        }
+        with open(self.meta_path, "w") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    def month_dir(self, source: Era5Source, key: str) -> str:
+        return os.path.join(self.root, source.name, key)
+
+    def is_complete(self, source: Era5Source, key: str) -> bool:
+        return os.path.exists(os.path.join(self.month_dir(source, key), COMPLETE_NAME))
+
+    def mark_complete(self, source: Era5Source, key: str):
+        with open(os.path.join(self.month_dir(source, key), COMPLETE_NAME), "w") as f:
+            f.write(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+    def create_month(self, source: Era5Source, key: str) -> Dict[str, np.memmap]:
+        """新建某月的全部变量数组（稀疏文件，未写入的区域不占磁盘）"""
+        month_dir = self.month_dir(source, key)
+        os.makedirs(month_dir, exist_ok=True)
+        shape = (month_steps(key, self.time_step_hours),) + tuple(source.grid_shape)
+        arrays = {
+            PRESENT_NAME: np.lib.format.open_memmap(
+                os.path.join(month_dir, f"{PRESENT_NAME}.npy"), mode="w+", dtype=np.uint8, shape=shape)
+        }
+        for name in source.value_columns:
+            arrays[name] = np.lib.format.open_memmap(
+                os.path.join(month_dir, f"{name}.npy"), mode="w+", dtype=self.dtype, shape=shape)
+        return arrays
+
+    def open_month(self, source: Era5Source, key: str):
+        """只读打开某月数组，未导出完成时返回 None（结果缓存，进程内复用）"""
+        cache_key = (source.name, key)
+        with self._lock:
+            if cache_key not in self._arrays:
+                arrays = None
+                if self.is_complete(source, key):
+                    month_dir = self.month_dir(source, key)
+                    arrays = {
+                        name: np.load(os.path.join(month_dir, f"{name}.npy"), mmap_mode="r")
+                        for name in (PRESENT_NAME,) + tuple(source.value_columns)
+                    }
+                self._arrays[cache_key] = arrays
+            return self._arrays[cache_key]
+
+    def time_index(self, key: str, history_dates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        history_date -> 月内时间索引
+        :return: (索引, 是否有效)；不在时间步长上的时刻视为无效
+        """
+        offset = (history_dates - np.datetime64(month_start(key), "s")).astype(np.int64)
+        step = self.time_step_hours * 3600
+        valid = (offset >= 0) & (offset % step == 0)
+        return offset // step, valid
+
+    def close(self):
+        with self._lock:
+            self._arrays = {}
+
+
+class MmapEra5Backend:
+    """按索引直接读取本地内存映射网格的 ERA5 查询 backend，与 ClickHouseEra5Backend 接口一致"""
+
+    def __init__(self, store: Era5GridStore):
+        self.store = store
+        self.missing_months = set()
+
+    def prepare(self, sources):
+        pass
+
+    def lookup(self, source: Era5Source, keys: list) -> Dict[tuple, tuple]:
+        by_month = {}
+        for key in keys:
+            by_month.setdefault(month_key(key[2]), []).append(key)
+
+        result = {}
+        for key_month, month_keys in by_month.items():
+            arrays = self.store.open_month(source, key_month)
+            if arrays is None:
+                if (source.name, key_month) not in self.missing_months:
+                    self.missing_months.add((source.name, key_month))
+                    logging.warning(f'本地 ERA5 网格缺少 {source.name} {key_month} 的数据')
+                continue
+
+            lat_index = np.array([k[0] for k in month_keys], dtype=np.int64)
+            lon_index = np.array([k[1] for k in month_keys], dtype=np.int64)
+            t_index, valid = self.store.time_index(
+                key_month, np.array([k[2] for k in month_keys], dtype="datetime64[s]"))
+            present = arrays[PRESENT_NAME]
+            valid &= (t_index < present.shape[0]) \
+                & (lat_index >= 0) & (lat_index < present.shape[1]) \
+                & (lon_index >= 0) & (lon_index < present.shape[2])
+            selected = np.nonzero(valid)[0]
+            selected = selected[present[t_index[selected], lat_index[selected], lon_index[selected]] == 1]
+            if not len(selected):
+                continue
+
+            t_index, lat_index, lon_index = t_index[selected], lat_index[selected], lon_index[selected]
+            columns = [arrays[name][t_index, lat_index, lon_index].tolist() for name in source.value_columns]
+            for j, i in enumerate(selected.tolist()):
+                result[month_keys[i]] = tuple(col[j] for col in columns)
+        return result
+
+    def close(self):
+        self.store.close()
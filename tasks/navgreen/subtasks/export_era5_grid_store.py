@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from pkg.public.decorator import decorate
+from pkg.public.models import BaseModel
+from tasks.navgreen.subtasks.era5_enrichment import ERA5_SOURCES
+from tasks.navgreen.subtasks.era5_grid_store import Era5GridStore, PRESENT_NAME, month_key, month_start, month_steps
+
+
+class ExportEra5GridStore(BaseModel):
+    """
+    将 ClickHouse 中的 ERA5 wave / wind / flow 网格按月导出到本地内存映射数组，
+    供历史性能重算时离线补全（ERA5_BACKEND=mmap）
+    """
+
+    def __init__(self):
+        # 导出月份范围（含首尾），格式 YYYY-MM
+        self.start_month = os.getenv('ERA5_EXPORT_START', (datetime.now().replace(day=1) - timedelta(days=1)).strftime("%Y-%m"))
+        self.end_month = os.getenv('ERA5_EXPORT_END', self.start_month)
+        self.sources = [s.strip() for s in os.getenv('ERA5_EXPORT_SOURCES', 'wave,wind,flow').split(',') if s.strip()]
+        self.overwrite = int(os.getenv('ERA5_EXPORT_OVERWRITE', '0'))
+        self.store = Era5GridStore(os.getenv('ERA5_GRID_STORE_DIR', './cache/era5_grid'),
+                                   time_step_hours=os.getenv('ERA5_GRID_TIME_STEP_HOURS'),
+                                   dtype=os.getenv('ERA5_GRID_DTYPE'))
+        config = {
+            'handle_db': 'ck',
+            'ck_client': True,
+        }
+        super(ExportEra5GridStore, self).__init__(config)
+
+    def iter_months(self):
+        current = datetime.strptime(self.start_month, "%Y-%m")
+        end = datetime.strptime(self.end_month, "%Y-%m")
+        while current <= end:
+            yield month_key(current)
+            current = (current + timedelta(days=32)).replace(day=1)
+
+    def export_month(self, source, key):
+        """逐个时间步查询并写入该月数组，返回写入的单元数"""
+        arrays = self.store.create_month(source, key)
+        start = month_start(key)
+        step_hours = self.store.time_step_hours
+        count = 0
+        for t_index in range(month_steps(key, step_hours)):
+            history_date = start + timedelta(hours=t_index * step_hours)
+            sql = f"""
+            SELECT *
+            FROM {source.table}
+            WHERE history_date = toDateTime('{history_date:%Y-%m-%d %H:%M:%S}')
+            """
+            columns = self.ck_client.query(sql, columnar=True)
+            if not columns or not len(columns[0]):
+                continue
+            lat_index = np.asarray(columns[0], dtype=np.int64)
+            lon_index = np.asarray(columns[1], dtype=np.int64)
+            in_grid = (lat_index >= 0) & (lat_index < source.grid_shape[0]) \
+                & (lon_index >= 0) & (lon_index < source.grid_shape[1])
+            lat_index, lon_index = lat_index[in_grid], lon_index[in_grid]
+            arrays[PRESENT_NAME][t_index, lat_index, lon_index] = 1
+            for name, values in zip(source.value_columns, columns[3:]):
+                values = np.asarray(values, dtype=float)[in_grid]
+                arrays[name][t_index, lat_index, lon_index] = values
+            count += len(lat_index)
+
+        for array in arrays.values():
+            array.flush()
+        del arrays
+        self.store.mark_complete(source, key)
+        return count
+
+    @decorate.exception_capture_close_datebase
+    def run(self):
+        self.store.save_meta()
+        sources = [s for s in ERA5_SOURCES if s.name in self.sources]
+        for key in self.iter_months():
+            for source in sources:
+                if self.store.is_complete(source, key) and not self.overwrite:
+                    logging.info(f'{source.name} {key} 已导出，跳过')
+                    continue
+                try:
+                    count = self.export_month(source, key)
+                    logging.info(f'{source.name} {key} 导出完成，共 {count} 个网格单元')
+                except Exception as e:
+                    logging.error(f'{source.name} {key} 导出失败: {e}')
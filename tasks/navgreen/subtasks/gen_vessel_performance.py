@@ -5,9 +5,12 @@ import pymongo
 import requests
 import json
 from pkg.public.models import BaseModel
-import time
+import os
 import traceback
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from pkg.db.mongo import MgoBulkWriter
+from pkg.util.ratelimit import RateLimiter
 
 
 def get_check_svc_token(cache_rds):
@@ -63,6 +66,33 @@ def request_mmsi_performance(mmsi):
     return response.json().get("data", [])
 
 
+def chunked(iterable, size):
+    """按固定大小切分，最后一块可能不足 size"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def request_batch(executor, rate_limiter, request_func, mmsi_list):
+    """
+    并发请求一批 mmsi，按输入顺序返回 [(mmsi, res, error)]
+    并发数由 executor 决定，rate_limiter 控制整体每秒请求数
+    """
+    def call(mmsi):
+        rate_limiter.acquire()
+        try:
+            return mmsi, request_func(mmsi), None
+        except Exception as e:
+            return mmsi, None, e
+
+    return list(executor.map(call, mmsi_list))
+
+
 class GenVesselPerformance(BaseModel):
 
     def __init__(self):
@@ -76,7 +106,13 @@ class GenVesselPerformance(BaseModel):
             ]
         }
 
+        self.batch_size = max(1, int(os.getenv('BATCH_SIZE', 100)))
+        self.request_workers = max(1, int(os.getenv('REQUEST_WORKERS', 4)))
+        # 每秒请求数上限，0 表示只受并发数限制
+        self.rate_limiter = RateLimiter(float(os.getenv('REQUESTS_PER_SECOND', 0)))
+
         super(GenVesselPerformance, self).__init__(config)
+        self.bulk_writer = MgoBulkWriter(self.mgo_db, batch_size=self.batch_size)
 
     @decorate.exception_capture_close_datebase
     def run(self):
@@ -84,29 +120,24 @@ class GenVesselPerformance(BaseModel):
             vessels = self.mgo_db["hifleet_vessels"].find(
                 {"vesselTypeNameCn": "干散货", "mmsi": {"$exists": True}, "perf_updated": {"$ne": 1}, "request_hi_weather": {"$ne": 0}}, {"mmsi": 1, '_id': 0})
 
-            # print("total num", len(list(vessels)))
-            for vessel in vessels:
-                print(vessel)
-                # 请求我的接口
-                try:
-                    res = request_mmsi_detail(vessel["mmsi"])
-                    print(res)
-                except Exception as e:
-                    print("error:", e)
-                else:
-                    # 更新船舶perf_updated字段为1
-                    if res:
-                        self.mgo_db["hifleet_vessels"].update_one(
-                            {"mmsi": vessel["mmsi"]},
-                            {"$set": {"perf_updated": 1}}
-                        )
-                    else:
-                        self.mgo_db["hifleet_vessels"].update_one(
-                            {"mmsi": vessel["mmsi"]},
-                            {"$set": {"request_hi_weather": 0}}
-                        )
-
-                time.sleep(1)
+            # 按批次读取 mmsi，批内并发请求我的接口，结果一次 bulk_write 写回
+            with ThreadPoolExecutor(max_workers=self.request_workers) as executor:
+                for chunk in chunked(vessels, self.batch_size):
+                    mmsi_list = [vessel["mmsi"] for vessel in chunk]
+                    for mmsi, res, error in request_batch(executor, self.rate_limiter, request_mmsi_detail, mmsi_list):
+                        if error is not None:
+                            print("error:", mmsi, error)
+                            continue
+                        print(mmsi, res)
+                        # 有数据则更新船舶perf_updated字段为1，否则标记不再请求
+                        update = {"perf_updated": 1} if res else {"request_hi_weather": 0}
+                        self.bulk_writer.add("hifleet_vessels", pymongo.UpdateOne(
+                            {"mmsi": mmsi},
+                            {"$set": update}
+                        ))
+                    self.bulk_writer.flush("hifleet_vessels")
+
+            print("批量写入统计:", self.bulk_writer.close().get("hifleet_vessels", {}))
 
         except Exception as e:
             print("error:", e)
@@ -119,6 +150,8 @@ class GenVesselPerformanceFromRDS(BaseModel):
             "cache_rds": True,
         }
 
+        self.batch_size = max(1, int(os.getenv('BATCH_SIZE', 100)))
+
         super(GenVesselPerformanceFromRDS, self).__init__(config)
 
     @decorate.exception_capture_close_datebase
@@ -127,21 +160,22 @@ class GenVesselPerformanceFromRDS(BaseModel):
             # 从rds hget 所有的字段
             vessels = self.cache_rds.hgetall("vessels_performance_v1|202505")
 
-            for vessel_key, vessel_data in vessels.items():
-                try:
-                    vessel = json.loads(vessel_data)
-                    print(vessel)
-                    # 入计算油耗队列
-                    task = {
+            # 按批次入计算油耗队列，每批一次 rpush
+            for chunk in chunked(vessels.values(), self.batch_size):
+                tasks = []
+                for vessel_data in chunk:
+                    try:
+                        vessel = json.loads(vessel_data)
+                    except json.JSONDecodeError as e:
+                        print(f"Error parsing vessel data: {e}")
+                        continue
+                    tasks.append(json.dumps({
                         'task_type': "handler_calculate_vessel_performance",
                         'process_data': vessel
-                    }
-                    self.cache_rds.rpush(
-                        "handler_calculate_vessel_performance", json.dumps(task))
-                    print(f"已推送mmsi={vessel.get('mmsi')}的船舶进入油耗计算队列")
-                except json.JSONDecodeError as e:
-                    print(f"Error parsing vessel data: {e}")
-                    continue
+                    }))
+                if tasks:
+                    self.cache_rds.rpush("handler_calculate_vessel_performance", *tasks)
+                    print(f"已推送{len(tasks)}艘船舶进入油耗计算队列")
 
         except Exception as e:
             print("error:", e)
@@ -159,6 +193,11 @@ class GenVesselVPFromMGO(BaseModel):
                 ('mmsi', pymongo.ASCENDING),
             ]
         }
+        self.batch_size = max(1, int(os.getenv('BATCH_SIZE', 100)))
+        self.request_workers = max(1, int(os.getenv('REQUEST_WORKERS', 4)))
+        # 每秒请求数上限，0 表示只受并发数限制
+        self.rate_limiter = RateLimiter(float(os.getenv('REQUESTS_PER_SECOND', 0)))
+
         super(GenVesselVPFromMGO, self).__init__(config)
 
     @decorate.exception_capture_close_datebase
@@ -167,27 +206,24 @@ class GenVesselVPFromMGO(BaseModel):
 
             vessels = self.mgo_db["hifleet_vessels"].find({"vesselTypeNameCn": {
                                                           "$in": ["杂货船", "干散货"]}, "mmsi": {"$exists": True}}, {"mmsi": 1, '_id': 0})
+            mmsi_list = [vessel["mmsi"] for vessel in vessels]
 
-            total_num = vessels.count()
+            total_num = len(mmsi_list)
             num = 0
-            for vessel in vessels:
-                num += 1
-                year_month = datetime.now().strftime("%Y%m")
-                vessel_data = self.cache_rds.hget(
-                    f"vessels_performance_v2|{year_month}", vessel["mmsi"])
-                if vessel_data:
-                    res = json.loads(vessel_data)
-                    continue
-                    if res.get("avg_fuel") and res.get("avg_good_weather_speed"):
-                        print(f"mmsi={vessel['mmsi']} 已计算过")
-                        continue
-                try:
-                    res = request_mmsi_performance(vessel["mmsi"])
-                    print(f"mmsi={vessel['mmsi']} 计算成功")
-                except Exception as e:
-                    traceback.print_exc()
-                print(f"已计算{num}/{total_num} 进度：{round((num / total_num) * 100, 2)}%")
-                time.sleep(2)
+            with ThreadPoolExecutor(max_workers=self.request_workers) as executor:
+                for chunk in chunked(mmsi_list, self.batch_size):
+                    num += len(chunk)
+                    # 本月已计算过的船舶跳过：每批一次 hmget
+                    year_month = datetime.now().strftime("%Y%m")
+                    cached = self.cache_rds.hmget(f"vessels_performance_v2|{year_month}", chunk)
+                    todo = [mmsi for mmsi, vessel_data in zip(chunk, cached) if not vessel_data]
+
+                    for mmsi, res, error in request_batch(executor, self.rate_limiter, request_mmsi_performance, todo):
+                        if error is not None:
+                            print(f"mmsi={mmsi} 计算失败: {error}")
+                        else:
+                            print(f"mmsi={mmsi} 计算成功")
+                    print(f"已计算{num}/{total_num} 进度：{round((num / total_num) * 100, 2)}%")
 
         except Exception as e:
             traceback.print_exc()
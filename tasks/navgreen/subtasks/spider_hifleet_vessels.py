@@ -184,6 +184,36 @@ class SpiderHifleetVessels(BaseModel):
             traceback.print_exc()
             print("error:", res, e)
 
+    def insert_new_vessels(self, page_items):
+        """
+        一页记录的去重与写入：一次 $in 投影查询已存在的 IMO，新记录一次 bulk_write 写入
+        page_items: {imo: item}
+        """
+        if not page_items:
+            return
+        existing_imos = {
+            doc.get("imo") for doc in self.mgo_db["global_vessels"].find(
+                {"imo": {"$in": list(page_items.keys())}}, {"_id": 0, "imo": 1})
+        }
+        ops = []
+        updated_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for imo_val, item in page_items.items():
+            if imo_val in existing_imos:
+                print(f"已存在，不插入，imo={imo_val}")
+                continue
+            item["updated_at"] = updated_at
+            # 与 self.mgo.set 一致：按唯一索引 upsert，并发插入同一 IMO 时不会产生重复记录
+            ops.append(pymongo.UpdateOne({"imo": imo_val}, {"$set": item}, upsert=True))
+            print(f"插入新记录: imo={imo_val}")
+        if not ops:
+            return
+        try:
+            res = self.mgo_db["global_vessels"].bulk_write(ops, ordered=False)
+            print(f"本页新增 {res.upserted_count} 条记录")
+        except pymongo.errors.BulkWriteError as e:
+            details = e.details or {}
+            print(f"本页新增 {details.get('nUpserted', 0)} 条记录，失败 {len(details.get('writeErrors', []))} 条")
+
     @decorate.exception_capture_close_datebase
     def run(self):
         # token = get_check_svc_token(self.cache_rds)
@@ -227,7 +257,8 @@ class SpiderHifleetVessels(BaseModel):
                             print(f"读取完成，运行结束... 响应: {response.text}")
                             break
 
-                        # 处理数据
+                        # 处理数据：先规范化本页记录，再用一次 $in 查询判断哪些 IMO 已存在
+                        page_items = {}
                         for item in data:
                             # 优先使用 IMO 作为唯一键，跳过无效 IMO 的记录
                             imo_raw = item.get("imo")
@@ -253,14 +284,13 @@ class SpiderHifleetVessels(BaseModel):
                                 item["mmsi"] = None
 
                             item["imo"] = imo_val
-
-                            existing_record = self.mgo_db["global_vessels"].find_one({
-                                                                                     "imo": imo_val})
-                            if not existing_record:
-                                self.mgo.set(None, item)
-                                print(f"插入新记录: imo={imo_val}")
-                            else:
+                            # 同一页内重复的 IMO 只保留第一条
+                            if imo_val in page_items:
                                 print(f"已存在，不插入，imo={imo_val}")
+                                continue
+                            page_items[imo_val] = item
+
+                        self.insert_new_vessels(page_items)
                         # else:
                         #     if existing_record["dwt"] is None or existing_record["dwt"] == 0 or existing_record["dwt"] == "" or existing_record["dwt"] == "******":
                         #         self.update_hifleet_vessels(token, int(item.get('mmsi')))
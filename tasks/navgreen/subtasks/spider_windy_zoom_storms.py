@@ -11,7 +11,9 @@ from typing import Dict, List, Any, Optional
 from collections import defaultdict
 import time
 import re
+import hashlib
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 
 # 配置常量
 CONFIG = {
@@ -33,6 +35,12 @@ CONFIG = {
     
     # 缓存配置
     "STORM_CACHE_KEY": "windy_current_storms",
+    # 单个风暴轨迹的缓存：field 为 "{来源}:{风暴ID}"，value 为 {"hash": 原始载荷摘要, "data": 转换结果}
+    "STORM_TRACK_CACHE_KEY": "windy_storm_track_cache",
+    "STORM_TRACK_CACHE_EXPIRE": 3600 * 24 * 7,  # 7天
+
+    # 并发配置：同时请求的风暴轨迹数
+    "TRACK_FETCH_WORKERS": 6,
     
     # 台风等级风速阈值（米/秒）
     "TYPHOON_LEVELS": {
@@ -413,11 +421,86 @@ class SpiderWindyZoomStorms(BaseModel):
             
         return prefix
 
+    @staticmethod
+    def payload_hash(payload: Any) -> str:
+        """计算风暴轨迹原始载荷的摘要，用于判断轨迹是否有变化"""
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def fetch_tracks(self, fetch_func, storm_ids: List[str], *args) -> Dict[str, Any]:
+        """并发获取多个风暴的轨迹，并发数受 TRACK_FETCH_WORKERS 限制
+
+        每个请求仍经过 fetch_func 上的 retry_on_failure 重试，重试耗尽后的异常作为结果返回
+
+        Returns:
+            dict: {storm_id: 轨迹数据 或 Exception}
+        """
+        results = {}
+        if not storm_ids:
+            return results
+
+        workers = min(CONFIG["TRACK_FETCH_WORKERS"], len(storm_ids))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {storm_id: executor.submit(fetch_func, *args, storm_id) for storm_id in storm_ids}
+            for storm_id, future in futures.items():
+                try:
+                    results[storm_id] = future.result()
+                except Exception as e:
+                    results[storm_id] = e
+        return results
+
+    def load_track_cache(self, source: str, storm_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """读取风暴轨迹缓存，返回 {storm_id: {"hash": ..., "data": ...}}"""
+        if not storm_ids:
+            return {}
+        try:
+            values = self.cache_rds.hmget(
+                CONFIG["STORM_TRACK_CACHE_KEY"], [f"{source}:{storm_id}" for storm_id in storm_ids])
+        except Exception as e:
+            logger.warning(f"Failed to load {source} track cache: {e}")
+            return {}
+
+        cached = {}
+        for storm_id, value in zip(storm_ids, values):
+            if not value:
+                continue
+            try:
+                cached[storm_id] = json.loads(value)
+            except ValueError:
+                continue
+        return cached
+
+    def save_track_cache(self, source: str, updated: Dict[str, str], active_ids: List[str]):
+        """写入有变化的风暴轨迹缓存，并清理已不在列表中的风暴
+
+        Args:
+            updated: {storm_id: 已序列化的 {"hash": ..., "data": ...}}
+            active_ids: 本次列表中的全部风暴ID
+        """
+        key = CONFIG["STORM_TRACK_CACHE_KEY"]
+        prefix = f"{source}:"
+        active = set(active_ids)
+        try:
+            stale = [field for field in self.cache_rds.hkeys(key)
+                     if field.startswith(prefix) and field[len(prefix):] not in active]
+            pipe = self.cache_rds.pipeline()
+            if updated:
+                pipe.hset(key, mapping={f"{prefix}{storm_id}": value for storm_id, value in updated.items()})
+            if stale:
+                pipe.hdel(key, *stale)
+            pipe.expire(key, CONFIG["STORM_TRACK_CACHE_EXPIRE"])
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to save {source} track cache: {e}")
+
     def process_windy_storms(self, windy_token: str) -> List[Dict[str, Any]]:
         """处理Windy风暴数据"""
         try:
             storms = self.get_windy_storms(windy_token)
             data = []
+
+            storm_ids = [storm.get("id") for storm in storms if storm.get("id")]
+            tracks = self.fetch_tracks(self.get_windy_storm_track, storm_ids, windy_token)
             
             for storm in storms:
                 try:
@@ -426,7 +509,9 @@ class SpiderWindyZoomStorms(BaseModel):
                         logger.warning("Storm without ID found, skipping")
                         continue
                         
-                    track = self.get_windy_storm_track(windy_token, storm_id)
+                    track = tracks.get(storm_id)
+                    if isinstance(track, Exception):
+                        raise track
                     wind_speed = storm.get("windSpeed")
                     
                     if wind_speed:
@@ -454,6 +539,23 @@ class SpiderWindyZoomStorms(BaseModel):
             
             data = []
             processed_storms = set()
+
+            # Windy 中已有的风暴（按标准化后的ID前缀）
+            windy_prefixes = {
+                self.normalize_storm_id_prefix(s.get("id", "").split('-')[0])
+                for s in windy_storms if isinstance(s.get("id", ""), str)
+            }
+
+            # 只有 Windy 中不存在的风暴才需要请求轨迹，先统一并发请求
+            fetch_ids = list(dict.fromkeys(
+                storm for storm in zoom_storms
+                if isinstance(storm, str)
+                and self.normalize_storm_id_prefix(storm.split('-')[0].lower()) not in windy_prefixes
+            ))
+            tracks = self.fetch_tracks(self.get_zoom_storms_track, fetch_ids)
+            cached_tracks = self.load_track_cache("zoom", fetch_ids)
+            updated_tracks = {}
+            unchanged = 0
             
             for storm in zoom_storms:
                 try:
@@ -466,10 +568,7 @@ class SpiderWindyZoomStorms(BaseModel):
                     
                     # 检查是否已存在于Windy数据中
                     norm_storm_id_prefix = self.normalize_storm_id_prefix(storm_id_prefix)
-                    exists_in_storms = any(
-                        self.normalize_storm_id_prefix(s.get("id", "").split('-')[0]) == norm_storm_id_prefix
-                        for s in windy_storms if isinstance(s.get("id", ""), str)
-                    )
+                    exists_in_storms = norm_storm_id_prefix in windy_prefixes
                     
                     logger.debug(f"Storm {storm_id_prefix}, exists in Windy: {exists_in_storms}")
                     
@@ -481,18 +580,31 @@ class SpiderWindyZoomStorms(BaseModel):
                         processed_storms.add(storm)
                         continue
 
-                    track = self.get_zoom_storms_track(storm)
-                    zoom_data = self.convert_zoom_to_windy_format(track)
-                    
-                    if not zoom_data:
-                        logger.warning(f"Failed to convert zoom data for storm {storm}")
-                        continue
+                    track = tracks.get(storm)
+                    if isinstance(track, Exception):
+                        raise track
+
+                    # 轨迹载荷未变化时直接复用上次的转换结果
+                    digest = self.payload_hash(track)
+                    cached = cached_tracks.get(storm)
+                    if cached and cached.get("hash") == digest and cached.get("data"):
+                        zoom_data = cached["data"]
+                        unchanged += 1
+                    else:
+                        zoom_data = self.convert_zoom_to_windy_format(track)
                         
-                    wind_speed = zoom_data.get("windSpeed")
-                    if wind_speed:
-                        typhoon_level = self.classify_typhoon(wind_speed)
-                        logger.debug(f"Zoom storm {storm} classified as {typhoon_level}")
-                        zoom_data["strength"] = typhoon_level
+                        if not zoom_data:
+                            logger.warning(f"Failed to convert zoom data for storm {storm}")
+                            continue
+                            
+                        wind_speed = zoom_data.get("windSpeed")
+                        if wind_speed:
+                            typhoon_level = self.classify_typhoon(wind_speed)
+                            logger.debug(f"Zoom storm {storm} classified as {typhoon_level}")
+                            zoom_data["strength"] = typhoon_level
+
+                        # 先序列化，避免后续对 data 中 id 的修改写进缓存
+                        updated_tracks[storm] = json.dumps({"hash": digest, "data": zoom_data}, ensure_ascii=False)
 
                     data.append(zoom_data)
                     processed_storms.add(storm)
@@ -500,6 +612,10 @@ class SpiderWindyZoomStorms(BaseModel):
                 except Exception as e:
                     logger.error(f"Error processing Zoom storm {storm}: {e}")
                     continue
+
+            self.save_track_cache("zoom", updated_tracks, fetch_ids)
+            logger.info(f"Zoom storms: {len(fetch_ids)} tracks fetched, {unchanged} unchanged, "
+                        f"{len(updated_tracks)} converted")
                     
             return data
             
@@ -6,9 +6,13 @@ import requests
 import datetime
 from pkg.public.models import BaseModel
 import traceback
+import threading
 import time
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pkg.db.mongo import MgoBulkWriter
+from pkg.util.ratelimit import RateLimiter
 
 
 class UpdateMmsi(BaseModel):
@@ -19,6 +23,15 @@ class UpdateMmsi(BaseModel):
         self.time_sleep_seconds = float(os.getenv('TIME_SLEEP_SECONDS', 20))
         # 请求延迟配置（秒）
         self.request_delay_seconds = float(os.getenv('REQUEST_DELAY_SECONDS', 0.5))  # 默认0.5秒
+        # 全局限速：所有并发线程共享的每秒请求数，默认按 REQUEST_DELAY_SECONDS 换算（0.5秒 -> 2次/秒）
+        default_rps = 1.0 / self.request_delay_seconds if self.request_delay_seconds > 0 else 0
+        self.rate_limiter = RateLimiter(float(os.getenv('REQUESTS_PER_SECOND', default_rps)))
+        # 并发检查的线程数、批量写入大小
+        self.check_workers = int(os.getenv('CHECK_WORKERS', 8))
+        self.write_batch_size = int(os.getenv('WRITE_BATCH_SIZE', 200))
+        # 本次运行内按 MMSI 缓存船舶详情，避免同一 MMSI 重复请求
+        self._detail_cache = {}
+        self._detail_cache_lock = threading.Lock()
         # 船舶类型配置，支持多个类型，用逗号分隔，例如："散货船,杂货船"
         vessel_types_env = os.getenv('VESSEL_TYPES', '杂货船')
         self.vessel_types = [t.strip() for t in vessel_types_env.split(',') if t.strip()]
@@ -152,11 +165,13 @@ class UpdateMmsi(BaseModel):
         return False
 
     def _get_vessel_detail_by_mmsi(self, mmsi):
-        """通过MMSI调用cosco接口获取船舶档案详情"""
+        """通过MMSI调用cosco接口获取船舶档案详情（本次运行内按 MMSI 缓存）"""
+        with self._detail_cache_lock:
+            if mmsi in self._detail_cache:
+                return self._detail_cache[mmsi]
         try:
-            # 请求前延迟
-            if self.request_delay_seconds > 0:
-                time.sleep(self.request_delay_seconds)
+            # 全局限速
+            self.rate_limiter.acquire()
             
             url = f"http://47.84.73.224:10010/api/cosco/vessel/detail?mmsi={mmsi}"
             
@@ -166,9 +181,12 @@ class UpdateMmsi(BaseModel):
             
             # 从返回数据中提取档案数据
             data = res_json.get("data")
-            if data and isinstance(data, dict):
-                return data
-            return None
+            if not data or not isinstance(data, dict):
+                data = None
+            # 只缓存接口正常返回的结果，请求异常不缓存
+            with self._detail_cache_lock:
+                self._detail_cache[mmsi] = data
+            return data
         except requests.exceptions.RequestException as e:
             print(f"调用cosco接口获取船舶档案异常 (mmsi: {mmsi}): {e}")
             return None
@@ -176,19 +194,19 @@ class UpdateMmsi(BaseModel):
             print(f"解析cosco接口返回异常 (mmsi: {mmsi}): {e}")
             return None
 
-    def _update_vessel_profile(self, imo, mmsi, vessel_data, previous_mmsi=None):
-        """更新船舶档案数据
+    def _build_profile_update(self, imo, mmsi, vessel_data, previous_mmsi=None):
+        """根据接口返回的船舶档案构建 $set 更新内容
         Args:
             imo: IMO号
             mmsi: MMSI号（新的）
             vessel_data: 从接口获取的船舶档案数据
             previous_mmsi: 前一个MMSI号（可选）
         Returns:
-            bool: 是否更新成功
+            dict: 需要更新的字段，校验不通过时返回 None
         """
         try:
             if not vessel_data:
-                return False
+                return None
             
             # 标准化返回数据中的IMO和MMSI
             vessel_imo_raw = vessel_data.get("imo")
@@ -200,13 +218,13 @@ class UpdateMmsi(BaseModel):
                 # 如果返回的IMO有效且与传入的IMO不匹配，则跳过
                 if vessel_imo_normalized and vessel_imo_normalized > 0 and vessel_imo_normalized != imo:
                     print(f"  ⚠ IMO不匹配，跳过更新 - 期望IMO: {imo}, 返回IMO: {vessel_imo_normalized}")
-                    return False
+                    return None
             
             # 标准化MMSI
             mmsi_normalized = self._normalize_int_field(vessel_mmsi_raw or mmsi, "mmsi")
             if not mmsi_normalized or mmsi_normalized <= 0:
                 print(f"  ⚠ MMSI无效，跳过更新 - mmsi: {mmsi}")
-                return False
+                return None
             
             # 构建更新数据
             update_data = dict(vessel_data)
@@ -237,18 +255,11 @@ class UpdateMmsi(BaseModel):
             else:
                 update_data["mmsi_update_info"] = f"MMSI更新：{mmsi_normalized}"
             
-            # 更新数据库
-            self.mgo_db["global_vessels"].update_one(
-                {"imo": imo},
-                {"$set": update_data},
-                upsert=False  # 不创建新记录，只更新已存在的
-            )
-            
-            return True
+            return update_data
         except Exception as e:
-            print(f"更新船舶档案数据异常 (imo: {imo}, mmsi: {mmsi}): {e}")
+            print(f"构建船舶档案数据异常 (imo: {imo}, mmsi: {mmsi}): {e}")
             traceback.print_exc()
-            return False
+            return None
 
     def _get_latest_mmsi_by_imo(self, imo, current_mmsi=None):
         """通过 IMO 调用 cosco 接口获取最新的 MMSI。
@@ -258,9 +269,8 @@ class UpdateMmsi(BaseModel):
         mmsi 为权威（canonical），并结合详情中的 info_update 与 fuzzy 的 postime 判断哪个是当前在用。
         """
         try:
-            # 请求前延迟
-            if self.request_delay_seconds > 0:
-                time.sleep(self.request_delay_seconds)
+            # 全局限速
+            self.rate_limiter.acquire()
             
             imo_normalized = self._normalize_int_field(imo, "imo")
             if imo_normalized is None or imo_normalized <= 0:
@@ -332,8 +342,6 @@ class UpdateMmsi(BaseModel):
             # 同时优先选择与配置类型一致的船舶（如散货船），同一 IMO 对应多船时选“散”不选“集”
             candidates = []  # (canonical_mmsi, detail_update_dt, postime_dt, is_preferred_type)
             for mmsi in distinct_mmsis:
-                if self.request_delay_seconds > 0:
-                    time.sleep(self.request_delay_seconds)
                 detail = self._get_vessel_detail_by_mmsi(mmsi)
                 # 优先用 vesselTypeNameEn 判断：Dry Bulk 优先，Container 不优先；否则用中文类型
                 type_name_en = None
@@ -396,109 +404,99 @@ class UpdateMmsi(BaseModel):
             print(f"解析cosco接口返回异常 (imo: {imo}): {e}")
             return None
 
+    def _check_one(self, imo, current_mmsi, current_time, current_time_str):
+        """检查单条 (imo, mmsi)，只请求接口不写库（在线程池中并发执行）
+        Returns:
+            (status, update_data): status 为 updated / no_change / error，update_data 为需要 $set 的内容
+        """
+        # 无论是否更新MMSI，都要更新检查时间
+        update_data = {
+            "mmsi_check_time": current_time_str,
+            "mmsi_check_timestamp": current_time
+        }
+        # 通过 imo 获取最新 mmsi（多候选时结合详情接口判断新旧）
+        latest_mmsi = self._get_latest_mmsi_by_imo(imo, current_mmsi=current_mmsi)
+        if latest_mmsi is None:
+            return "error", update_data
+        if latest_mmsi == current_mmsi:
+            return "no_change", update_data
+
+        update_data.update({
+            "mmsi": latest_mmsi,
+            "info_update": current_time_str,
+            "mmsi_update_info": f"MMSI更新：{current_mmsi} -> {latest_mmsi}"
+        })
+        print(f"  ✓ 更新MMSI - imo: {imo}, 原MMSI: {current_mmsi}, 新MMSI: {latest_mmsi}")
+
+        # MMSI更新后，获取新的船舶档案数据（多候选时详情已在本次运行缓存中），与 MMSI 更新合并为一次写入
+        try:
+            vessel_data = self._get_vessel_detail_by_mmsi(latest_mmsi)
+            if vessel_data:
+                profile_data = self._build_profile_update(imo, latest_mmsi, vessel_data, previous_mmsi=current_mmsi)
+                if profile_data:
+                    update_data.update(profile_data)
+                    print(f"  ✓ 已更新船舶档案 - imo: {imo}, mmsi: {latest_mmsi}")
+                else:
+                    print(f"  ⚠ 更新船舶档案失败 - imo: {imo}, mmsi: {latest_mmsi}")
+            else:
+                print(f"  ⚠ 未获取到船舶档案数据 - imo: {imo}, mmsi: {latest_mmsi}")
+        except Exception as e:
+            print(f"  ✗ 获取船舶档案异常 - imo: {imo}, mmsi: {latest_mmsi}, 错误: {e}")
+        return "updated", update_data
+
     def check_and_update_mmsi(self, imo_mmsi_list):
         """检查并更新MMSI
+        多线程并发检查（共享全局限速），检查结果在主线程中批量写入
         Args:
             imo_mmsi_list: list, 包含 (imo, mmsi) 元组的列表
         Returns:
             dict: 统计信息 {"updated": int, "no_change": int, "error": int}
         """
         try:
-            updated_count = 0
-            no_change_count = 0
-            error_count = 0
+            counts = {"updated": 0, "no_change": 0, "error": 0}
             total = len(imo_mmsi_list)
             current_time = datetime.datetime.now()
             current_time_str = current_time.strftime("%Y-%m-%d %H:%M:%S")
-            
-            for idx, (imo, current_mmsi) in enumerate(imo_mmsi_list, 1):
-                try:
+            bulk_writer = MgoBulkWriter(self.mgo_db, self.write_batch_size)
+
+            with ThreadPoolExecutor(max_workers=self.check_workers) as executor:
+                futures = {
+                    executor.submit(self._check_one, imo, current_mmsi, current_time, current_time_str): (imo, current_mmsi)
+                    for imo, current_mmsi in imo_mmsi_list
+                }
+                for idx, future in enumerate(as_completed(futures), 1):
+                    imo, current_mmsi = futures[future]
                     # 每处理100条显示一次进度
                     if idx % 100 == 0 or idx == total:
                         print(f"  进度: {idx}/{total} ({idx*100//total}%)")
-                    
-                    # 通过 imo 获取最新 mmsi（多候选时结合详情接口判断新旧，方法内部已包含延迟）
-                    latest_mmsi = self._get_latest_mmsi_by_imo(imo, current_mmsi=current_mmsi)
-                    
-                    # 准备更新数据，无论是否更新MMSI，都要更新检查时间
-                    update_data = {
-                        "mmsi_check_time": current_time_str,
-                        "mmsi_check_timestamp": current_time
-                    }
-                    
-                    if latest_mmsi is None:
-                        error_count += 1
-                        # 即使获取失败，也记录检查时间
-                        self.mgo_db["global_vessels"].update_one(
-                            {"imo": imo},
-                            {"$set": update_data}
-                        )
-                        if idx % 10 == 0:  # 每10条错误才打印一次，避免日志过多
-                            print(f"  未获取到最新MMSI - imo: {imo}, 当前MMSI: {current_mmsi}")
-                        # 请求失败后也需要延迟
-                        if self.request_delay_seconds > 0 and idx < total:
-                            time.sleep(self.request_delay_seconds)
+                    try:
+                        status, update_data = future.result()
+                    except Exception as e:
+                        print(f"  ✗ 处理异常 - imo: {imo}, 当前MMSI: {current_mmsi}, 错误: {e}")
+                        counts["error"] += 1
                         continue
-                    
-                    # 判断是否需要更新
-                    if latest_mmsi != current_mmsi:
-                        # 更新数据库中的mmsi和检查时间
-                        update_data.update({
-                            "mmsi": latest_mmsi,
-                            "info_update": current_time_str,
-                            "mmsi_update_info": f"MMSI更新：{current_mmsi} -> {latest_mmsi}"
-                        })
-                        self.mgo_db["global_vessels"].update_one(
-                            {"imo": imo},
-                            {"$set": update_data}
-                        )
-                        updated_count += 1
-                        print(f"  ✓ 更新MMSI - imo: {imo}, 原MMSI: {current_mmsi}, 新MMSI: {latest_mmsi}")
-                        
-                        # MMSI更新后，立即获取新的船舶档案数据（方法内部已包含延迟）
-                        try:
-                            vessel_data = self._get_vessel_detail_by_mmsi(latest_mmsi)
-                            if vessel_data:
-                                profile_updated = self._update_vessel_profile(imo, latest_mmsi, vessel_data, previous_mmsi=current_mmsi)
-                                if profile_updated:
-                                    print(f"  ✓ 已更新船舶档案 - imo: {imo}, mmsi: {latest_mmsi}")
-                                else:
-                                    print(f"  ⚠ 更新船舶档案失败 - imo: {imo}, mmsi: {latest_mmsi}")
-                            else:
-                                print(f"  ⚠ 未获取到船舶档案数据 - imo: {imo}, mmsi: {latest_mmsi}")
-                        except Exception as e:
-                            print(f"  ✗ 获取船舶档案异常 - imo: {imo}, mmsi: {latest_mmsi}, 错误: {e}")
-                    else:
-                        # MMSI已是最新，只更新检查时间
-                        self.mgo_db["global_vessels"].update_one(
-                            {"imo": imo},
-                            {"$set": update_data}
-                        )
-                        no_change_count += 1
-                        # 只在调试模式下显示无需更新的信息，减少日志输出
-                        # print(f"  ○ MMSI已是最新 - imo: {imo}, MMSI: {current_mmsi}")
-                    
-                    # 每个请求后额外延迟，防止请求过快
-                    if self.request_delay_seconds > 0 and idx < total:
-                        time.sleep(self.request_delay_seconds)
-                        
-                except Exception as e:
-                    print(f"  ✗ 处理异常 - imo: {imo}, 当前MMSI: {current_mmsi}, 错误: {e}")
-                    error_count += 1
-                    continue
+
+                    counts[status] += 1
+                    if status == "error" and counts["error"] % 10 == 0:  # 每10条错误才打印一次，避免日志过多
+                        print(f"  未获取到最新MMSI - imo: {imo}, 当前MMSI: {current_mmsi}")
+                    # 即使获取失败，也记录检查时间
+                    bulk_writer.add("global_vessels", pymongo.UpdateOne({"imo": imo}, {"$set": update_data}))
+
+            write_stats = bulk_writer.close().get("global_vessels", {})
             
             stats = {
-                "updated": updated_count,
-                "no_change": no_change_count,
-                "error": error_count,
+                "updated": counts["updated"],
+                "no_change": counts["no_change"],
+                "error": counts["error"],
                 "total": total
             }
             
             print(f"\n  本批次统计:")
-            print(f"    已更新: {updated_count} 条")
-            print(f"    无需更新: {no_change_count} 条")
-            print(f"    处理异常: {error_count} 条")
+            print(f"    已更新: {counts['updated']} 条")
+            print(f"    无需更新: {counts['no_change']} 条")
+            print(f"    处理异常: {counts['error']} 条")
             print(f"    总计: {total} 条")
+            print(f"    批量写入: {write_stats.get('batches', 0)} 批, 修改 {write_stats.get('modified', 0)} 条, 失败 {write_stats.get('write_errors', 0)} 条")
             
             return stats
             
@@ -511,6 +509,7 @@ class UpdateMmsi(BaseModel):
     def run(self):
         """主执行方法"""
         try:
+            self._detail_cache = {}
             dataTime = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             vessel_types_str = ', '.join(self.vessel_types)
             print(f"开始检查并更新{vessel_types_str}的MMSI:", dataTime)
@@ -9,6 +9,9 @@ import traceback
 import time
 import os
 import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
+from pkg.db.mongo import MgoBulkWriter
 
 
 def request_wmy_detail(mmsi_list):
@@ -38,7 +41,10 @@ class UpdateYearOfBuild(BaseModel):
 
     def __init__(self):
         self.batch_size = int(os.getenv('BATCH_SIZE', 1000))
+        # 相邻两次上游请求的最小间隔（秒）
         self.time_sleep_seconds = float(os.getenv('TIME_SLEEP_SECONDS', 20))
+        # 同时在途的上游批次数：后续批次的请求与当前批次的写库重叠进行
+        self.in_flight_batches = max(1, int(os.getenv('IN_FLIGHT_BATCHES', 2)))
         self.api_key = os.getenv('API_KEY', "266102ea-ca32-4ad8-8292-17c952a81a56")
         config = {
             'handle_db': 'mgo',
@@ -49,6 +55,8 @@ class UpdateYearOfBuild(BaseModel):
             ]
         }
         super(UpdateYearOfBuild, self).__init__(config)
+        # 每个批次的写操作合并为一次无序 bulk_write
+        self.bulk_writer = MgoBulkWriter(self.mgo_db, batch_size=max(self.batch_size, 1) * 2)
 
     def _normalize_int_field(self, value, field_name):
         """标准化整数字段"""
@@ -99,24 +107,38 @@ class UpdateYearOfBuild(BaseModel):
         
         return imo, mmsi, update_data
 
-    def update_vessel_details(self, mmsi_imo_map):
+    def _build_mmsi_list(self, mmsi_imo_map):
+        """构建有效的MMSI列表"""
+        mmsi_list = []
+        for mmsi_str in mmsi_imo_map.keys():
+            mmsi = self._normalize_int_field(mmsi_str, "mmsi")
+            if mmsi and mmsi > 0:
+                mmsi_list.append(mmsi)
+        return mmsi_list
+
+    def _request_batch(self, mmsi_imo_map):
+        """请求一个批次的档案数据（在线程池中执行）"""
+        mmsi_list = self._build_mmsi_list(mmsi_imo_map)
+        if not mmsi_list:
+            return []
+        return request_wmy_detail(mmsi_list)
+
+    def update_vessel_details(self, mmsi_imo_map, res=None):
         """批量更新船舶详细数据（通过档案查询接口）
         Args:
             mmsi_imo_map: dict, key为mmsi(str)，value为imo(int)，用于跟踪mmsi和imo的对应关系
+            res: 已预取的接口返回数据，为 None 时在此请求
         """
         try:
             # 构建有效的MMSI列表
-            mmsi_list = []
-            for mmsi_str in mmsi_imo_map.keys():
-                mmsi = self._normalize_int_field(mmsi_str, "mmsi")
-                if mmsi and mmsi > 0:
-                    mmsi_list.append(mmsi)
+            mmsi_list = self._build_mmsi_list(mmsi_imo_map)
             
             if not mmsi_list:
                 print("没有有效的MMSI列表")
                 return
             
-            res = request_wmy_detail(mmsi_list)
+            if res is None:
+                res = request_wmy_detail(mmsi_list)
             
             if not res:
                 print("接口返回空，未获取到任何数据")
@@ -124,10 +146,11 @@ class UpdateYearOfBuild(BaseModel):
                 for mmsi_str, imo in mmsi_imo_map.items():
                     mmsi = self._normalize_int_field(mmsi_str, "mmsi")
                     if mmsi:
-                        self.mgo_db["global_vessels"].update_one(
+                        self.bulk_writer.add("global_vessels", pymongo.UpdateOne(
                             {"imo": imo},
                             {"$set": {"info_update_desc": "未获取到详情"}}
-                        )
+                        ))
+                self.bulk_writer.flush("global_vessels")
                 return
             
             print(f"接口返回数据条数: {len(res)}")
@@ -148,12 +171,12 @@ class UpdateYearOfBuild(BaseModel):
                     print(f"⚠ IMO不匹配，跳过 - 期望IMO: {expected_imo}, 返回IMO: {imo}, MMSI: {mmsi}")
                     continue
                 
-                # 更新数据库（全量更新所有字段）
-                self.mgo_db["global_vessels"].update_one(
+                # 更新数据库（全量更新所有字段，不创建新记录，只更新已存在的）
+                self.bulk_writer.add("global_vessels", pymongo.UpdateOne(
                     {"imo": imo},
                     {"$set": update_data},
-                    upsert=False  # 不创建新记录，只更新已存在的
-                )
+                    upsert=False
+                ))
                 updated_count += 1
                 
                 # 输出更新信息
@@ -169,12 +192,15 @@ class UpdateYearOfBuild(BaseModel):
                 if mmsi and mmsi not in returned_mmsi_set:
                     imo = mmsi_imo_map.get(mmsi_str)
                     if imo:
-                        self.mgo_db["global_vessels"].update_one(
+                        self.bulk_writer.add("global_vessels", pymongo.UpdateOne(
                             {"imo": imo},
                             {"$set": {"info_update_desc": "未获取到详情"}}
-                        )
+                        ))
                         missing_count += 1
             
+            # 本批次的写操作一次提交
+            self.bulk_writer.flush("global_vessels")
+            
             if missing_count > 0:
                 print(f"未获取到数据的记录数: {missing_count}")
             
@@ -235,17 +261,38 @@ class UpdateYearOfBuild(BaseModel):
                       for i in range(0, len(mmsi_list), batch_size)]
             
             total_batches = len(batches)
-            for idx, batch_mmsi_list in enumerate(batches, 1):
-                print(f"\n处理批次 {idx}/{total_batches}, 本批次数量: {len(batch_mmsi_list)}")
-                # 构建当前批次的mmsi-imo映射
-                batch_mmsi_imo_map = {mmsi: valid_mmsi_imo_map[mmsi] for mmsi in batch_mmsi_list}
-                self.update_vessel_details(batch_mmsi_imo_map)
-                
-                # 最后一个批次不需要等待
-                if idx < total_batches:
-                    print(f"等待 {self.time_sleep_seconds} 秒后处理下一批次...")
-                    time.sleep(self.time_sleep_seconds)
+            # 上游请求在线程池中预取（最多 in_flight_batches 个在途），主线程按批次顺序写库
+            pending = deque()
+            next_idx = 0
+            last_request_at = None
+            with ThreadPoolExecutor(max_workers=self.in_flight_batches) as executor:
+                while next_idx < total_batches or pending:
+                    while next_idx < total_batches and len(pending) < self.in_flight_batches:
+                        wait = 0
+                        if last_request_at is not None:
+                            wait = last_request_at + self.time_sleep_seconds - time.monotonic()
+                        if wait > 0 and pending:
+                            # 等待"队首批次返回"与"下次请求时间"中先到的一个；队首先返回则先写库
+                            done, _ = futures_wait([pending[0][2]], timeout=wait)
+                            if done:
+                                break
+                            continue
+                        if wait > 0:
+                            print(f"等待 {wait:.1f} 秒后请求下一批次...")
+                            time.sleep(wait)
+                        # 构建当前批次的mmsi-imo映射
+                        batch_mmsi_imo_map = {mmsi: valid_mmsi_imo_map[mmsi] for mmsi in batches[next_idx]}
+                        next_idx += 1
+                        pending.append((next_idx, batch_mmsi_imo_map,
+                                        executor.submit(self._request_batch, batch_mmsi_imo_map)))
+                        last_request_at = time.monotonic()
+
+                    idx, batch_mmsi_imo_map, future = pending.popleft()
+                    print(f"\n处理批次 {idx}/{total_batches}, 本批次数量: {len(batch_mmsi_imo_map)}")
+                    self.update_vessel_details(batch_mmsi_imo_map, future.result())
             
+            write_stats = self.bulk_writer.close().get("global_vessels", {})
+            print(f"批量写入统计: {write_stats}")
             print("\n更新YearOfBuild字段任务完成!")
             
         except Exception as e:
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+台风历史数据回填：原生列目录 + 进程池解析 + 按风暴分区写库 + 已处理文件台账
+"""
+import os
+import hashlib
+import logging
+import datetime
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pymongo
+
+LEDGER_COLLECTION = 'typhoon_file_ledger'
+
+
+def list_files(root, keyword='', suffix=None):
+    """替代 ls -a | grep：root 下文件名包含 keyword（且以 suffix 结尾）的文件，按文件名排序"""
+    paths = []
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if not entry.is_file() or keyword not in entry.name:
+                continue
+            if suffix and not entry.name.endswith(suffix):
+                continue
+            paths.append(entry.path)
+    return sorted(paths)
+
+
+def list_dir_files(root, keyword=''):
+    """root 下目录名包含 keyword 的一级子目录中的全部文件，按 (目录, 文件名) 排序"""
+    paths = []
+    with os.scandir(root) as entries:
+        dirs = sorted(entry.path for entry in entries if entry.is_dir() and keyword in entry.name)
+    for dir_path in dirs:
+        paths.extend(list_files(dir_path))
+    return paths
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_info(path, with_sha1=True):
+    st = os.stat(path)
+    info = {'mtime': st.st_mtime, 'size': st.st_size}
+    if with_sha1:
+        info['sha1'] = file_sha1(path)
+    return info
+
+
+class FileLedger:
+    """
+    已处理文件台账，按 (source, path) 记录 mtime、size、sha1
+    mtime 与 size 都未变的文件直接跳过；有变化时再比较 sha1，内容相同只刷新 mtime
+    """
+
+    def __init__(self, mgo_db, source, collection=LEDGER_COLLECTION):
+        self.source = source
+        self.coll = mgo_db[collection]
+        self.coll.create_index([('source', pymongo.ASCENDING), ('path', pymongo.ASCENDING)],
+                               unique=True, name=f'{collection}_uniq_idx')
+        self._records = {doc['path']: doc for doc in self.coll.find({'source': source}, {'_id': 0})}
+
+    def get(self, path):
+        """台账中该文件上次处理的记录，没有则返回 None"""
+        return self._records.get(path)
+
+    def pending(self, paths):
+        """返回需要处理的 [(path, 文件信息)]，文件信息在处理成功后交给 mark_done"""
+        todo = []
+        touched = []
+        for path in paths:
+            try:
+                info = file_info(path, with_sha1=False)
+            except OSError as e:
+                logging.warning(f'读取文件信息失败 {path}: {e}')
+                continue
+            record = self._records.get(path)
+            if record and record.get('mtime') == info['mtime'] and record.get('size') == info['size']:
+                continue
+            info['sha1'] = file_sha1(path)
+            if record and record.get('sha1') == info['sha1']:
+                touched.append((path, info))
+                continue
+            todo.append((path, info))
+        if touched:
+            self.mark_done(touched)
+        return todo
+
+    def mark_done(self, entries):
+        if not entries:
+            return
+        processed_at = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        ops = []
+        for path, info in entries:
+            record = dict(info, source=self.source, path=path, processed_at=processed_at)
+            self._records[path] = dict(self._records.get(path) or {}, **record)
+            ops.append(pymongo.UpdateOne({'source': self.source, 'path': path}, {'$set': record}, upsert=True))
+        self.coll.bulk_write(ops, ordered=False)
+
+
+class BackfillRunner:
+    """
+    文件按时间顺序排列，每 chunk_files 个为一批：
+    进程池并行执行 parse_func(path)（只解析、不连库），主进程按文件顺序把解析结果交给
+    write_func(results)，由其按风暴分区写库（同一风暴文档在一批内只由一个写入方处理）；
+    写库成功后记台账。下一批的解析与当前批的写库重叠进行
+    """
+
+    def __init__(self, parse_func, write_func, ledger=None, workers=None, chunk_files=None):
+        self.parse_func = parse_func
+        self.write_func = write_func
+        self.ledger = ledger
+        self.workers = workers or int(os.getenv('BACKFILL_WORKERS', os.cpu_count() or 1))
+        self.chunk_files = max(1, chunk_files or int(os.getenv('BACKFILL_CHUNK_FILES', 24)))
+
+    def run(self, paths):
+        if self.ledger is not None and os.getenv('BACKFILL_FORCE', 'false').lower() != 'true':
+            todo = self.ledger.pending(paths)
+        else:
+            todo = [(path, file_info(path)) for path in paths]
+        logging.info(f'回填文件共 {len(paths)} 个，待处理 {len(todo)} 个')
+        if not todo:
+            return 0
+
+        chunks = [todo[i:i + self.chunk_files] for i in range(0, len(todo), self.chunk_files)]
+        done = 0
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            next_chunk = 0
+            while next_chunk < len(chunks) or pending:
+                # 最多预先提交两批解析任务
+                while next_chunk < len(chunks) and len(pending) < 2:
+                    chunk = chunks[next_chunk]
+                    pending.append([(path, info, pool.submit(self.parse_func, path)) for path, info in chunk])
+                    next_chunk += 1
+
+                parsed = []
+                for path, info, future in pending.popleft():
+                    try:
+                        parsed.append((path, info, future.result()))
+                    except Exception as e:
+                        logging.error(f'解析失败 {path}: {e}')
+                if not parsed:
+                    continue
+                self.write_func([result for _, _, result in parsed])
+                if self.ledger is not None:
+                    self.ledger.mark_done([(path, info) for path, info, _ in parsed])
+                done += len(parsed)
+                logging.info(f'回填进度 {done}/{len(todo)}')
+        return done
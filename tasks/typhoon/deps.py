@@ -5,6 +5,8 @@ from time import sleep
 from pkg.util.format import time_CST2UTC
 import os
 import logging
+import pymongo
+import pandas as pd
 
 COEFFICIENT_KT_MS = 0.51444  # 统一kt
 NAUTICAL_MILE_KM = 1.852    # 统一nautical mile
@@ -274,6 +276,313 @@ class HandleGFSTyphoon:
         self._mgo.close()
 
 
+# GFS 预报 CSV 的半径列（km）=> 统一后的字段名（nautical mile）
+GFS_RADIUS_COLUMNS = {
+    "r7_ne": "r34_ne", "r7_se": "r34_se", "r7_sw": "r34_sw", "r7_nw": "r34_nw",
+    "r10_ne": "r50_ne", "r10_se": "r50_se", "r10_sw": "r50_sw", "r10_nw": "r50_nw",
+    "r12_ne": "r64_ne", "r12_se": "r64_se", "r12_sw": "r64_sw", "r12_nw": "r64_nw",
+}
+# gfs_forecast_data 的伴随集合：点级预测点（每个 (风暴, reporttime, forecast_time) 一条）与每个风暴的最新起报视图
+GFS_POINTS_COLLECTION = "gfs_forecast_points"
+GFS_LATEST_COLLECTION = "gfs_forecast_latest"
+# 同一 forecast_time 已存在时，需要覆盖的预测点字段
+GFS_POINT_UPDATE_FIELDS = [
+    "lat", "lon", "minp", "maxsp",
+    "r34_ne", "r34_se", "r34_sw", "r34_nw",
+    "r50_ne", "r50_se", "r50_sw", "r50_nw",
+    "r64_ne", "r64_se", "r64_sw", "r64_nw",
+    "speed", "direction",
+]
+
+
+def _pop_float_column(df, name):
+    """弹出一列并转为 float，列不存在时按 0 处理（同 HandleGFSTyphoon 的 pop 默认值）"""
+    if name in df.columns:
+        return df.pop(name).astype(float)
+    return pd.Series(0.0, index=df.index)
+
+
+def _round_values(values, ndigits):
+    # 逐值使用内置 round，保证与逐行处理的结果完全一致
+    return [round(v, ndigits) for v in values.tolist()]
+
+
+def normalize_gfs_forecast_frame(df):
+    """
+    列式完成 HandleGFSTyphoon 中逐行进行的字段统一：
+    列名转小写、半径 km => nm、最大风速/移速 m/s => kt、补齐 reporttime 并计算 forecast_time
+    返回 (df, year)，year 与 df 同索引
+    """
+    df = df.rename(columns=str.lower)
+    reporttime = df.pop("reporttime_utc").astype(str)
+    reporttime = reporttime.where(reporttime.str.len() == 19, reporttime + " 00:00:00")
+    df["reporttime"] = reporttime
+    for src, dst in GFS_RADIUS_COLUMNS.items():
+        df[dst] = _round_values(_pop_float_column(df, src) / NAUTICAL_MILE_KM, 2)
+    df["maxsp"] = _round_values(_pop_float_column(df, "maxsp") / COEFFICIENT_KT_MS, 0)
+    df["speed"] = _round_values(_pop_float_column(df, "speed") / COEFFICIENT_KT_MS, 0)
+    df["direction"] = _round_values(_pop_float_column(df, "direction"), 0)
+    df["forecast_time"] = (
+        pd.to_datetime(reporttime, format='%Y-%m-%d %H:%M:%S') +
+        pd.to_timedelta(df["leadtime"].astype(float), unit="h")).dt.strftime('%Y-%m-%d %H:%M:%S')
+    year = reporttime.str[:4].astype(int)
+    return df, year
+
+
+def group_gfs_forecast_points(df):
+    """
+    按风暴文档 (stormid, basin, year)、reporttime 分组，保持文件中的行顺序
+    只依赖 pandas，可在子进程中执行；返回值可直接 pickle
+    """
+    df, year = normalize_gfs_forecast_frame(df)
+    storms = {}
+    for record, record_year in zip(df.to_dict('records'), year.tolist()):
+        storm_key = (record.get('stormid'), record.get('basin'), record_year)
+        storm = storms.setdefault(storm_key, {"reporttime": {}, "first": record, "last": record})
+        storm["last"] = record
+        point = dict(record)
+        reporttime = point.pop('reporttime')
+        point.pop('modelname', None)
+        storm["reporttime"].setdefault(reporttime, []).append(point)
+    return storms
+
+
+def merge_gfs_storm_groups(groups):
+    """按文件顺序合并多个 group_gfs_forecast_points 的结果，效果等同于依次处理这些文件"""
+    storms = {}
+    for group in groups:
+        for storm_key, storm in group.items():
+            merged = storms.get(storm_key)
+            if merged is None:
+                storms[storm_key] = {"reporttime": {rt: list(points) for rt, points in storm["reporttime"].items()},
+                                     "first": storm["first"], "last": storm["last"]}
+                continue
+            merged["last"] = storm["last"]
+            for reporttime, points in storm["reporttime"].items():
+                merged["reporttime"].setdefault(reporttime, []).extend(points)
+    return storms
+
+
+def _storm_key_query(storm_keys):
+    return {"$or": [{"stormid": stormid, "basin": basin, "year": year}
+                    for stormid, basin, year in storm_keys]}
+
+
+def ensure_gfs_forecast_point_indexes(mgo_db):
+    """点级集合与最新起报视图的索引（create_index 幂等，可重复调用）"""
+    points = mgo_db[GFS_POINTS_COLLECTION]
+    points.create_index([('stormid', pymongo.ASCENDING), ('basin', pymongo.ASCENDING), ('year', pymongo.ASCENDING),
+                         ('reporttime', pymongo.ASCENDING), ('forecast_time', pymongo.ASCENDING)],
+                        unique=True, name=f'{GFS_POINTS_COLLECTION}_uniq_idx')
+    points.create_index([('gfs_id', pymongo.ASCENDING), ('reporttime', pymongo.ASCENDING),
+                         ('forecast_time', pymongo.ASCENDING)], name='gfs_id_reporttime_idx')
+    points.create_index([('forecast_time', pymongo.ASCENDING)], name='forecast_time_idx')
+    latest = mgo_db[GFS_LATEST_COLLECTION]
+    latest.create_index([('stormid', pymongo.ASCENDING), ('basin', pymongo.ASCENDING), ('year', pymongo.ASCENDING)],
+                        unique=True, name=f'{GFS_LATEST_COLLECTION}_uniq_idx')
+    latest.create_index([('newest_report_time', pymongo.ASCENDING)], name='newest_report_time_idx')
+
+
+def query_gfs_forecast_ids(gfs_coll, storm_keys):
+    """一次查询取回风暴文档的 _id：{(stormid, basin, year): _id}"""
+    if not storm_keys:
+        return {}
+    return {(doc.get('stormid'), doc.get('basin'), doc.get('year')): doc['_id']
+            for doc in gfs_coll.find(_storm_key_query(storm_keys), {"_id": 1, "stormid": 1, "basin": 1, "year": 1})}
+
+
+def save_gfs_forecast_points(bulk_writer, merged_runs, gfs_ids):
+    """
+    把风暴文档中变化的预测点同步到点级集合 gfs_forecast_points（每个 (风暴, reporttime, forecast_time) 一条），
+    并刷新最新起报视图 gfs_forecast_latest（每个风暴一条，保存 reporttime 最大的一次完整预报）
+    merged_runs: {(stormid, basin, year): {reporttime: (合并后的预测点数组, 变化的 forecast_time 集合或 None=全部)}}
+    """
+    mgo_db = bulk_writer.mgo_db
+    stored_newest = {
+        (doc.get('stormid'), doc.get('basin'), doc.get('year')): doc.get('newest_report_time')
+        for doc in mgo_db[GFS_LATEST_COLLECTION].find(
+            _storm_key_query(merged_runs), {"_id": 0, "stormid": 1, "basin": 1, "year": 1, "newest_report_time": 1})
+    }
+    updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for (stormid, basin, year), runs in merged_runs.items():
+        storm = {"stormid": stormid, "basin": basin, "year": year}
+        gfs_id = gfs_ids.get((stormid, basin, year))
+        for reporttime, (points, touched) in runs.items():
+            for point in points:
+                forecast_time = point.get('forecast_time')
+                if touched is not None and forecast_time not in touched:
+                    continue
+                key = dict(storm, reporttime=reporttime, forecast_time=forecast_time)
+                bulk_writer.add(GFS_POINTS_COLLECTION, pymongo.UpdateOne(
+                    key, {"$set": dict(point, gfs_id=gfs_id, **key)}, upsert=True))
+
+        newest = max(runs)
+        if stored_newest.get((stormid, basin, year)) and stored_newest[(stormid, basin, year)] > newest:
+            continue
+        points = sorted(runs[newest][0], key=lambda p: p.get('forecast_time'))
+        if not points:
+            continue
+        bulk_writer.add(GFS_LATEST_COLLECTION, pymongo.UpdateOne(storm, {"$set": {
+            "gfs_id": gfs_id,
+            "newest_report_time": newest,
+            "start_forecast_time": points[0].get('forecast_time'),
+            "end_forecast_time": points[-1].get('forecast_time'),
+            "lat": points[0].get('lat'),
+            "lon": points[0].get('lon'),
+            "points": points,
+            "updated_at": updated_at,
+        }}, upsert=True))
+    bulk_writer.flush(GFS_POINTS_COLLECTION)
+    bulk_writer.flush(GFS_LATEST_COLLECTION)
+
+
+class HandleGFSForecastFile:
+    """
+    整个 GFS 预报 CSV 一次入库：按 (stormid, basin, year, reporttime) 分组，
+    每个风暴文档只查询一次，并把本文件涉及的所有 reporttime 合并为一次更新
+    结果与 HandleGFSTyphoon 逐行 query_gfs_typhoon / insert_forecast_reporttime 一致：
+    已有的 forecast_time 覆盖 GFS_POINT_UPDATE_FIELDS，新的预测点追加到末尾，
+    顶层 end_forecast_time / newest_report_time / lat / lon 取该风暴在文件中的最后一行
+    也可传入已分组（可跨多个文件合并）的 storms，见 merge_gfs_storm_groups
+    """
+
+    def __init__(self, mgo, df=None, storms=None):
+        self._mgo = mgo
+        self._storms = storms if storms is not None else group_gfs_forecast_points(df)
+
+    def _query_existing(self, storms):
+        """一次查询取回本文件涉及的风暴文档中对应 reporttime 的已有预测点"""
+        if not storms:
+            return {}
+        reporttimes = {rt for storm in storms.values() for rt in storm["reporttime"]}
+        projection = {"stormid": 1, "basin": 1, "year": 1}
+        projection.update({f"reporttime.{rt}": 1 for rt in reporttimes})
+        query = {"$or": [{"stormid": stormid, "basin": basin, "year": year}
+                         for stormid, basin, year in storms]}
+        existing = {}
+        for doc in self._mgo.mgo_coll.find(query, projection):
+            existing[(doc.get('stormid'), doc.get('basin'), doc.get('year'))] = doc.get('reporttime') or {}
+        return existing
+
+    @staticmethod
+    def _merge_points(existing_points, points):
+        """返回 (合并后的预测点数组, 本次新增或覆盖的 forecast_time 集合)"""
+        merged = [dict(p) for p in existing_points or []]
+        index = {}
+        for i, p in enumerate(merged):
+            index.setdefault(p.get('forecast_time'), i)
+        touched = set()
+        for point in points:
+            touched.add(point['forecast_time'])
+            i = index.get(point['forecast_time'])
+            if i is None:
+                index[point['forecast_time']] = len(merged)
+                merged.append(point)
+            else:
+                merged[i].update({k: point.get(k) for k in GFS_POINT_UPDATE_FIELDS})
+        return merged, touched
+
+    def build_ops(self):
+        storms = self._storms
+        existing = self._query_existing(storms)
+        ops = []
+        self._merged_runs = {}
+        for (stormid, basin, year), storm in storms.items():
+            last = storm["last"]
+            runs = self._merged_runs[(stormid, basin, year)] = {}
+            existing_reporttime = existing.get((stormid, basin, year), {})
+            update_set = {
+                "end_forecast_time": last['forecast_time'],
+                "newest_report_time": last['reporttime'],
+                "lat": last.get('lat'),
+                "lon": last.get('lon'),
+            }
+            for reporttime, points in storm["reporttime"].items():
+                runs[reporttime] = self._merge_points(existing_reporttime.get(reporttime), points)
+                update_set[f"reporttime.{reporttime}"] = runs[reporttime][0]
+            logging.info(f"{stormid}:{basin}:{year} 合并 {len(storm['reporttime'])} 个报文时刻")
+            ops.append(pymongo.UpdateOne(
+                {"stormid": stormid, "basin": basin, "year": year},
+                {
+                    "$set": update_set,
+                    "$setOnInsert": {
+                        "start_forecast_time": storm["first"]['forecast_time'],
+                        "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    },
+                },
+                upsert=True))
+        return ops
+
+    def save_forecast_data(self, bulk_writer):
+        """写入 bulk_writer 并提交，返回涉及的风暴文档数；风暴文档写入后同步点级集合与最新起报视图"""
+        ops = self.build_ops()
+        for op in ops:
+            bulk_writer.add(self._mgo.collection, op)
+        bulk_writer.flush(self._mgo.collection)
+        if self._merged_runs:
+            gfs_ids = query_gfs_forecast_ids(self._mgo.mgo_coll, self._merged_runs)
+            save_gfs_forecast_points(bulk_writer, self._merged_runs, gfs_ids)
+        return len(ops)
+
+
+# 温州台风网实测/预测点已存在时需要覆盖的字段
+WZ_REALTIME_UPDATE_FIELDS = [
+    "lat", "lon", "strong", "power", "speed", "direction", "maxsp", "minp",
+    "radius34", "radius50", "radius64",
+    "r34_ne", "r34_se", "r34_sw", "r34_nw",
+    "r50_ne", "r50_se", "r50_sw", "r50_nw",
+    "r64_ne", "r64_se", "r64_sw", "r64_nw",
+    "remark",
+]
+WZ_FORECAST_UPDATE_FIELDS = [
+    "lat", "lon", "strong", "power", "speed", "direction", "maxsp", "minp",
+    "radius34", "radius50", "remark",
+]
+
+
+def diff_embedded_points(existing_points, points, key_field, update_fields):
+    """
+    嵌套数组的内存比较：existing_points 为库中已有的点，points 为本次的点，按 key_field（时刻）对齐
+    返回 (new_points, changed, last_new)，与逐点 $push / 按位置 $set 的结果一致：
+      new_points 为库中没有的时刻，按出现顺序（同一批内重复的时刻合并到第一次出现的点上）
+      changed 为库中已有且 update_fields 有变化（含字段缺失）的 {时刻: {字段: 新值}}，同一时刻以最后一次出现为准
+      last_new 为最后一个新时刻第一次出现时的原始点（合并前），用于更新文档顶层的最新位置，没有新时刻时为 None
+    """
+    existing = {}
+    for point in existing_points or []:
+        existing.setdefault(point.get(key_field), point)
+    new_points, new_index, latest = [], {}, {}
+    last_new = None
+    for point in points:
+        key = point.get(key_field)
+        if key in existing:
+            latest[key] = point
+        elif key in new_index:
+            new_points[new_index[key]].update({k: point.get(k) for k in update_fields})
+        else:
+            new_index[key] = len(new_points)
+            new_points.append(dict(point))
+            last_new = point
+    changed = {}
+    for key, point in latest.items():
+        old_point = existing[key]
+        fields = {k: point.get(k) for k in update_fields if k not in old_point or old_point[k] != point.get(k)}
+        if fields:
+            changed[key] = fields
+    return new_points, changed, last_new
+
+
+def positional_set_ops(doc_id, array_path, key_field, changed, extra_set=None):
+    """diff_embedded_points 得到的变化转为按位置（$）更新的 UpdateOne 列表，供一次 bulk_write 提交"""
+    ops = []
+    for key, fields in changed.items():
+        update_set = {f"{array_path}.$.{k}": v for k, v in fields.items()}
+        if extra_set:
+            update_set.update(extra_set)
+        ops.append(pymongo.UpdateOne({"_id": doc_id, f"{array_path}.{key_field}": key}, {"$set": update_set}))
+    return ops
+
+
 class WzTyphoon:
     def __init__(self, mgo, typhoon):
         self._mgo = mgo
@@ -286,6 +595,7 @@ class WzTyphoon:
                 "lon": None,
                 "lat": None,
             })
+        self.stormid = self._insert_data["stormid"]
         self.stormname = self._insert_data["stormname"]
         self.cn_stormname = self._insert_data["cn_stormname"]
         self._points = typhoon.get("points")
@@ -398,134 +708,78 @@ class WzTyphoon:
         return res
 
     def update_real_time_mgo(self, wz_id):
-        for point in self._insert_data["realtime_data"]:
-            aggregate_query = [{
-                "$unwind": "$realtime_data"
-            }, {
-                "$match": {
-                    "_id": wz_id,
-                    "realtime_data.reporttime": point['reporttime'],
-                }
+        """一次读取库中的实测点，在内存中比较：新时刻一次 $push $each，有变化的时刻一次 bulk_write 按位置更新"""
+        doc = self._mgo.mgo_coll.find_one({"_id": wz_id}, {"realtime_data": 1}) or {}
+        new_points, changed, last = diff_embedded_points(
+            doc.get("realtime_data"), self._insert_data["realtime_data"], "reporttime", WZ_REALTIME_UPDATE_FIELDS)
+        ops = positional_set_ops(wz_id, "realtime_data", "reporttime", changed)
+        if ops:
+            r = self._mgo.mgo_coll.bulk_write(ops, ordered=False)
+            logging.info(f"wztfw实测-更新 {r.modified_count}/{len(ops)} 个已有时刻")
+        if new_points:
+            r = self._mgo.mgo_coll.update_one({
+                "_id": wz_id,
             }, {
-                "$project": {
-                    "realtime_data": 1,
-                    "end_time":1
+                "$set": {
+                    "stormname": self.stormname,
+                    "cn_stormname": self.cn_stormname,
+                    "begin_time": self._insert_data["begin_time"],
+                    "end_time": last['reporttime'],
+                    "lat": last.get('lat'),
+                    "lon": last.get('lon'),
+                },
+                "$push": {
+                    "realtime_data": {"$each": new_points}
                 }
-            }]
-            res = list(self._mgo.mgo_coll.aggregate(aggregate_query))
-
-            if res:
-                # logging.info("实测-已有该时刻数据....")
-                r = self._mgo.mgo_coll.update_one(
-                    {
-                        "_id": wz_id,
-                        "realtime_data.reporttime": point['reporttime']
-                    }, {
-                        "$set": {
-                            "realtime_data.$.lat": point.get('lat'),
-                            "realtime_data.$.lon": point.get('lon'),
-                            "realtime_data.$.strong": point.get('strong'),
-                            "realtime_data.$.power": point.get('power'),
-                            "realtime_data.$.speed": point.get('speed'),
-                            "realtime_data.$.direction": point.get('direction'),
-                            "realtime_data.$.maxsp": point.get('maxsp'),
-                            "realtime_data.$.minp": point.get('minp'),
-                            "realtime_data.$.radius34": point.get('radius34'),
-                            "realtime_data.$.radius50": point.get('radius50'),
-                            "realtime_data.$.radius64": point.get('radius64'),
-                            "realtime_data.$.r34_ne": point.get("r34_ne"),
-                            "realtime_data.$.r34_se": point.get("r34_se"),
-                            "realtime_data.$.r34_sw": point.get("r34_sw"),
-                            "realtime_data.$.r34_nw": point.get("r34_nw"),
-                            "realtime_data.$.r50_ne": point.get("r50_ne"),
-                            "realtime_data.$.r50_se": point.get("r50_se"),
-                            "realtime_data.$.r50_sw": point.get("r50_sw"),
-                            "realtime_data.$.r50_nw": point.get("r50_nw"),
-                            "realtime_data.$.r64_ne": point.get("r64_ne"),
-                            "realtime_data.$.r64_se": point.get("r64_se"),
-                            "realtime_data.$.r64_sw": point.get("r64_sw"),
-                            "realtime_data.$.r64_nw": point.get("r64_nw"),
-                            "realtime_data.$.remark": point.get('remark'),
-                        }
-                    },
-                    upsert=True)
-            else:
-                r = self._mgo.mgo_coll.update({
-                    "_id": wz_id,
-                }, {
-                    "$set": {
-                        "stormname": self.stormname,
-                        "cn_stormname": self.cn_stormname,
-                        "begin_time": self._insert_data["begin_time"],
-                        "end_time": point['reporttime'],
-                        "lat": point.get('lat'),
-                        "lon": point.get('lon'),
-                    },
-                    "$push": {
-                        "realtime_data": point
-                    }
-                })
-                print("wztfw实测-嵌套新增成功: ", r)
+            })
+            print(f"wztfw实测-嵌套新增成功: {len(new_points)} 个时刻", r.raw_result)
 
     def update_forecast_mgo(self,wz_id):
+        """同 update_real_time_mgo：只读取本次涉及的 forecast_data.<source>.<reporttime>，所有新预测点合并为一次 $push"""
+        paths = [f"forecast_data.{source}.{reporttime}"
+                 for source, reporttime_points in self._insert_data["forecast_data"].items()
+                 for reporttime in reporttime_points]
+        if not paths:
+            return
+        doc = self._mgo.mgo_coll.find_one({"_id": wz_id}, {path: 1 for path in paths}) or {}
+        ops = []
+        push = {}
         for source, reporttime_points in self._insert_data["forecast_data"].items():
+            existing_source = (doc.get("forecast_data") or {}).get(source) or {}
             for reporttime, points in reporttime_points.items():
-                for point in points:
-                    aggregate_query = [{
-                        "$unwind": f"$forecast_data.{source}.{reporttime}"
-                    }, {
-                        "$match": {
-                            "_id": wz_id,
-                            f"forecast_data.{source}.{reporttime}.forecast_time": point['forecast_time'],
-                        }
-                    }, {
-                        "$project": {
-                            "_id":1
-                        }
-                    }]
-                    res = list(self._mgo.mgo_coll.aggregate(aggregate_query))
-
-                    if res:
-                        # logging.info("预测-已有该时刻数据...")
-                        r = self._mgo.mgo_coll.update_one(
-                            {
-                                "_id": wz_id,
-                                f"forecast_data.{source}.{reporttime}.forecast_time": point['forecast_time']
-                            }, {
-                                "$set": {
-                                    "newest_report_time": self._newest_report_time,
-                                    f"forecast_data.{source}.{reporttime}.$.lat": point.get('lat'),
-                                    f"forecast_data.{source}.{reporttime}.$.lon": point.get('lon'),
-                                    f"forecast_data.{source}.{reporttime}.$.strong": point.get('strong'),
-                                    f"forecast_data.{source}.{reporttime}.$.power": point.get('power'),
-                                    f"forecast_data.{source}.{reporttime}.$.speed": point.get('speed'),
-                                    f"forecast_data.{source}.{reporttime}.$.direction": point.get('direction'),
-                                    f"forecast_data.{source}.{reporttime}.$.maxsp": point.get('maxsp'),
-                                    f"forecast_data.{source}.{reporttime}.$.minp": point.get('minp'),
-                                    f"forecast_data.{source}.{reporttime}.$.radius34": point.get('radius34'),
-                                    f"forecast_data.{source}.{reporttime}.$.radius50": point.get('radius50'),
-                                    f"forecast_data.{source}.{reporttime}.$.remark": point.get('remark'),
-                                }
-                            },
-                            upsert=True)
-                    else:
-                        r = self._mgo.mgo_coll.update({
-                            "_id": wz_id,
-                        }, {
-                            "$set": {
-                                "forecast_sources": self._forecast_sources,
-                                "newest_report_time": self._newest_report_time,
-                                # "end_time": point['forecast_time'],
-                                # "lat": point.get('lat'),
-                                # "lon": point.get('lon'),
-                            },
-                            "$push": {
-                                f"forecast_data.{source}.{reporttime}": point
-                            }
-                        })
-                        print("预测-嵌套新增成功: ", r)
+                new_points, changed, _ = diff_embedded_points(
+                    existing_source.get(reporttime), points, "forecast_time", WZ_FORECAST_UPDATE_FIELDS)
+                ops.extend(positional_set_ops(wz_id, f"forecast_data.{source}.{reporttime}", "forecast_time", changed,
+                                              extra_set={"newest_report_time": self._newest_report_time}))
+                if new_points:
+                    push[f"forecast_data.{source}.{reporttime}"] = {"$each": new_points}
+        if ops:
+            r = self._mgo.mgo_coll.bulk_write(ops, ordered=False)
+            logging.info(f"预测-更新 {r.modified_count}/{len(ops)} 个已有时刻")
+        if push:
+            r = self._mgo.mgo_coll.update_one({
+                "_id": wz_id,
+            }, {
+                "$set": {
+                    "forecast_sources": self._forecast_sources,
+                    "newest_report_time": self._newest_report_time,
+                },
+                "$push": push
+            })
+            print(f"预测-嵌套新增成功: {len(push)} 组起报", r.raw_result)
 
 
+    def sync(self, mgo=None):
+        '''已存在则更新实测和预测数据，否则新增；mgo 用于进程池中解析后重新绑定连接'''
+        if mgo is not None:
+            self._mgo = mgo
+        res = self.query_wz_exist()
+        if res:
+            self.update_real_time_mgo(res.get('_id'))
+            self.update_forecast_mgo(res.get('_id'))
+        else:
+            self.save_mgo()
+
     def save_mgo(self):
         '''如果数据库没有该条数据，则增加该条数据'''
         self._insert_data.pop("points", None)
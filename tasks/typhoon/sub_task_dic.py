@@ -21,6 +21,9 @@ def get_task_dic():
         "match_typhoon_gfs_forecast": (lambda: MatchTyphoonGfsForecast(), "台风离线定时自动匹配=> 匹配实时和gfs预报"),
         "history_match_typhoon_gfs_forecast": (lambda: MatchTyphoonGfsForecast().history(), "历史:台风离线定时自动匹配=> 匹配实时和gfs预报"),
         "history_wztfw_sync_mgo": (lambda: WZCurrSyncMgo().history(), "历史:一次性台风实时预报双数据同步=> 温州台风网源(需传HISTORY_YEAR)"),
+        "watch_gfs_forecast_sync_mgo": (lambda: GfsForecastSyncMgo().watch(),'事件驱动:台风预报数据同步=> GFS预报源(监听INPUT_PATH，文件到达即入库)'),
+        "watch_gfs_realtime_sync_mgo": (lambda: GfsRealtimeSyncMgo().watch(),'事件驱动:台风实时数据同步=> tcvital源(监听INPUT_PATH，文件到达即入库)'),
+        "rebuild_gfs_forecast_points": (lambda: GfsForecastSyncMgo().rebuild_points(),'一次性:由gfs_forecast_data重建点级集合与最新起报视图(可传HISTORY_YEAR)'),
         "history_gfs_forecast_sync_mgo": (lambda: GfsForecastSyncMgo().history(),'历史:一次性台风预报数据同步=> GFS预报源(需传HISTORY_YEAR)'),
     }
     return task_dict
@@ -7,12 +7,34 @@ import pymongo
 from pandas.errors import EmptyDataError
 import pandas as pd
 from pkg.public.models import BaseModel
-from tasks.typhoon.deps import HandleGFSTyphoon
-import subprocess
+from tasks.typhoon.deps import (HandleGFSForecastFile, group_gfs_forecast_points, merge_gfs_storm_groups,
+                                ensure_gfs_forecast_point_indexes, save_gfs_forecast_points)
+from tasks.typhoon.backfill import BackfillRunner, FileLedger, list_files
+from tasks.typhoon.watch import watch_ingest
+from pkg.db.mongo import MgoBulkWriter
 from pkg.public.decorator import decorate
 INPUT_PATH = os.getenv('INPUT_PATH', "/Users/jiufangkeji/Documents/JiufangCodes/ls-handler-task/gfs/")
 
 
+def is_gfs_file(name):
+    return "gfs_" in name and "swp" not in name and "csv" in name
+
+
+def list_gfs_files(keyword):
+    return [path for path in list_files(INPUT_PATH, keyword) if is_gfs_file(os.path.basename(path))]
+
+
+def parse_gfs_forecast_file(gfs_file):
+    """读取并按风暴分组一个 GFS 预报 CSV（可在进程池中执行，不连库）"""
+    try:
+        df = pd.read_csv(gfs_file)
+    except EmptyDataError as e:
+        return {}
+    if df.empty:
+        return {}
+    return group_gfs_forecast_points(df)
+
+
 class GfsForecastSyncMgo(BaseModel):
     def __init__(self):
         config = {
@@ -39,56 +61,90 @@ class GfsForecastSyncMgo(BaseModel):
             }
         super(GfsForecastSyncMgo, self).__init__(config)
         self.HISTORY_YEAR = os.getenv('HISTORY_YEAR', "2024")  
+        self.bulk_writer = MgoBulkWriter(self.mgo_db, batch_size=int(os.getenv('BATCH_SIZE', 500)))
+        ensure_gfs_forecast_point_indexes(self.mgo_db)
+
+    def ingest_file(self, gfs_file):
+        """整个 CSV 按风暴分组后批量入库，返回涉及的风暴文档数"""
+        storms = parse_gfs_forecast_file(gfs_file)
+        if not storms:
+            return 0
+        print(gfs_file)
+        return self.write_storm_groups([storms])
+
+    def write_storm_groups(self, groups):
+        """一批文件的分组结果按文件顺序合并，每个风暴文档只写一次，不同文件之间不会互相覆盖"""
+        storms = merge_gfs_storm_groups(groups)
+        errors_before = self.bulk_writer.stats.get(self.mgo.collection, {}).get('write_errors', 0)
+        num = HandleGFSForecastFile(mgo=self.mgo, storms=storms).save_forecast_data(self.bulk_writer)
+        print(f"本批 {len(groups)} 个文件，更新 {num} 个风暴文档")
+        if self.bulk_writer.stats.get(self.mgo.collection, {}).get('write_errors', 0) > errors_before:
+            # 抛出后本批文件不记入台账，重跑时会重新处理
+            raise RuntimeError("本批风暴文档写入失败")
+        return num
 
     def history(self):
         try:
-            res = subprocess.getoutput(f"ls -a {INPUT_PATH} |grep gfs_{self.HISTORY_YEAR}")
-            list_gfs = res.split('\n')
-            list_gfs.sort(reverse=False)
+            list_gfs = list_gfs_files(f"gfs_{self.HISTORY_YEAR}")
             print(list_gfs)
-            for file in list_gfs:
-                if "swp" in file:
-                    continue
-                if "csv" not in file:
-                    continue
-                gfs_file = INPUT_PATH + file
-                print(gfs_file)
-                try:
-                    df = pd.read_csv(gfs_file)
-                except EmptyDataError as e:
-                    continue
-                for index, row in df.iterrows():
-                    handle_typhoon = HandleGFSTyphoon(mgo=self.mgo,row=row,year=self.HISTORY_YEAR)
-                    flag = handle_typhoon.query_gfs_typhoon()
-                    if flag:
-                        handle_typhoon.save_forecast_data()
+            runner = BackfillRunner(parse_gfs_forecast_file, self.write_storm_groups,
+                                    ledger=FileLedger(self.mgo_db, "gfs_forecast"))
+            runner.run(list_gfs)
+            print("批量写入统计:", self.bulk_writer.close().get(self.mgo.collection, {}))
 
         except Exception as e:
             logging.error('run error {}'.format(e))
         finally:
             self.close()
     
+    def rebuild_points(self):
+        """一次性：由已有的 gfs_forecast_data 重建点级集合与最新起报视图（可重复执行）"""
+        try:
+            year_query = {"year": int(self.HISTORY_YEAR)} if os.getenv('HISTORY_YEAR') else {}
+            # 每次提交的风暴文档数（单个文档可能有上百个起报时次）
+            chunk_storms = max(1, int(os.getenv('REBUILD_CHUNK_STORMS', 50)))
+            num = 0
+            merged_runs, gfs_ids = {}, {}
+            for doc in self.mgo.mgo_coll.find(year_query, {"stormid": 1, "basin": 1, "year": 1, "reporttime": 1}):
+                storm_key = (doc.get('stormid'), doc.get('basin'), doc.get('year'))
+                runs = {rt: (points, None) for rt, points in (doc.get('reporttime') or {}).items() if points}
+                if not runs:
+                    continue
+                merged_runs[storm_key] = runs
+                gfs_ids[storm_key] = doc['_id']
+                if len(merged_runs) >= chunk_storms:
+                    save_gfs_forecast_points(self.bulk_writer, merged_runs, gfs_ids)
+                    num += len(merged_runs)
+                    merged_runs, gfs_ids = {}, {}
+            if merged_runs:
+                save_gfs_forecast_points(self.bulk_writer, merged_runs, gfs_ids)
+                num += len(merged_runs)
+            print(f"重建 {num} 个风暴文档的点级数据")
+            print("批量写入统计:", self.bulk_writer.close())
+        except Exception as e:
+            logging.error('rebuild error {}'.format(e))
+        finally:
+            self.close()
+
+    def watch(self):
+        """事件驱动模式：监听 INPUT_PATH，GFS 预报文件写完即入库，每个新文件（或内容变化的文件）只处理一次"""
+        try:
+            watch_ingest(INPUT_PATH, "gfs_forecast", self.mgo_db,
+                         lambda gfs_file, record: {"storms": self.ingest_file(gfs_file)},
+                         match=is_gfs_file)
+        except Exception as e:
+            logging.error('watch error {}'.format(e))
+        finally:
+            self.close()
+
     @decorate.exception_capture_close_datebase
     def run(self):
         date_now = (datetime.datetime.now() + datetime.timedelta(hours=-9)).strftime("%Y%m%d")
         print(f'当前启动任务，入库时间== {date_now} ==')
         # date_now = "20220706"
-        YEAR = date_now[:4]
-        res = subprocess.getoutput(f"ls -a {INPUT_PATH} |grep gfs_{date_now}")
-        if res:
-            list_gfs = res.split('\n')
-            list_gfs.sort(reverse=False)
+        list_gfs = list_gfs_files(f"gfs_{date_now}")
+        if list_gfs:
             print(list_gfs)
-            for file in list_gfs:
-                gfs_file = INPUT_PATH + file
-                print(gfs_file)
-                try:
-                    df = pd.read_csv(gfs_file)
-                except EmptyDataError as e:
-                    continue  
-                else:
-                    for index, row in df.iterrows():
-                        handle_typhoon = HandleGFSTyphoon(mgo=self.mgo,row=row,year=YEAR)
-                        flag = handle_typhoon.query_gfs_typhoon()
-                        if flag:
-                            handle_typhoon.save_forecast_data()
\ No newline at end of file
+            for gfs_file in list_gfs:
+                self.ingest_file(gfs_file)
+            print("批量写入统计:", self.bulk_writer.close().get(self.mgo.collection, {}))
\ No newline at end of file
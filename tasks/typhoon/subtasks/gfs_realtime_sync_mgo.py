@@ -9,7 +9,16 @@ import subprocess
 from pkg.public.models import BaseModel
 from pkg.public.decorator import decorate
 from tasks.typhoon.deps import HandleGFSTyphoon
+from tasks.typhoon.watch import watch_ingest
 INPUT_PATH = os.getenv('INPUT_PATH', "/Users/jiufangkeji/Documents/JiufangCodes/ls-handler-task/input/")
+# tcvitals 文件缺少表头时读取使用的列名
+TCVITALS_COLUMNS = ["StormID", "StormName", "reporttime_UTC", "ModelName", "LeadTime", "Lat", "Lon", "MinP", "MaxSP",
+                    "direction", "speed", "R7_NE", "R7_SE", "R7_SW", "R7_NW", "R10_NE", "R10_SE", "R10_SW", "R10_NW",
+                    "R12_NE", "R12_SE", "R12_SW", "R12_NW"]
+
+
+def is_tcvitals_file(name):
+    return name.startswith("tcvitals_2_") and name.endswith(".csv")
 
 
 class GfsRealtimeSyncMgo(BaseModel):
@@ -29,7 +38,40 @@ class GfsRealtimeSyncMgo(BaseModel):
         super(GfsRealtimeSyncMgo, self).__init__(config)
         self.GLOBAL_ROWS_TYPHOON = int(os.getenv('GLOBAL_ROWS_TYPHOON', 0))
         self.GLOBAL_YEAR = int(os.getenv('GLOBAL_YEAR', 2025))
-   
+
+    def read_tcvitals(self, csv_file):
+        """读取 tcvitals 文件；缺少表头时按列名读取，不改写文件（改写会再次触发文件监听）"""
+        with open(csv_file, 'r', encoding='utf-8') as file:
+            has_header = file.readline().startswith("StormID")
+        if has_header:
+            return pd.read_csv(csv_file)
+        print(f"文件 '{csv_file}' 缺少表头，按默认列名读取。")
+        return pd.read_csv(csv_file, header=None, names=TCVITALS_COLUMNS)
+
+    def ingest_file(self, csv_file, processed_rows=0, year=None):
+        """入库 processed_rows 之后的新行（多回溯 5 行以覆盖被修订的记录），返回文件总行数"""
+        df = self.read_tcvitals(csv_file)
+        for index, row in df.iterrows():
+            if index < (processed_rows-5):
+                continue
+            handle_typhoon = HandleGFSTyphoon(mgo=self.mgo,year=year,row=row)
+            handle_typhoon.save_realtime_data()
+            handle_typhoon.close()
+        return len(df)
+
+    def watch(self):
+        """事件驱动模式：监听 INPUT_PATH，tcvitals 文件每次写入后只入库新增的行，已处理行数记在台账中"""
+        def handle_file(csv_file, record):
+            processed_rows = (record or {}).get("rows", 0)
+            return {"rows": self.ingest_file(csv_file, processed_rows)}
+
+        try:
+            watch_ingest(INPUT_PATH, "gfs_realtime", self.mgo_db, handle_file, match=is_tcvitals_file)
+        except Exception as e:
+            logging.error('watch error {}'.format(e))
+        finally:
+            self.close()
+
     @decorate.exception_capture_close_datebase
     def run(self):
         YEAR = (datetime.datetime.now() + datetime.timedelta(hours=-9)).year
@@ -51,33 +93,7 @@ class GfsRealtimeSyncMgo(BaseModel):
             if self.GLOBAL_ROWS_TYPHOON == temp_rows_typhoon:
                 print(f'该时刻暂无新台风值')
             else: 
-                # 定义新的表头
-                new_header = "StormID,StormName,reporttime_UTC,ModelName,LeadTime,Lat,Lon,MinP,MaxSP,direction,speed,R7_NE,R7_SE,R7_SW,R7_NW,R10_NE,R10_SE,R10_SW,R10_NW,R12_NE,R12_SE,R12_SW,R12_NW\n"
-
-                # 打开文件并逐行读取
-                with open(csv_file, 'r', encoding='utf-8') as file:
-                    content = file.read()
-
-                # 检查文件的第一行是否以 "StormID" 开头
-                if not content.startswith("StormID"):
-                    # 如果不是，则在文件内容的开头插入新的表头
-                    content = new_header + content
-                    print("文件已更新，新表头已插入。")
-                    # 将修改后的内容写回到文件
-                    with open(csv_file, 'w', encoding='utf-8') as file:
-                        file.write(content)
-
-                    print(f"文件 '{csv_file}' 已更新完成。")
-                else:
-                    print("文件已包含正确的表头，无需修改。")
-
-                df = pd.read_csv(csv_file)
-                for index, row in df.iterrows():
-                    if index < (self.GLOBAL_ROWS_TYPHOON-5):
-                        continue
-                    handle_typhoon = HandleGFSTyphoon(mgo=self.mgo,year=YEAR,row=row)
-                    handle_typhoon.save_realtime_data()
-                    handle_typhoon.close()
+                self.ingest_file(csv_file, self.GLOBAL_ROWS_TYPHOON, YEAR)
 
             self.GLOBAL_ROWS_TYPHOON = temp_rows_typhoon
             print(f'定时任务运行完毕，此时GLOBAL_ROWS_TYPHOON={self.GLOBAL_ROWS_TYPHOON}')
\ No newline at end of file
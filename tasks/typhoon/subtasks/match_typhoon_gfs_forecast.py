@@ -2,12 +2,63 @@
 # -*- coding: utf-8 -*-
 from pkg.public.models import BaseModel
 from pkg.public.decorator import decorate
-from pkg.util.format import distance
+from pkg.util.format import great_circle_degrees
+from tasks.typhoon.deps import GFS_LATEST_COLLECTION
 import datetime
 import pytz
-import copy
 import logging
 import os
+import numpy as np
+
+# 实时台风只取匹配用到的顶层字段，嵌套数组只取首末两点
+REALTIME_FIELDS = ["stormid", "stormname", "year", "lat", "lon", "start_reporttime", "end_reporttime",
+                   "begin_time", "newest_report_time"]
+# 增量匹配状态：{"来源:_id": 签名}，签名为 结束时间|当前经纬度，另存 GFS 最新起报视图的版本
+MATCH_STATE_KEY = "typhoon_match_state"
+MATCH_STATE_GFS_VERSION = "__gfs_version__"
+MATCH_STATE_EXPIRE = 7 * 24 * 3600
+
+
+def first_point(points):
+    """嵌套数组首点的 (lat, lon)，缺失时返回 None"""
+    if not points:
+        return None
+    lat, lon = points[0].get('lat'), points[0].get('lon')
+    if lat is None or lon is None:
+        return None
+    return float(lat), float(lon)
+
+
+def first_points(docs, field):
+    """多个台风文档首点的 (lat 数组, lon 数组)，缺失的点为 nan（与任何距离比较均为 False）"""
+    points = [first_point(doc.get(field)) or (np.nan, np.nan) for doc in docs]
+    if not points:
+        return np.empty(0), np.empty(0)
+    lat, lon = zip(*points)
+    return np.array(lat, dtype=float), np.array(lon, dtype=float)
+
+
+class GfsCandidates:
+    """时间段内的 GFS 候选风暴（最新起报首点），按实时台风的时间段过滤后向量化计算大圆距离取最近"""
+
+    def __init__(self, docs):
+        self.docs = [doc for doc in docs
+                     if doc.get('gfs_id') and doc.get('lat') is not None and doc.get('lon') is not None]
+        self.report_times = np.array([doc.get('newest_report_time') or '' for doc in self.docs], dtype=str)
+        self.lats = np.array([doc['lat'] for doc in self.docs], dtype=float)
+        self.lons = np.array([doc['lon'] for doc in self.docs], dtype=float)
+
+    def nearest(self, lat, lon, start_reporttime, end_reporttime):
+        """返回 (最近的候选文档, 距离)，时间段内没有候选时返回 (None, None)；距离相同时取查询结果中靠前的"""
+        if not self.docs:
+            return None, None
+        idx = np.flatnonzero((self.report_times >= start_reporttime) & (self.report_times <= end_reporttime))
+        if not idx.size:
+            return None, None
+        diffs = great_circle_degrees(lat, lon, self.lats[idx], self.lons[idx])
+        best = int(np.argmin(diffs))
+        return self.docs[idx[best]], float(diffs[best])
+
 
 class MatchTyphoonGfsForecast(BaseModel):
     START_DELAY_DAY = int(os.getenv("START_DELAY_DAY",103))
@@ -16,8 +67,9 @@ class MatchTyphoonGfsForecast(BaseModel):
     DEFAULT_MIN_FOR_DISTANCE = int(os.getenv("DEFAULT_MIN_FOR_DISTANCE",10))
     DEFAULT_MIN_HIS_DISTANCE = int(os.getenv("DEFAULT_MIN_HIS_DISTANCE",30))
     GFS_DELAY_DAYS = 1
+    MATCH_INCREMENTAL = os.getenv("MATCH_INCREMENTAL", "true").lower() == "true"
     def __init__(self, config=None):
-        config = {'handle_db': 'mgo'}
+        config = {'handle_db': 'mgo', 'cache_rds': self.MATCH_INCREMENTAL}
         super().__init__(config)
         
     def update_gfs_id(self, realtimesource, typhoon_id, gfs_id):
@@ -45,77 +97,80 @@ class MatchTyphoonGfsForecast(BaseModel):
                         upsert=True)
                 print("    >>>> 温州台风网 gfs_id update ok,res:", r.matched_count)
         
+    def match_wz_duplicates(self, wz, others):
+        """
+        温州台风网的台风与 GFS/SSEC 台风去重：同名或首点大圆距离小于 DEFAULT_MIN_DUP_DISTANCE 视为同一台风，
+        wz 取最后一个匹配台风的 stormid、year；返回匹配到的 others 下标
+        """
+        origin = first_point(wz.get('realtime_data'))
+        if origin is None or not others:
+            return []
+        diffs = great_circle_degrees(origin[0], origin[1], *first_points(others, 'datatime'))
+        stormname = wz.get("stormname")
+        matched = [idx for idx, other in enumerate(others)
+                   if other.get("stormname") == stormname or diffs[idx] < self.DEFAULT_MIN_DUP_DISTANCE]
+        if matched:
+            wz["stormid"] = others[matched[-1]]["stormid"]
+            wz["year"] = others[matched[-1]]["year"]
+        return matched
+
+    def find_realtime(self, collection, array_field, query):
+        """按时间段查询实时台风，投影只保留 REALTIME_FIELDS 与嵌套数组 array_field 的首末点（[首点, 末点]）"""
+        if not self.mgo_db:
+            return []
+        project = {field: 1 for field in REALTIME_FIELDS}
+        project["_first"] = {"$arrayElemAt": [f"${array_field}", 0]}
+        project["_last"] = {"$arrayElemAt": [f"${array_field}", -1]}
+        docs = []
+        for doc in self.mgo_db[collection].aggregate([{"$match": query}, {"$project": project}]):
+            first, last = doc.pop("_first", None), doc.pop("_last", None)
+            doc[array_field] = [point for point in (first, last) if point]
+            docs.append(doc)
+        return docs
+
     def query_real_time_typhoon(self):
         new_typhoon = []
         gfs_realtime_query = {"datatime.reporttime": {'$gte': self.start_time, "$lte": self.end_time}}
         wz_realtime_query = {"realtime_data.reporttime": {'$gte': self.start_time, "$lte": self.end_time}}
         gfs_res,ssec_res,wztfw_res = [],[],[]
         if self.mgo_db:
-            gfs_res = list(self.mgo_db["gfs_realtime_data"].find(gfs_realtime_query))
-            ssec_res = list(self.mgo_db["ssec_realtime_data"].find(gfs_realtime_query))
-            wztfw_res = list(self.mgo_db["wztfw_data"].find(wz_realtime_query))
-        gfs_storm_list = [gfs.get("stormid") for gfs in gfs_res]  # 用于过滤 SSEC
+            gfs_res = self.find_realtime("gfs_realtime_data", "datatime", gfs_realtime_query)
+            ssec_res = self.find_realtime("ssec_realtime_data", "datatime", gfs_realtime_query)
+            wztfw_res = self.find_realtime("wztfw_data", "realtime_data", wz_realtime_query)
+        gfs_storm_list = {gfs.get("stormid") for gfs in gfs_res}  # 用于过滤 SSEC
 
-        
-        new_gfs_res = list(copy.deepcopy(gfs_res))
         # 匹配 ssec 源数据
         new_ssec = []
         for ssec in ssec_res:
-            stormid = ssec.get("stormid")
-            if stormid not in gfs_storm_list:
+            if ssec.get("stormid") not in gfs_storm_list:
                 ssec["realtimesource"] = "ssec"
                 new_ssec.append(ssec)
 
+        # 温州台风网各台风的首点，TD 去重时一次算出两两之间的距离
+        named_wz = [wz for wz in wztfw_res if wz.get("stormname") != "TD"]
+        named_lat, named_lon = first_points(named_wz, 'realtime_data')
         # 匹配 温州台风 源数据
         for wz in wztfw_res:
             stormname = wz.get("stormname")
             if stormname == "TD":
-                # 内循环 - 去除 与台风 重复的TD， 有台风有TD
-                for i in wztfw_res:
-                    if i.get("stormname") != stormname:
-                        try:
-                            diff =distance(i['realtime_data'][0]['lat'], i['realtime_data'][0]['lon'],
-                                                      wz['realtime_data'][0]['lat'], wz['realtime_data'][0]['lon'])
-                            if diff > self.DEFAULT_MIN_DUP_DISTANCE:
-                                wz["realtimesource"] = "中国"
-                                new_typhoon.append(wz)
-                                print(f">> TD:WZTF append {stormname}")
-                        except Exception as e:
-                            logging.error(f"温州台风计算错误")
-                            break
+                # 去除 与台风 重复的TD：与任一台风的距离大于 DEFAULT_MIN_DUP_DISTANCE 即保留
+                origin = first_point(wz.get('realtime_data'))
+                if origin is None:
+                    logging.error(f"温州台风计算错误")
+                    continue
+                diffs = great_circle_degrees(origin[0], origin[1], named_lat, named_lon)
+                if (diffs > self.DEFAULT_MIN_DUP_DISTANCE).any():
+                    wz["realtimesource"] = "中国"
+                    new_typhoon.append(wz)
+                    print(f">> TD:WZTF append {stormname}")
             else:
-                # 外循环gfs - 去除GFS中与温州台风网相同的台风
-                for i in gfs_res:
-                    # print(f"i['stormid']={i['stormid']},i['stormname']={i['stormname']},stormname={stormname}")
-                    diff =distance(i['datatime'][0]['lat'], i['datatime'][0]['lon'],
-                                              wz['realtime_data'][0]['lat'], wz['realtime_data'][0]['lon'])
-                    
-                    if i.get("stormname") == stormname:
-                        wz["stormid"] = i["stormid"]
-                        wz["year"] = i["year"]
-                        new_gfs_res.remove(i)
-                    else:
-                        if diff < self.DEFAULT_MIN_DUP_DISTANCE:
-                            wz["stormid"] = i["stormid"]
-                            wz["year"] = i["year"]
-                            new_gfs_res.remove(i)
-                            
-                for i in new_ssec:
-                    diff =distance(i['datatime'][0]['lat'], i['datatime'][0]['lon'],
-                                              wz['realtime_data'][0]['lat'], wz['realtime_data'][0]['lon'])
-                    
-                    if i.get("stormname") == stormname:
-                        wz["stormid"] = i["stormid"]
-                        wz["year"] = i["year"]
-                        new_ssec.remove(i)
-                    else:
-                        if diff < self.DEFAULT_MIN_DUP_DISTANCE:
-                            wz["stormid"] = i["stormid"]
-                            wz["year"] = i["year"]
-                            new_ssec.remove(i)
+                # 去除GFS、SSEC中与温州台风网相同的台风
+                self.match_wz_duplicates(wz, gfs_res)
+                matched = set(self.match_wz_duplicates(wz, new_ssec))
+                new_ssec = [ssec for idx, ssec in enumerate(new_ssec) if idx not in matched]
                 wz["realtimesource"] = "中国"
                 new_typhoon.append(wz)
-        wztfw_name = [tf.get("stormname") for tf in new_typhoon]
+        wztfw_name = {tf.get("stormname") for tf in new_typhoon}
 
         for g in gfs_res:
             if g["stormname"] in wztfw_name:
@@ -130,112 +185,122 @@ class MatchTyphoonGfsForecast(BaseModel):
             print(f">> src={i['realtimesource']} , stormid = {i['stormid']}-{i.get('stormname')}")
         
         return new_typhoon
-    
-    def query_forecast_typhoon(self, typhoons):
-        """根据gfs实时数据源去匹配"""
+
+    def load_gfs_candidates(self, start_reporttime, end_reporttime):
+        """一次范围查询载入时间段内所有 GFS 风暴最新一次起报的首点（最新起报视图，按 newest_report_time 索引）"""
+        gfs_query = {"newest_report_time": {'$gte': start_reporttime, "$lte": end_reporttime}}
+        docs = []
+        if self.mgo_db:
+            docs = list(self.mgo_db[GFS_LATEST_COLLECTION].find(
+                gfs_query, {"_id": 0, "gfs_id": 1, "stormid": 1, "basin": 1, "newest_report_time": 1, "lat": 1, "lon": 1}))
+        return GfsCandidates(docs)
+
+    def match_forecast(self, targets, max_distance):
+        """targets 中每个实时台风取时间段内首点大圆距离最近的 GFS 风暴，距离不超过 max_distance 时回写 gfs_id"""
+        if not targets:
+            return
+        candidates = self.load_gfs_candidates(min(t['start_reporttime'] for t in targets),
+                                              max(t['end_reporttime'] for t in targets))
+        for t in targets:
+            gfs, diff = candidates.nearest(t['lat'], t['lon'], t['start_reporttime'], t['end_reporttime'])
+            if gfs is None:
+                continue
+            if diff <= max_distance:
+                print(f"  >> {t['typhoon_id']}:{t['realtimesource']}:{t['stormid']}:{t['stormname']} -> choose_gfs {gfs.get('stormid')}:{gfs.get('basin')} -> short_diff {diff} -> {gfs['gfs_id']}")
+                self.update_gfs_id(t['realtimesource'], t['typhoon_id'], gfs['gfs_id'])
+
+    def gfs_version(self):
+        """GFS 最新起报视图的版本（最近一次刷新时间），变化时所有实时台风都需要重新匹配"""
+        doc = None
+        if self.mgo_db:
+            doc = self.mgo_db[GFS_LATEST_COLLECTION].find_one({}, {"_id": 0, "updated_at": 1}, sort=[("updated_at", -1)])
+        return str((doc or {}).get("updated_at"))
+
+    def load_match_state(self):
+        if not getattr(self, 'cache_rds', None):
+            return {}
+        try:
+            return self.cache_rds.hgetall(MATCH_STATE_KEY) or {}
+        except Exception as e:
+            logging.warning(f'读取台风匹配状态失败: {e}')
+            return {}
+
+    def save_match_state(self, state):
+        """整体替换上次的状态，已离开时间窗的台风随之清除"""
+        if not getattr(self, 'cache_rds', None):
+            return
+        try:
+            pipe = self.cache_rds.pipeline()
+            pipe.delete(MATCH_STATE_KEY)
+            pipe.hset(MATCH_STATE_KEY, mapping=state)
+            pipe.expire(MATCH_STATE_KEY, MATCH_STATE_EXPIRE)
+            pipe.execute()
+        except Exception as e:
+            logging.warning(f'写入台风匹配状态失败: {e}')
+
+    def changed_targets(self, targets):
+        """
+        增量匹配：只保留结束时间或当前位置与上次运行不同的实时台风（GFS 视图有刷新时全部保留）
+        返回 (需要匹配的 targets, 本次运行的新状态)
+        """
+        state = {f"{t['realtimesource']}:{t['typhoon_id']}": f"{t['end_reporttime']}|{t['lat']}|{t['lon']}"
+                 for t in targets}
+        state[MATCH_STATE_GFS_VERSION] = self.gfs_version()
+        previous = self.load_match_state()
+        if previous.get(MATCH_STATE_GFS_VERSION) != state[MATCH_STATE_GFS_VERSION]:
+            print(f"> GFS 预报有更新，全部 {len(targets)} 个台风重新匹配")
+            return targets, state
+        changed = [t for t in targets
+                   if previous.get(f"{t['realtimesource']}:{t['typhoon_id']}") != state[f"{t['realtimesource']}:{t['typhoon_id']}"]]
+        print(f"> 增量匹配：{len(changed)}/{len(targets)} 个台风有变化")
+        return changed, state
+
+    def query_forecast_typhoon(self, typhoons, incremental=False):
+        """根据gfs实时数据源去匹配；incremental 时只匹配与上次运行相比有变化的台风"""
+        targets = []
         for typhoon in typhoons:
             typhoon_id = typhoon.get("_id")
             realtimesource = typhoon.get("realtimesource", "gfs")  # 区分当前台风的来源
-            baseInfo = {}
             # 获取 不同数据源的 相同变量 -> 统一
             stormid = typhoon.get('stormid')
-            year = int(typhoon.get('year', 0))
             ori_lon = typhoon.get('lon')
             ori_lat = typhoon.get('lat')
             print(ori_lon, ori_lat)
             stormname = None
             if realtimesource == "中国":
-                if len(stormid) > 4:
-                    baseInfo['stormID'] = f"{stormid}"
-                else:
-                    baseInfo['stormID'] = f"{year}{stormid}"
                 stormname = typhoon.get('stormname')
                 datatime = typhoon.get('realtime_data')
                 if datatime:
                     start_reporttime = datatime[0]['reporttime']
                     end_reporttime = datatime[-1].get('reporttime')
                 else:
-                    start_reporttime = typhoon.get['begin_time']
+                    start_reporttime = typhoon.get('begin_time')
                     end_reporttime = typhoon.get('newest_report_time')
             elif realtimesource == "ssec":
-                if len(stormid) > 4:
-                    baseInfo['stormID'] = f"{stormid}"
-                else:
-                    baseInfo['stormID'] = f"{year}{stormid}"
                 datatime = typhoon.get('datatime')
                 start_reporttime = datatime[0]['reporttime']
                 end_reporttime = typhoon.get('end_reporttime')
             else:
-                baseInfo['stormID'] = f"{year}{stormid}"
                 stormname = typhoon.get('stormname')
-                datatime = typhoon.get('datatime')
                 start_reporttime = typhoon.get('start_reporttime')
                 end_reporttime = typhoon.get('end_reporttime')
             if not start_reporttime or not end_reporttime:
                 print(f"start_reporttime & end_reporttime 缺失 -> pass")
                 continue
-            
+            if ori_lat is None or ori_lon is None:
+                continue
 
             # gfs 查询gfs符合时间段的所有的台风
             start_reporttime = (datetime.datetime.strptime(start_reporttime, "%Y-%m-%d %H:%M:%S") + datetime.timedelta(days=-self.GFS_DELAY_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
             end_reporttime = (datetime.datetime.strptime(end_reporttime, "%Y-%m-%d %H:%M:%S") + datetime.timedelta(days=self.GFS_DELAY_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
-            gfs_query = {"newest_report_time": {'$gte': start_reporttime, "$lte": end_reporttime}}
-            # print(">>> gfs_query", gfs_query)
-            if self.mgo_db:
-                gfs_res = list(self.mgo_db["gfs_forecast_data"].find(gfs_query, {"reporttime": 0}))
-            else:
-                gfs_res = []
-            distance_calc_list = []
-            if gfs_res:
-                for gfs in gfs_res:
-                    gfs_id = gfs.get('_id')
-                    newest_report_time = gfs.get("newest_report_time")
-                    gfs_query = [
-                        {
-                            "$unwind": f"$reporttime.{newest_report_time}"
-                        },
-                        {"$sort": {f"reporttime.{newest_report_time}.forecast_time": 1}},
-                        {
-                            "$match": {
-                                f"_id": gfs_id
-                            }
-                        },
-                        {
-                            "$project": {
-                                "_id": 1,
-                                "stormid": 1,
-                                "basin": 1,
-                                f"reporttime.{newest_report_time}": 1
-                            }
-                        }
-                    ]
-                    if self.mgo_db:
-                        res = list(self.mgo_db["gfs_forecast_data"].aggregate(gfs_query))
-                    else:
-                        res = []
-                    if res:
-                        new_item = {}
-                        first_reporttime_item = res[0]['reporttime'][newest_report_time]
-                        new_item['_id'] = gfs_id
-                        new_item['stormid'] = first_reporttime_item['stormid']
-                        new_item['basin'] = first_reporttime_item['basin']
-                        diff = distance(ori_lon, ori_lat,first_reporttime_item['lon'], first_reporttime_item['lat'])
-                        new_item['diff'] = diff
-                        new_item['newest_report_time'] = newest_report_time
-                        new_item["embedded"] = res
-                        distance_calc_list.append(new_item)
-
-                if distance_calc_list:
-                    new_distance_calc_list = sorted(distance_calc_list, key=lambda x: x['diff'])
-                    # print(new_distance_calc_list[0])
-                    diff = new_distance_calc_list[0].get('diff')
-                    gfs_stormid = new_distance_calc_list[0].get('stormid')
-                    gfs_basin = new_distance_calc_list[0].get('basin')
-                    match_gfs_id = new_distance_calc_list[0].get('_id')
-
-                    if diff <= self.DEFAULT_MIN_FOR_DISTANCE:
-                        print(f"  >> {typhoon_id}:{realtimesource}:{stormid}:{stormname} -> choose_gfs {gfs_stormid}:{gfs_basin} -> short_diff {diff} -> {match_gfs_id}")
-                        self.update_gfs_id(realtimesource, typhoon_id, match_gfs_id)
+            targets.append({"typhoon_id": typhoon_id, "realtimesource": realtimesource, "stormid": stormid,
+                            "stormname": stormname, "lat": ori_lat, "lon": ori_lon,
+                            "start_reporttime": start_reporttime, "end_reporttime": end_reporttime})
+        if incremental:
+            targets, state = self.changed_targets(targets)
+        self.match_forecast(targets, self.DEFAULT_MIN_FOR_DISTANCE)
+        if incremental:
+            self.save_match_state(state)
     
     
     def query_history_typhoon(self):
@@ -245,29 +310,25 @@ class MatchTyphoonGfsForecast(BaseModel):
         wz_realtime_query = {"realtime_data.reporttime": {'$gte': self.start_time, "$lte": self.end_time}}
         gfs_res, wztfw_res = [], []
         if self.mgo_db:
-            gfs_res = self.mgo_db["gfs_realtime_data"].find(gfs_realtime_query)
-            wztfw_res = self.mgo_db["wztfw_data"].find(wz_realtime_query)
+            gfs_res = self.find_realtime("gfs_realtime_data", "datatime", gfs_realtime_query)
+            wztfw_res = self.find_realtime("wztfw_data", "realtime_data", wz_realtime_query)
 
         new_typhoon = []
-        new_gfs_res = list(copy.deepcopy(gfs_res))
+        matched_gfs = set()
 
         # 匹配温州台风源数据
         for wz in wztfw_res:
             stormname = wz.get("stormname")
             if stormname != "TD":
-                # 外循环gfs-去除GFS中与温州台风网相同的台风
-                for i in gfs_res:
-                    diff = distance(i['datatime'][0]['lat'], i['datatime'][0]['lon'],
-                                              wz['realtime_data'][0]['lat'], wz['realtime_data'][0]['lon'])
-                    if diff < self.DEFAULT_MIN_DUP_DISTANCE or i.get("stormname") == stormname:
-                        wz["stormid"] = i["stormid"]
-                        wz["year"] = i["year"]
-                        new_gfs_res.remove(i)
+                # 去除GFS中与温州台风网相同的台风
+                matched_gfs.update(self.match_wz_duplicates(wz, gfs_res))
                 wz["realtimesource"] = "中国"
                 new_typhoon.append(wz)
 
         # 匹配 gfs 实时数据
-        for g in new_gfs_res:
+        for idx, g in enumerate(gfs_res):
+            if idx in matched_gfs:
+                continue
             g["realtimesource"] = "gfs"
             new_typhoon.append(g)
         for i in new_typhoon:
@@ -276,42 +337,29 @@ class MatchTyphoonGfsForecast(BaseModel):
     
     def query_history_forecast_typhoon(self, typhoons):
         """查询历史的预测数据"""
+        targets = []
         for typhoon in typhoons:
             typhoon_id = typhoon.get("_id")
             realtimesource = typhoon.get("realtimesource", "gfs")  # 区分当前台风的来源
-            baseInfo = {}
             stormid = typhoon.get('stormid')
-            year = int(typhoon.get('year', 0))
-            if not year:
-                year = int(str(typhoon.get('stormid', ""))[:4])
             stormname = None
             
-            # 定位 历史最近的 起报时间 curr_report_time ！！！
-            curr_hour = int(self.date_time[11:13])
-            pre_hour = curr_hour//6 * 6
-            curr_report_time = self.date_time[:10]+f" {pre_hour:02d}:00:00"
-            
             if realtimesource == "中国":
-                if len(stormid) > 4:
-                    baseInfo['stormID'] = f"{stormid}"
-                else:
-                    baseInfo['stormID'] = f"{year}{stormid}"
                 stormname = typhoon.get('stormname')
                 datatime = typhoon.get('realtime_data')
                 if datatime:
                     start_reporttime = datatime[0]['reporttime']
                     end_reporttime = datatime[-1].get('reporttime')
                 else:
-                    start_reporttime = typhoon.get['begin_time']
+                    start_reporttime = typhoon.get('begin_time')
                     end_reporttime = typhoon.get('newest_report_time')
             else:
-                baseInfo['stormID'] = f"{year}{stormid}"
                 stormname = typhoon.get('stormname')
                 datatime = typhoon.get('datatime')
                 start_reporttime = typhoon.get('start_reporttime')
                 end_reporttime = typhoon.get('end_reporttime')
             
-            if datatime == []:
+            if not datatime:
                 continue
 
             # 获取当前的最新的点
@@ -321,45 +369,10 @@ class MatchTyphoonGfsForecast(BaseModel):
             # gfs 查询gfs符合时间段的所有的台风
             start_reporttime = (datetime.datetime.strptime(start_reporttime, "%Y-%m-%d %H:%M:%S") + datetime.timedelta(days=-self.GFS_DELAY_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
             end_reporttime = (datetime.datetime.strptime(end_reporttime, "%Y-%m-%d %H:%M:%S") + datetime.timedelta(days=+self.GFS_DELAY_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
-            gfs_query = {"newest_report_time": {'$gte': start_reporttime, "$lte": end_reporttime}}
-            
-            gfs_res = []
-            if self.mgo_db:
-                gfs_res = list(self.mgo_db["gfs_forecast_data"].find(gfs_query))
-            distance_calc_list = []
-            if gfs_res:
-                for gfs in gfs_res:
-                    newest_report_time = gfs.get('newest_report_time')
-                    reporttime = gfs.get("reporttime")
-                    gfs_id = gfs.get("_id")
-                    if reporttime:
-                        new_item = {}
-                        first_reporttime_item = reporttime[newest_report_time][0]
-                        new_item['_id'] = gfs_id
-                        new_item['stormid'] = first_reporttime_item['stormid']
-                        new_item['basin'] = first_reporttime_item['basin']
-                        diff = distance(ori_lon, ori_lat, first_reporttime_item['lon'], first_reporttime_item['lat'])
-                        new_item['diff'] = diff
-                        new_item['newest_report_time'] = newest_report_time
-                        # 获取所有的嵌入式文档中最符合的起报时间数据map
-                        for k,v in reporttime.items():
-                            if k > curr_report_time:
-                                new_item["embedded"] = v
-                                break
-                        if not new_item.get("embedded"):
-                            new_item["embedded"] = reporttime[newest_report_time]
-                        distance_calc_list.append(new_item)
-
-                if distance_calc_list:
-                    new_distance_calc_list = sorted(distance_calc_list, key=lambda x: x['diff'])
-                    diff = new_distance_calc_list[0].get('diff')
-                    gfs_stormid = new_distance_calc_list[0].get('stormid')
-                    gfs_basin = new_distance_calc_list[0].get('basin')
-                    match_gfs_id = new_distance_calc_list[0].get('_id')
-
-                    if diff <= self.DEFAULT_MIN_HIS_DISTANCE:
-                        print(f"  >> {typhoon_id}:{realtimesource}:{stormid}:{stormname} -> choose_gfs {gfs_stormid}:{gfs_basin} -> short_diff {diff} -> {match_gfs_id}")
-                        self.update_gfs_id(realtimesource, typhoon_id, match_gfs_id)
+            targets.append({"typhoon_id": typhoon_id, "realtimesource": realtimesource, "stormid": stormid,
+                            "stormname": stormname, "lat": ori_lat, "lon": ori_lon,
+                            "start_reporttime": start_reporttime, "end_reporttime": end_reporttime})
+        self.match_forecast(targets, self.DEFAULT_MIN_HIS_DISTANCE)
     
     @decorate.exception_capture_close_datebase
     def run(self):
@@ -369,7 +382,7 @@ class MatchTyphoonGfsForecast(BaseModel):
         self.date_time = now.strftime("%Y-%m-%d %H:%M:%S")
         print(f"> start_time={self.start_time}, end_time={self.end_time}, date_time={self.date_time}")
         typhoons = self.query_real_time_typhoon()
-        self.query_forecast_typhoon(typhoons)
+        self.query_forecast_typhoon(typhoons, incremental=self.MATCH_INCREMENTAL)
         
     @decorate.exception_capture_close_datebase
     def history(self):
@@ -1,18 +1,23 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import os
 import logging
 from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pymongo
-from pkg.util.spider import parse_url
+from pkg.util.spider import HostLimiter, ContentHashCache
 from pkg.util.format import time2time
 from pkg.public.models import BaseModel
 from pkg.public.decorator import decorate
 from lxml import etree
 from tasks.typhoon.subtasks.ssec_realtime_sync_mgo import SsecSyncMgo
+from tasks.typhoon.deps import diff_embedded_points, positional_set_ops
 
 month_abbr_list = [
     '', 'JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC'
 ]
+# 已有时刻需要覆盖的字段
+NOAA_UPDATE_FIELDS = ["lat", "lon", "minp", "maxsp"]
 
 
 class NoaaSyncMgo(BaseModel):
@@ -23,131 +28,134 @@ class NoaaSyncMgo(BaseModel):
                          ('year', pymongo.ASCENDING),
                          ('sea_area', pymongo.ASCENDING)
                          ],
-            "idx_dic": {'embedded_idx': [('datatime.reporttime', pymongo.ASCENDING)]}  # 建立嵌套时间的索引
+            "idx_dic": {'embedded_idx': [('datatime.reporttime', pymongo.ASCENDING)]},  # 建立嵌套时间的索引
+            "cache_rds": True,
         }
         super(NoaaSyncMgo, self).__init__(config)
         self.url_index = "https://www.ssd.noaa.gov/PS/TROP/adt.html"
+        # 同时抓取的台风数；每个域名的并发数与请求间隔见 HostLimiter（FETCH_PER_HOST / FETCH_HOST_INTERVAL）
+        self.fetch_workers = max(1, int(os.getenv('FETCH_WORKERS', 4)))
+        self.host_limiter = HostLimiter()
+        self.text_cache = ContentHashCache(self.cache_rds)
 
-    def handle_storm(self, item, Storm_url):
-        r = parse_url(Storm_url)
-        if r.status_code == 200:
-            rows = str(r.text).split('\n')
-            for line in rows[4:-1]:
-                item["Date"] = line[:10].strip()
-                item["Time"] = line[10:17].strip()
-                # logging.info(f'{item["Date"]}:{item["Time"]}')
-                # item["CI"] = line[17:22].strip()
-                item["minp"] = float(line[22:29].strip())   # MinP = MSLP
-                item["maxsp"] = float(line[29:35].strip())  # MaxSP = Vmax
-                # item["Fnl_Tno"] = line[35:40].strip()
-                # item["Adj_Raw"] = line[40:44].strip()
-                # item["Ini_Raw"] = line[44:48].strip()
-                # item["Limit"] = line[48:59].strip()
-                # item["Wkng_Flag"] = line[59:63].strip()
-                # item["Rpd_Wkng"] = line[63:68].strip()
-                # item["ET_Flag"] = line[68:73].strip()
-                # item["ST_Flag"] = line[73:78].strip()
-                # item["Cntr_Region"] = line[78:85].strip()
-                # item["Mean_Cloud"] = line[85:92].strip()
-                # item["Scene_Type"] = line[92:100].strip()
-                # item["EstRMW"] = line[100:107].strip()
-                # item["MW_Score"] = line[107:113].strip()
-                item["lat"] = float(line[113:121].strip())
-                item["lon"] = float(line[121:129].strip())*(-1)
-                # item["Fix_Mthd"] = line[129:136].strip()
-                # item["Sat"] = line[137:145].strip()
-                # item["VZA"] = line[145:151].strip()
-                # item["Comments"] = line[151:].strip()
-                Date = item['Date']
-                Date = Date[4:7]
-                reporttime_str = item['Date'][:4] + '{:02d}'.format(month_abbr_list.index(Date)) + item['Date'][7:] + item['Time']
-                item['reporttime'] = time2time(reporttime_str, "%Y%m%d%H%M%S", "%Y-%m-%d %H:%M:%S")
-                item.pop('Date', None)
-                item.pop('Time', None)
-                yield item
+    def handle_storm(self, item, text):
+        for line in str(text).split('\n')[4:-1]:
+            row = dict(item)
+            row["Date"] = line[:10].strip()
+            row["Time"] = line[10:17].strip()
+            # logging.info(f'{row["Date"]}:{row["Time"]}')
+            # row["CI"] = line[17:22].strip()
+            row["minp"] = float(line[22:29].strip())   # MinP = MSLP
+            row["maxsp"] = float(line[29:35].strip())  # MaxSP = Vmax
+            # row["Fnl_Tno"] = line[35:40].strip()
+            # row["Adj_Raw"] = line[40:44].strip()
+            # row["Ini_Raw"] = line[44:48].strip()
+            # row["Limit"] = line[48:59].strip()
+            # row["Wkng_Flag"] = line[59:63].strip()
+            # row["Rpd_Wkng"] = line[63:68].strip()
+            # row["ET_Flag"] = line[68:73].strip()
+            # row["ST_Flag"] = line[73:78].strip()
+            # row["Cntr_Region"] = line[78:85].strip()
+            # row["Mean_Cloud"] = line[85:92].strip()
+            # row["Scene_Type"] = line[92:100].strip()
+            # row["EstRMW"] = line[100:107].strip()
+            # row["MW_Score"] = line[107:113].strip()
+            row["lat"] = float(line[113:121].strip())
+            row["lon"] = float(line[121:129].strip())*(-1)
+            # row["Fix_Mthd"] = line[129:136].strip()
+            # row["Sat"] = line[137:145].strip()
+            # row["VZA"] = line[145:151].strip()
+            # row["Comments"] = line[151:].strip()
+            Date = row['Date']
+            Date = Date[4:7]
+            reporttime_str = row['Date'][:4] + '{:02d}'.format(month_abbr_list.index(Date)) + row['Date'][7:] + row['Time']
+            row['reporttime'] = time2time(reporttime_str, "%Y%m%d%H%M%S", "%Y-%m-%d %H:%M:%S")
+            row.pop('Date', None)
+            row.pop('Time', None)
+            yield row
+
+    @staticmethod
+    def _datatime_points(items):
+        points = []
+        for item in items:
+            datatime = deepcopy(item)
+            datatime.pop("sea_area", None)
+            datatime.pop("stormid", None)
+            datatime.pop("year", None)
+            points.append(datatime)
+        return points
 
-    def insert_noaa_datatime(self,id,item):
-        datatime = deepcopy(item)
-        aggregate_query = [{
-            "$unwind": "$datatime"
-        }, {
-            "$match": {
-                "_id": id,
-                "datatime.reporttime": item['reporttime'],
-            }
-        }, {
-            "$project": {
-                "datatime": 1
-            }
-        }]
-        res = list(self.mgo.mgo_coll.aggregate(aggregate_query))
-        if res:
-            # logging.info("已有该时刻实测数据，准备更新....")
-            r = self.mgo.mgo_coll.update_one(
-                {
-                    "_id": id,
-                    "datatime.reporttime": item['reporttime']
-                }, {
-                    "$set": {
-                        "end_reporttime": item['reporttime'],
-                        "lat": item['lat'],
-                        "lon": item['lon'],
-                        "datatime.$.lat": item.get('lat'),
-                        "datatime.$.lon": item.get('lon'),
-                        "datatime.$.minp": item.get('minp'),
-                        "datatime.$.maxsp": item.get('maxsp'),
-                    }
-                },
-                upsert=True)
+    def insert_noaa_datatime(self, id, items, existing=None):
+        """已有风暴文档的一批实测点：内存中按 reporttime 比较，变化的时刻一次 bulk_write 按位置更新，新时刻一次 $push $each"""
+        if existing is None:
+            existing = (self.mgo.mgo_coll.find_one({"_id": id}, {"datatime": 1}) or {}).get("datatime")
+        new_points, changed, _ = diff_embedded_points(existing, self._datatime_points(items), "reporttime", NOAA_UPDATE_FIELDS)
+        ops = positional_set_ops(id, "datatime", "reporttime", changed)
+        if ops:
+            self.mgo.mgo_coll.bulk_write(ops, ordered=False)
+        if ops or new_points:
+            # 顶层最新位置取本批最后一行（与逐条处理一致）
+            last = items[-1]
+            update = {"$set": {
+                "end_reporttime": last['reporttime'],
+                "lat": last['lat'],
+                "lon": last['lon'],
+                "year": last['year']
+            }}
+            if new_points:
+                update["$push"] = {"datatime": {"$each": new_points}}
+            r = self.mgo.mgo_coll.update_one({"_id": id}, update)
+            print(f"noaa realtime 更新 {len(ops)} 个时刻，嵌套新增 {len(new_points)} 个时刻", r.raw_result)
 
-        else:
-            datatime.pop("sea_area")
-            datatime.pop("stormid")
-            datatime.pop("year")
-            r = self.mgo.mgo_coll.update({
-                "_id": id,
-            }, {
-                "$set": {
-                    "end_reporttime": item['reporttime'],
-                    "lat": item['lat'],
-                    "lon": item['lon'],
-                    "year": item['year']
-                },
-                "$push": {
-                    "datatime": datatime
+    def save_noaa(self, items):
+        """按风暴文档 (stormid, year, sea_area) 分组，每个文档一次读取"""
+        groups = {}
+        for item in items:
+            item['year'] = str(item['reporttime'])[:4]
+            groups.setdefault((item['stormid'], item['year'], item['sea_area']), []).append(item)
+        for (stormid, year, sea_area), group in groups.items():
+            query = {"stormid": stormid, "year": year, "sea_area": sea_area}
+            tythoon = self.mgo.mgo_coll.find_one(query, {"_id": 1, "datatime": 1})
+            if not tythoon:
+                new_points, _, _ = diff_embedded_points([], self._datatime_points(group), "reporttime", NOAA_UPDATE_FIELDS)
+                last = group[-1]
+                data = {
+                    "stormid": stormid,
+                    "end_reporttime": last['reporttime'],
+                    "lat": last['lat'],
+                    "lon": last['lon'],
+                    "year": year,
+                    "sea_area": sea_area,
+                    "datatime": new_points,
                 }
-            })
-            print("noaa realtime 嵌套新增成功res", r)
+                self.mgo.set(None, data)
+            else:
+                self.insert_noaa_datatime(tythoon['_id'], group, tythoon.get('datatime'))
 
-    def save_noaa(self, item):
-        item['year'] =  str(item['reporttime'])[:4]
-        data = {
-            "stormid": item['stormid'],
-            "end_reporttime": item['reporttime'],
-            "lat": item['lat'],
-            "lon": item['lon'],
-            "year": item['year'],
-            "sea_area": item['sea_area'],
-        }
+    def sync_storm(self, storm):
+        """单个台风：NOAA 列表与 SSEC 列表、风圈（在线程池中执行，共用数据库连接与按域名限流）"""
+        stormid, sea_area, storm_url = storm
+        r = self.host_limiter.get(storm_url)
+        if r.status_code == 200:
+            digest = self.text_cache.check(storm_url, r.text)
+            if digest is None:
+                logging.info(f'Noaa {stormid} 内容未变化，跳过')
+            else:
+                self.save_noaa(list(self.handle_storm({"sea_area": sea_area, "stormid": stormid}, r.text)))
+                self.text_cache.commit(storm_url, digest)
+                logging.info(f'Noaa {stormid} 的数据导入成功！')
 
-        query = {"stormid": item['stormid'], "year": item['year'], "sea_area": item['sea_area']}
-        tythoon = self.mgo.mgo_coll.find_one(query, {"datatime": 0})
-        if not tythoon:
-            item.pop("sea_area")
-            item.pop("stormid")
-            item.pop("year")
-            data['datatime'] = [item]
-            self.mgo.set(None, data)
-        else:
-            id = tythoon.get('_id')
-            self.insert_noaa_datatime(id,item)
+        ## 查询 ssec 的数据
+        SsecSyncMgo(storm_id=stormid, sea_area=sea_area, mgo_client=self.mgo_client, mgo_db=self.mgo_db,
+                    host_limiter=self.host_limiter, text_cache=self.text_cache).run()
 
     @decorate.exception_capture_close_datebase
     def run(self):
-        r = parse_url(self.url_index)
+        r = self.host_limiter.get(self.url_index)
         if r.status_code == 200:
             html_xpath = etree.HTML(r.text)
             tables = html_xpath.xpath('//*[@class="padding5"]/table')
+            storms = []
             for table in tables[1:]:
                 ocean_names_list = table.xpath(".//tr[2]")[0]
                 storm_names = table.xpath(".//tr[3]/td")
@@ -156,19 +164,17 @@ class NoaaSyncMgo(BaseModel):
                     for i in a_list:
                         a_list = i.xpath('./a')
                         if a_list:
-                            item = {}
                             Storm_url= i.xpath("./a[1]/@href")[0]
                             sea_area = ocean_names_list[index].xpath('./div/text()')[0]
                             stormid = i.xpath("./a[1]/strong/text()")[0]
-                            # print(Storm_url)
                             # Storm_urls = ["http://www.ssd.noaa.gov/PS/TROP/DATA/2022/adt/text/06E-list.txt","http://www.ssd.noaa.gov/PS/TROP/DATA/2022/adt/text/05E-list.txt"]
-                            # stormid = Storm_url[-12:-9]
-                            # 查询 noaa 的数据
-                            for item in self.handle_storm(item,Storm_url):
-                                item['sea_area'] = sea_area
-                                item['stormid'] = stormid
-                                self.save_noaa(item) 
-                            logging.info(f'Noaa {stormid} 的数据导入成功！')
+                            storms.append((stormid, sea_area, Storm_url))
 
-                            ## 查询 ssec 的数据
-                            SsecSyncMgo(storm_id=stormid, sea_area=sea_area).run()
\ No newline at end of file
+            # 各台风并发抓取，每个域名的并发数与请求间隔由 host_limiter 控制
+            with ThreadPoolExecutor(max_workers=self.fetch_workers) as executor:
+                futures = {executor.submit(self.sync_storm, storm): storm for storm in storms}
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logging.error(f'Noaa {futures[future][0]} 同步失败: {e}')
@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import os, sys, logging
+import os, sys, io, logging
 from copy import deepcopy
 from pkg.util.format import time2time
 import pymongo
 import pandas as pd
 from pkg.db.mongo import get_mgo, MgoStore
-from pkg.util.spider import parse_url
+from pkg.util.spider import HostLimiter, ContentHashCache
+from tasks.typhoon.deps import diff_embedded_points, positional_set_ops
 from lxml import etree
 
 MGO_FIELD = [
@@ -15,19 +16,68 @@ MGO_FIELD = [
     "Mean_Cloud", "Scene_Type", "EstRMW", "MW_Score", "Lat", "Lon", "Fix_Mthd",
     "Sat", "VZA", "Comments"
 ]
+# 已有时刻需要覆盖的字段（实测列表不含风圈字段，会被置空，随后由风圈数据补齐，与逐条处理一致）
+SSEC_REALTIME_UPDATE_FIELDS = [
+    "r34_ne", "r34_se", "r34_sw", "r34_nw",
+    "r50_ne", "r50_se", "r50_sw", "r50_nw",
+    "r64_ne", "r64_se", "r64_sw", "r64_nw",
+    "speed", "direction", "rmw",
+]
+SSEC_ARCHER_UPDATE_FIELDS = ["lat", "lon", "maxsp", "eyewall_radius"]
 month_abbr_list = [
     '', 'JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT',
     'NOV', 'DEC'
 ]
+MONTH_NUM = {abbr: '{:02d}'.format(i) for i, abbr in enumerate(month_abbr_list) if abbr}
+# ADT 列表文件（-list.txt）用到的定宽列，左闭右开
+LISTING_COLSPECS = [
+    ("Date", (0, 10)), ("Time", (10, 17)),
+    ("minp", (21, 28)),    # MinP = MSLP
+    ("maxsp", (28, 34)),   # MaxSP = Vmax
+    ("lat", (112, 119)), ("lon", (119, 128)),
+]
+# 风圈文件（.2dwind.txt）用到的定宽列
+WIND_COLSPECS = [
+    ("Date", (0, 10)), ("Time", (10, 17)),
+    ("speed", (17, 23)), ("direction", (24, 28)), ("maxsp", (28, 34)), ("rmw", (35, 40)),
+    ("r34_ne", (44, 49)), ("r34_se", (50, 55)), ("r34_sw", (55, 60)), ("r34_nw", (60, 66)),
+    ("r50_ne", (67, 73)), ("r50_se", (74, 80)), ("r50_sw", (80, 86)), ("r50_nw", (86, 92)),
+    ("r64_ne", (92, 98)), ("r64_se", (98, 104)), ("r64_sw", (104, 110)), ("r64_nw", (110, 116)),
+]
+
+
+def read_adt_text(text, colspecs, head, tail):
+    """按列定义把整个定宽文本一次读成 DataFrame（去掉头 head 行、尾 tail 行，各列为去空白的字符串）"""
+    lines = str(text).split('\n')[head:-tail]
+    names = [name for name, _ in colspecs]
+    if not lines:
+        return pd.DataFrame(columns=names, dtype=str)
+    return pd.read_fwf(io.StringIO('\n'.join(lines)), colspecs=[spec for _, spec in colspecs], names=names,
+                       header=None, dtype=str, na_filter=False)
+
+
+def adt_reporttime(date, time):
+    """向量化生成 reporttime：Date 形如 2024JUL01，Time 形如 000000"""
+    ymd = date.str[:4] + date.str[4:7].map(MONTH_NUM) + date.str[7:]
+    return pd.to_datetime(ymd + time, format="%Y%m%d%H%M%S").dt.strftime("%Y-%m-%d %H:%M:%S")
+
 
 class SsecSyncMgo:
-    def __init__(self, storm_id="07P",sea_area="07P"):
+    def __init__(self, storm_id="07P",sea_area="07P", mgo_client=None, mgo_db=None, host_limiter=None, text_cache=None):
+        """
+        mgo_client/mgo_db 由调用方（NoaaSyncMgo 多线程抓取）传入时共用连接，close 不关闭；
+        host_limiter 按域名限流下载，text_cache 跳过内容未变的文本文件
+        """
         self.storm_id = storm_id
         self.sea_area = sea_area
+        self.host_limiter = host_limiter or HostLimiter()
+        self.text_cache = text_cache or ContentHashCache(None)
+        self._own_client = mgo_db is None
         self.listing_index = "https://tropic.ssec.wisc.edu/real-time/adt/{}-list.txt".format(self.storm_id)
         self.archer_index = "https://tropic.ssec.wisc.edu/real-time/adt/ARCHER/ARCHERinfo_{}.html".format(self.storm_id)
         self.real_time_wind_index = "https://tropic.ssec.wisc.edu/real-time/adt/{}.2dwind.txt".format(self.storm_id)
-        mgo_client, mgo_db = get_mgo()
+        if mgo_db is None:
+            mgo_client, mgo_db = get_mgo()
         real_time_config = {
             "mgo_client": mgo_client,
             "mgo_db": mgo_db,
@@ -50,209 +100,115 @@ class SsecSyncMgo:
         self.archer_mgo = MgoStore(archer_config)  # 初始化
         logging.info(self.real_time_wind_index)
 
+    def fetch_changed(self, url, force=False):
+        """下载文本文件，返回 (text, digest)；请求失败或内容与上次处理成功时相同（且未 force）时 text 为 None"""
+        r = self.host_limiter.get(url)
+        if r.status_code != 200:
+            return None, None
+        digest = self.text_cache.check(url, r.text, force=force)
+        if digest is None:
+            logging.info(f'ssec {self.storm_id} 内容未变化，跳过 {url}')
+            return None, None
+        return r.text, digest
+
     def handle_listing_storm(self, Storm_url):
-        r = parse_url(Storm_url)
-        if r.status_code == 200:
-            rows = str(r.text).split('\n')
-            for line in rows[5:-4]:
-                print("line",line)
-                item = {"stormid": self.storm_id, "sea_area": self.sea_area}
-                item["Date"] = line[:10].strip()
-                item["Time"] = line[10:17].strip()
-                # item["CI"] = line[16:21].strip()
-                item["minp"] = float(line[21:28].strip())   # MinP = MSLP
-                item["maxsp"] = float(line[28:34].strip())    # MaxSP = Vmax
-                # item["Fnl_Tno"] = line[33:38].strip()
-                # item["Adj_Raw"] = line[38:42].strip()
-                # item["Ini_Raw"] = line[42:46].strip()
-                # item["Limit"] = line[46:57].strip()
-                # item["Wkng_Flag"] = line[57:60].strip()
-                # item["Rpd_Wkng"] = line[62:67].strip()
-                # item["ET_Flag"] = line[67:72].strip()
-                # item["ST_Flag"] = line[72:75].strip()
-                # item["Cntr_Region"] = line[75:82].strip()
-                # item["Mean_Cloud"] = line[82:89].strip()
-                # item["Scene_Type"] = line[89:97].strip()
-                # item["EstRMW"] = line[99:106].strip()
-                # item["MW_Score"] = line[106:112].strip()
-                item["lat"] = float(line[112:119].strip())
-                # print(f"前-{line[119:128]}， 后-{float(line[119:128].strip())*(-1)}",)
-                lon_str = line[119:128].strip().split(" ")[-1]
-                item["lon"] = float(lon_str)*(-1)
-                # item["Fix_Mthd"] = line[128:136].strip()
-                # item["Sat"] = line[135:142].strip()
-                # item["VZA"] = line[142:150].strip()
-                # item["Comments"] = line[150:].strip()
-                Date = item['Date']
-                Date = Date[4:7]
-                reporttime_str = item['Date'][:4] + '{:02d}'.format(month_abbr_list.index(Date)) + item['Date'][7:] + item['Time']
-                item['reporttime'] = time2time(reporttime_str, "%Y%m%d%H%M%S", "%Y-%m-%d %H:%M:%S")
-                item.pop('Date')
-                item.pop('Time')
-                self.save_ssec_list_mgo(item)
-                
+        """返回是否处理了新内容"""
+        text, digest = self.fetch_changed(Storm_url)
+        if text is not None:
+            df = read_adt_text(text, LISTING_COLSPECS, 5, 4)
+            df = df.assign(
+                minp=df["minp"].astype(float),
+                maxsp=df["maxsp"].astype(float),
+                lat=df["lat"].astype(float),
+                # 经度列前面可能粘连其他字段，取最后一段
+                lon=df["lon"].str.split(" ").str[-1].astype(float) * (-1),
+                reporttime=adt_reporttime(df["Date"], df["Time"]),
+            )
+            base = {"stormid": self.storm_id, "sea_area": self.sea_area}
+            items = [dict(base, **row) for row in df[["minp", "maxsp", "lat", "lon", "reporttime"]].to_dict("records")]
+            self.save_ssec_list_mgo(items)
+            self.text_cache.commit(Storm_url, digest)
+            return True
+        return False
 
-    def save_ssec_list_mgo(self, item):
-        item['year'] =  str(item['reporttime'])[:4]
-        data = {
-            "stormid": item['stormid'],
-            "end_reporttime": item['reporttime'],
-            "lat": item['lat'],
-            "lon": item['lon'],
-            "year": item['year'],
-            "sea_area": item['sea_area'],
-        }
+    @staticmethod
+    def group_by_year(items):
+        """按风暴文档 (stormid, year, sea_area) 分组，保持行顺序"""
+        groups = {}
+        for item in items:
+            item['year'] = str(item['reporttime'])[:4]
+            groups.setdefault(item['year'], []).append(item)
+        return groups
 
-        query = {"stormid": item['stormid'], "year": item['year'], "sea_area": item['sea_area']}
-        tythoon = self.real_time_mgo.mgo_coll.find_one(query, {"datatime": 0})
-        if not tythoon:
-            item.pop("sea_area")
-            item.pop("stormid")
-            item.pop("year")
-            data['datatime'] = [item]
-            self.real_time_mgo.set(None, data)
-        else:
-            id = tythoon.get('_id')
-            self.insert_ssec_datatime(id,item)
+    def save_ssec_list_mgo(self, items):
+        self._save_ssec_items(self.real_time_mgo, items, SSEC_REALTIME_UPDATE_FIELDS, "ssec realtme")
 
-    def insert_ssec_datatime(self,id, item):
+    def _save_ssec_items(self, mgo, items, update_fields, label):
+        """每个风暴文档一次读取：不存在则整体写入，存在则交给 _merge_datatime"""
+        for year, year_items in self.group_by_year(items).items():
+            query = {"stormid": self.storm_id, "year": year, "sea_area": self.sea_area}
+            tythoon = mgo.mgo_coll.find_one(query, {"_id": 1, "datatime": 1})
+            if not tythoon:
+                new_points, _, last = diff_embedded_points([], [self._datatime_point(item) for item in year_items],
+                                                           "reporttime", update_fields)
+                data = {
+                    "stormid": self.storm_id,
+                    "end_reporttime": last['reporttime'],
+                    "lat": last['lat'],
+                    "lon": last['lon'],
+                    "year": year,
+                    "sea_area": self.sea_area,
+                    "datatime": new_points,
+                }
+                mgo.set(None, data)
+            else:
+                self._merge_datatime(mgo, tythoon['_id'], year_items, update_fields, label, tythoon.get('datatime'))
+
+    @staticmethod
+    def _datatime_point(item):
         datatime = deepcopy(item)
-        aggregate_query = [{
-            "$unwind": "$datatime"
-        }, {
-            "$match": {
-                "_id": id,
-                "datatime.reporttime": item['reporttime'],
-            }
-        }, {
-            "$project": {
-                "datatime": 1
-            }
-        }]
-        res = list(self.real_time_mgo.mgo_coll.aggregate(aggregate_query))
-        if res:
-            # logging.info("已有ssec该时刻实测数据，准备更新....")
-            r = self.real_time_mgo.mgo_coll.update_one(
-                {
-                    "_id": id,
-                    "datatime.reporttime": item['reporttime']
-                }, {
-                    "$set": {
-                        # "datatime.$.lat": item.get('lat'),
-                        # "datatime.$.lon": item.get('lon'),
-                        # "datatime.$.minp": item.get('minp'),
-                        # "datatime.$.maxsp": item.get('maxsp'),
-                        "datatime.$.r34_ne": item.get("r34_ne", None),
-                        "datatime.$.r34_se": item.get("r34_se", None),
-                        "datatime.$.r34_sw": item.get("r34_sw", None),
-                        "datatime.$.r34_nw": item.get("r34_nw", None),
-                        "datatime.$.r50_ne": item.get("r50_ne", None),
-                        "datatime.$.r50_se": item.get("r50_se", None),
-                        "datatime.$.r50_sw": item.get("r50_sw", None),
-                        "datatime.$.r50_nw": item.get("r50_nw", None),
-                        "datatime.$.r64_ne": item.get("r64_ne", None),
-                        "datatime.$.r64_se": item.get("r64_se", None),
-                        "datatime.$.r64_sw": item.get("r64_sw", None),
-                        "datatime.$.r64_nw": item.get("r64_nw", None),
-                        "datatime.$.speed": item.get('speed'),
-                        "datatime.$.direction": item.get('direction'),
-                        "datatime.$.rmw": item.get('rmw'),
-                    }
-                },
-                upsert=True)
+        datatime.pop("sea_area", None)
+        datatime.pop("stormid", None)
+        datatime.pop("year", None)
+        return datatime
 
-        else:
-            datatime.pop("sea_area")
-            datatime.pop("stormid")
-            datatime.pop("year")
-            r = self.real_time_mgo.mgo_coll.update({
+    def _merge_datatime(self, mgo, id, items, update_fields, label, existing=None):
+        """
+        已有风暴文档的一批实测点：库中已有的 datatime 在内存中按 reporttime 比较，
+        有变化的时刻一次 bulk_write 按位置更新，新时刻一次 $push $each
+        """
+        if existing is None:
+            existing = (mgo.mgo_coll.find_one({"_id": id}, {"datatime": 1}) or {}).get("datatime")
+        new_points, changed, last = diff_embedded_points(
+            existing, [self._datatime_point(item) for item in items], "reporttime", update_fields)
+        ops = positional_set_ops(id, "datatime", "reporttime", changed)
+        if ops:
+            r = mgo.mgo_coll.bulk_write(ops, ordered=False)
+            logging.info(f"{label} 更新 {r.modified_count}/{len(ops)} 个已有时刻")
+        if new_points:
+            r = mgo.mgo_coll.update_one({
                 "_id": id,
             }, {
                 "$set": {
-                    "end_reporttime": item['reporttime'],
-                    "lat": item['lat'],
-                    "lon": item['lon'],
-                    "year": item['year']
+                    "end_reporttime": last['reporttime'],
+                    "lat": last['lat'],
+                    "lon": last['lon'],
+                    "year": str(last['reporttime'])[:4]
                 },
                 "$push": {
-                    "datatime": datatime
+                    "datatime": {"$each": new_points}
                 }
             })
-            print("ssec realtme 嵌套新增成功res", r)
+            print(f"{label} 嵌套新增成功: {len(new_points)} 个时刻", r.raw_result)
 
+    def insert_ssec_datatime(self, id, items, existing=None):
+        self._merge_datatime(self.real_time_mgo, id, items, SSEC_REALTIME_UPDATE_FIELDS, "ssec realtme", existing)
 
-    def save_ssec_archer_mgo(self, item):
-        item['year'] =  str(item['reporttime'])[:4]
-        data = {
-            "stormid": item['stormid'],
-            "end_reporttime": item['reporttime'],
-            "lat": item['lat'],
-            "lon": item['lon'],
-            "year": item['year'],
-            "sea_area": item['sea_area'],
-        }
-
-        query = {"stormid": item['stormid'], "year": item['year'], "sea_area": item['sea_area']}
-        tythoon = self.archer_mgo.mgo_coll.find_one(query, {"datatime": 0})
-        if not tythoon:
-            item.pop("sea_area")
-            item.pop("stormid")
-            item.pop("year")
-            data['datatime'] = [item]
-            self.archer_mgo.set(None, data)
-        else:
-            id = tythoon.get('_id')
-            self.insert_ssec_archer_datatime(id,item)
+    def save_ssec_archer_mgo(self, items):
+        self._save_ssec_items(self.archer_mgo, items, SSEC_ARCHER_UPDATE_FIELDS, "ssec archer")
 
-    def insert_ssec_archer_datatime(self,id, item):
-        datatime = deepcopy(item)
-        aggregate_query = [{
-            "$unwind": "$datatime"
-        }, {
-            "$match": {
-                "_id": id,
-                "datatime.reporttime": item['reporttime'],
-            }
-        }, {
-            "$project": {
-                "datatime": 1
-            }
-        }]
-        res = list(self.archer_mgo.mgo_coll.aggregate(aggregate_query))
-        if res:
-            # logging.info("已有ssec该时刻实测数据，准备更新....")
-            r = self.archer_mgo.mgo_coll.update_one(
-                {
-                    "_id": id,
-                    "datatime.reporttime": item['reporttime']
-                }, {
-                    "$set": {
-                        "datatime.$.lat": item.get('lat'),
-                        "datatime.$.lon": item.get('lon'),
-                        "datatime.$.maxsp": item.get('maxsp'),
-                        "datatime.$.eyewall_radius": item.get('eyewall_radius')
-                    }
-                },
-                upsert=True)
-
-        else:
-            datatime.pop("sea_area")
-            datatime.pop("stormid")
-            datatime.pop("year")
-            r = self.archer_mgo.mgo_coll.update({
-                "_id": id,
-            }, {
-                "$set": {
-                    "end_reporttime": item['reporttime'],
-                    "lat": item['lat'],
-                    "lon": item['lon'],
-                    "year": item['year']
-                },
-                "$push": {
-                    "datatime": datatime
-                }
-            })
-            print("ssec archer 嵌套新增成功res", r)
+    def insert_ssec_archer_datatime(self, id, items, existing=None):
+        self._merge_datatime(self.archer_mgo, id, items, SSEC_ARCHER_UPDATE_FIELDS, "ssec archer", existing)
 
     def get_group1(self,item, data):
         group = str(data[2])
@@ -282,11 +238,12 @@ class SsecSyncMgo:
 
 
     def handle_archer_storm(self,Storm_url):
-        r = parse_url(Storm_url)
+        r = self.host_limiter.get(Storm_url)
         if r.status_code == 200:
             html_xpath = etree.HTML(r.text)
             pres = html_xpath.xpath('/html/body/center/table/tr[2]/td/font/pre//text()')
             new_pres = pres[3:]
+            items = []
             for index,i in enumerate(new_pres[::6][:-1]):
                 item = {"stormid":self.storm_id, "sea_area":self.sea_area}
                 data = []
@@ -301,63 +258,43 @@ class SsecSyncMgo:
                 item['eyewall_radius'] = data[3]
                 item = self.get_group1(item, data)
                 # item = self.get_group2(item, data)
-                self.save_ssec_archer_mgo(item)
+                items.append(item)
+            self.save_ssec_archer_mgo(items)
 
-    def handle_wind_storm(self,Storm_url):
-        r = parse_url(Storm_url)
-        if r.status_code == 200:
-            rows = str(r.text).split('\n')
-            for line in rows[2:-2]:
-                item = {"stormid": self.storm_id, "sea_area": self.sea_area}
-                item["Date"] = line[:10].strip()
-                item["Time"] = line[10:17].strip()
-                item["speed"] = round(float(line[17:23].strip()),0)
-                item["direction"] = round(float(line[24:28].strip()),0)
-                item["maxsp"] = float(line[28:34].strip())   # minp = mslp
-                item["rmw"] = float(line[35:40].strip())    # maxsp = vmax
-                item["r34_ne"] = float(line[44:49].strip())    # maxsp = vmax
-                item["r34_se"] = float(line[50:55].strip())    # maxsp = vmax
-                item["r34_sw"] = float(line[55:60].strip())    # maxsp = vmax
-                item["r34_nw"] = float(line[60:66].strip())    # maxsp = vmax
-                item["r50_ne"] = float(line[67:73].strip())    # maxsp = vmax
-                item["r50_se"] = float(line[74:80].strip())    # maxsp = vmax
-                item["r50_sw"] = float(line[80:86].strip())    # maxsp = vmax
-                item["r50_nw"] = float(line[86:92].strip())    # maxsp = vmax
-                item["r64_ne"] = float(line[92:98].strip())    # maxsp = vmax
-                item["r64_se"] = float(line[98:104].strip())    # maxsp = vmax
-                item["r64_sw"] = float(line[104:110].strip())    # maxsp = vmax
-                item["r64_nw"] = float(line[110:116].strip())    # maxsp = vmax
-                # item["lat"] = float(line[118:124].strip())    # maxsp = vmax
-                # item["lon"] = float(line[124:131].strip())*(-1)    # maxSP = Vmax
-                Date = item['Date']
-                Date = Date[4:7]
-                reporttime_str = item['Date'][:4] + '{:02d}'.format(month_abbr_list.index(Date)) + item['Date'][7:] + item['Time']
-                item['reporttime'] = time2time(reporttime_str, "%Y%m%d%H%M%S", "%Y-%m-%d %H:%M:%S")
-                item['year'] =  str(item['reporttime'])[:4]
-                
-                item.pop('Date')
-                item.pop('Time')
-                # logging.info(f'{item["reporttime"]}:{item["lon"]}-{item["lat"]}')
-                query = {"stormid": item['stormid'], "year": item['year'], "sea_area": item['sea_area']}
-                tythoon_id = self.real_time_mgo.mgo_coll.find_one(query, {"_id": 1})
-                if tythoon_id:
-                    self.insert_ssec_datatime(tythoon_id['_id'], item)
+    def handle_wind_storm(self,Storm_url, force=False):
+        """force：实测列表本次有更新时必须重新补充风圈字段（列表更新会把已有时刻的风圈字段置空）"""
+        text, digest = self.fetch_changed(Storm_url, force=force)
+        if text is not None:
+            df = read_adt_text(text, WIND_COLSPECS, 2, 2)
+            fields = [name for name, _ in WIND_COLSPECS[2:]]
+            df[fields] = df[fields].astype(float)
+            df[["speed", "direction"]] = df[["speed", "direction"]].round(0)
+            df["reporttime"] = adt_reporttime(df["Date"], df["Time"])
+            base = {"stormid": self.storm_id, "sea_area": self.sea_area}
+            items = [dict(base, **row) for row in df[fields + ["reporttime"]].to_dict("records")]
+            # 风圈数据只补充已有的风暴文档，每个文档一次读取
+            for year, year_items in self.group_by_year(items).items():
+                query = {"stormid": self.storm_id, "year": year, "sea_area": self.sea_area}
+                tythoon = self.real_time_mgo.mgo_coll.find_one(query, {"_id": 1, "datatime": 1})
+                if tythoon:
+                    self.insert_ssec_datatime(tythoon['_id'], year_items, tythoon.get('datatime'))
+            self.text_cache.commit(Storm_url, digest)
 
     def close(self):
-        self.real_time_mgo.close()
-        self.archer_mgo.close()
+        if self._own_client:
+            self.real_time_mgo.close()
 
     def run(self):
         # 爬取 ssec 的实时数据
         try:
-            self.handle_listing_storm(self.listing_index)
+            list_changed = self.handle_listing_storm(self.listing_index)
             logging.info(f'ssec {self.storm_id} - 实时数据列表 数据导入成功！') 
         except Exception as e:
             logging.error('run error {}'.format(e))
         else:
             # 爬取 ssec 的 风圈数据
             try:
-                self.handle_wind_storm(self.real_time_wind_index)
+                self.handle_wind_storm(self.real_time_wind_index, force=list_changed)
                 logging.info(f'ssec {self.storm_id} - 实时数据详情 数据导入成功！') 
             except Exception as e:
                 logging.error('ssec:handle_wind_storm error {}'.format(e))
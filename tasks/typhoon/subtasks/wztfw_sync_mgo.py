@@ -8,12 +8,20 @@ import requests
 import pandas as pd
 from pkg.public.models import BaseModel
 from tasks.typhoon.deps import HandleGFSTyphoon,WzTyphoon
-import subprocess
+from tasks.typhoon.backfill import BackfillRunner, FileLedger, list_dir_files
+from concurrent.futures import ThreadPoolExecutor
 from pkg.public.decorator import decorate
 from pkg.util.spider import parse_url
 INPUT_PATH = os.getenv('INPUT_PATH', "/Users/jiufangkeji/Documents/JiufangCodes/LS-handler-task/input/温州台风网")
 
 
+def parse_wz_file(file_path):
+    """解析一个时刻的台风列表文件（在进程池中执行，不连库）"""
+    with open(file_path, "r") as f:
+        json_data = json.load(f)
+    return [WzTyphoon(None, typhoon) for typhoon in json_data or []]
+
+
 class WZCurrSyncMgo(BaseModel):
     def __init__(self):
         config = {
@@ -34,38 +42,32 @@ class WZCurrSyncMgo(BaseModel):
             }
         super(WZCurrSyncMgo, self).__init__(config)
         self.HISTORY_YEAR = os.getenv('HISTORY_YEAR', "202207")  
+        # 回填时并行写库的台风数
+        self.write_workers = int(os.getenv('BACKFILL_WRITE_WORKERS', 4))
+
+    def write_typhoons(self, results):
+        """按 stormid 分区：同一台风的各个时刻按文件顺序在同一线程内依次入库，不同台风并行"""
+        partitions = {}
+        for typhoons in results:
+            for wz_typhoon in typhoons:
+                partitions.setdefault(wz_typhoon.stormid, []).append(wz_typhoon)
+
+        def sync_partition(typhoons):
+            for wz_typhoon in typhoons:
+                wz_typhoon.sync(self.mgo)
+
+        with ThreadPoolExecutor(max_workers=self.write_workers) as executor:
+            futures = [executor.submit(sync_partition, typhoons) for typhoons in partitions.values()]
+            for future in futures:
+                future.result()
 
     def history(self):
         try:
-            res = subprocess.getoutput(f"ls -a {INPUT_PATH} |grep {self.HISTORY_YEAR}")
-            list_gfs = res.split('\n')
-            list_gfs.sort(reverse=False)
-            print(list_gfs)
-            for dir in list_gfs:
-                logging.info(f"目前的目录是:{dir}")
-                files_list = os.listdir(f"{INPUT_PATH}/{dir}")
-                files_list.sort(reverse=False)
-                for file in files_list:
-                    file_path = f"{INPUT_PATH}/{dir}/{file}"
-                    logging.info(f"目前的文件是:{file_path}")
-                    try:
-                        with open(file_path, "r") as f:
-                            json_data = json.load(f)
-                    except Exception as e:
-                        logging.error(str(e))
-
-                    # 开始遍历改 时间点的 台风列表
-                    for typhoon in json_data:
-                        wz_typhoon = WzTyphoon(self.mgo, typhoon)
-                        res = wz_typhoon.query_wz_exist()
-                        if res:
-                            
-                            # 有的话，更新
-                            wz_typhoon.update_real_time_mgo(res.get('_id'))
-                            wz_typhoon.update_forecast_mgo(res.get('_id'))
-                        else:
-                            # 没有的话，增加
-                            wz_typhoon.save_mgo()
+            files = list_dir_files(INPUT_PATH, self.HISTORY_YEAR)
+            logging.info(f"匹配到的文件数:{len(files)}")
+            runner = BackfillRunner(parse_wz_file, self.write_typhoons,
+                                    ledger=FileLedger(self.mgo_db, "wztfw"))
+            runner.run(files)
 
         except Exception as e:
             logging.error('run error {}'.format(e))
@@ -85,14 +87,7 @@ class WZCurrSyncMgo(BaseModel):
             if json_data:
                 # 开始遍历改 时间点的 台风列表
                 for typhoon in json_data:
-                    wz_typhoon = WzTyphoon(self.mgo, typhoon)
-                    res = wz_typhoon.query_wz_exist()
-                    if res:
-                        # 有的话，更新
-                        wz_typhoon.update_real_time_mgo(res.get('_id'))
-                        wz_typhoon.update_forecast_mgo(res.get('_id'))
-                    else:
-                        # 没有的话，增加
-                        wz_typhoon.save_mgo()
+                    # 有的话更新，没有的话增加
+                    WzTyphoon(self.mgo, typhoon).sync()
         else:
             raise ValueError(f">> 请求失败, code:{res.status_code}")
\ No newline at end of file
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+台风文件到达即入库：监听输入目录，新增或内容有变化的文件按台账各处理一次
+"""
+import time
+import logging
+import traceback
+from pkg.util.file_watcher import FileWatcher
+from tasks.typhoon.backfill import FileLedger
+
+
+def watch_ingest(root, source, mgo_db, handle_file, match=None):
+    """
+    handle_file(path, record)：处理一个文件，record 为台账中该文件上次的记录（没有则为 None），
+    返回的 dict 会一并记入台账（如已处理的行数）；抛出异常时不记台账，文件再次变化或重启后重试
+    """
+    ledger = FileLedger(mgo_db, source)
+    watcher = FileWatcher(root, match=match)
+    for path in watcher.watch():
+        todo = ledger.pending([path])
+        if not todo:
+            continue
+        _, info = todo[0]
+        start = time.monotonic()
+        try:
+            extra = handle_file(path, ledger.get(path)) or {}
+        except Exception as e:
+            logging.error(f'入库失败 {path}: {e}')
+            logging.error(traceback.format_exc())
+            continue
+        ledger.mark_done([(path, dict(info, **extra))])
+        logging.info(f'{path} 入库完成，耗时 {time.monotonic() - start:.1f}s')